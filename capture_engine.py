@@ -0,0 +1,422 @@
+import itertools
+import multiprocessing
+import threading
+import time
+from multiprocessing import shared_memory
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+import serial
+
+from egram_frame import (ACTIVITY_CHANNELS, DEFAULT_CHANNELS, LEGACY_PACKET_SIZE, FrameTimebase,
+                         build_frame_request, decode_frames, decode_legacy_packet, frame_size, is_frame,
+                         negotiation_order)
+from egram_markers import frame_events
+from serial_io import SerialCommand
+
+# Samples per channel the ring holds before the oldest are overwritten (~4 minutes at 1 kHz)
+RING_CAPACITY = 1 << 18
+# Activity / sensor-rate samples get a ring of their own so they never compete with the egram
+ACTIVITY_RING_CAPACITY = 1 << 16
+# Pace/sense events are sparse; rows are (t, event code, unused)
+MARKER_RING_CAPACITY = 1 << 14
+
+# Header slots (int64) at the start of the segment
+HEAD = 0            # total samples ever written; the only field readers synchronize on
+CAPACITY = 1
+FRAMES = 2
+LOST_FRAMES = 3
+CORRUPT_FRAMES = 4
+STATE = 5
+DRIFT_PPB = 6       # clock drift in parts per billion
+WRITING = 7         # HEAD once the block being copied in is published; == HEAD between writes
+HEADER_SLOTS = 8
+
+# Values of the STATE slot
+STATE_STARTING = 0
+STATE_COMPACT = 1
+STATE_LEGACY = 2
+STATE_STOPPED = 3
+STATE_FAILED = 4
+
+# legacy echo replies hold one sample, poll them at the same rate as the in-process stream
+LEGACY_INTERVAL = 0.1
+
+
+class SampleRing:
+    """
+    Single-writer ring of (t, atrial, ventricular) samples in shared memory.
+    The activity ring uses the same layout for (t, activity, sensor rate) and
+    the marker ring for (t, event code, unused).
+
+    The writer fills the slots first and only then advances HEAD, so a reader
+    that sees HEAD = n can copy samples up to n without any lock. Before
+    copying a block in, the writer announces where HEAD will end up in
+    WRITING; samples more than `capacity` behind that may be overwritten
+    while a reader copies them, so read() checks WRITING afterwards and drops
+    those as an overrun instead of returning torn data.
+    """
+
+    def __init__(self, capacity: int = RING_CAPACITY, name: Optional[str] = None):
+        if name is None:
+            size = 8 * (HEADER_SLOTS + 3 * capacity)
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+            self.owner = True
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+        self.header = np.ndarray(HEADER_SLOTS, dtype=np.int64, buffer=self.shm.buf)
+        if self.owner:
+            self.header[:] = 0
+            self.header[CAPACITY] = capacity
+        self.capacity = int(self.header[CAPACITY])
+        self.data = np.ndarray((3, self.capacity), dtype=np.float64, buffer=self.shm.buf, offset=8 * HEADER_SLOTS)
+
+    @classmethod
+    def attach(cls, name: str) -> "SampleRing":
+        return cls(name=name)
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    @property
+    def head(self) -> int:
+        return int(self.header[HEAD])
+
+    def reset(self):
+        self.header[HEAD] = 0
+        self.header[FRAMES:HEADER_SLOTS] = 0
+
+    def write(self, times, atrial, ventricular):
+        """Writer side: copy a block in, then publish it by advancing HEAD"""
+        times = np.asarray(times, dtype=np.float64)
+        n = times.size
+        if n == 0:
+            return
+        head = int(self.header[HEAD])
+        if n > self.capacity:
+            # only the newest `capacity` fit; the rest still count, readers see them as lost
+            head += n - self.capacity
+            times, atrial, ventricular = times[-self.capacity:], atrial[-self.capacity:], ventricular[-self.capacity:]
+            n = self.capacity
+        # claim the slots before touching them, readers check this after copying
+        self.header[WRITING] = head + n
+        start = head % self.capacity
+        first = min(n, self.capacity - start)
+        for row, values in zip(self.data, (times, atrial, ventricular)):
+            row[start:start + first] = values[:first]
+            row[:n - first] = values[first:]
+        self.header[HEAD] = head + n
+
+    def read(self, cursor: int, max_samples: Optional[int] = None) -> Tuple[int, np.ndarray, int]:
+        """
+        Reader side: everything written since cursor
+
+        Returns:
+            (new cursor, (3, n) array of t/atrial/ventricular, samples lost to overrun)
+        """
+        head = self.head
+        start = max(cursor, head - self.capacity)
+        if max_samples is not None:
+            head = min(head, start + max_samples)
+        idx = np.arange(start, head) % self.capacity
+        block = self.data[:, idx]
+        # anything the writer lapped, or was lapping, while we copied is unreliable
+        safe = min(int(self.header[WRITING]) - self.capacity, head)
+        if safe > start:
+            block = block[:, safe - start:]
+            start = safe
+        return head, block, start - cursor
+
+    def stats(self) -> Dict[str, float]:
+        frames = int(self.header[FRAMES])
+        lost = int(self.header[LOST_FRAMES])
+        return {
+            "frames": frames,
+            "lost_frames": lost,
+            "corrupt_frames": int(self.header[CORRUPT_FRAMES]),
+            "loss_rate": lost / (frames + lost) if frames + lost else 0.0,
+            "drift_ppm": int(self.header[DRIFT_PPB]) / 1000.0,
+            "state": int(self.header[STATE]),
+        }
+
+    def close(self):
+        self.header = None
+        self.data = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+# ---------------------------------------------------------------------------
+# Capture process
+# ---------------------------------------------------------------------------
+
+def _transact(port: serial.Serial, payload: bytes, response_size: int, timeout: float) -> bytes:
+    waiting = port.in_waiting
+    if waiting:
+        port.read(waiting)
+    port.write(payload)
+    if response_size == 0:
+        return b""
+    port.timeout = timeout
+    return port.read(response_size)
+
+
+def _negotiate(port: serial.Serial, samples: int, channels: int, markers: int) -> Tuple[int, int]:
+    """(channels, marker slots) the device answers frame requests with, (0, 0) if it only knows the legacy echo"""
+    for count, slots in negotiation_order(channels, markers):
+        reply = _transact(port, build_frame_request(samples, count, slots), frame_size(samples, count, slots), 0.5)
+        if is_frame(reply, samples, count, slots):
+            return count, slots
+    return 0, 0
+
+
+def _capture_main(ring_name: str, activity_ring_name: str, marker_ring_name: str, port_name: str,
+                  baudrate: int, samples: int, channels: int, markers: int, echo_request: bytes,
+                  conn, stop_event):
+    """
+    Capture process entry point.
+
+    Owns the serial port for the whole capture: forwards commands from the GUI
+    process between stream polls, decodes replies and writes samples to the ring.
+    """
+    # The parent created the segments and unlinks them; attaching here only maps them
+    rings = [SampleRing.attach(name) for name in (ring_name, activity_ring_name, marker_ring_name)]
+    ring, activity_ring, marker_ring = rings
+    reason = "stopped"
+    try:
+        port = serial.Serial(port_name, baudrate, timeout=1)
+    except (serial.SerialException, OSError) as e:
+        ring.header[STATE] = STATE_FAILED
+        conn.send(("stopped", f"open failed: {e}"))
+        for r in rings:
+            r.close()
+        return
+
+    timebase = FrameTimebase()
+    start = time.monotonic()
+    try:
+        channels, markers = _negotiate(port, samples, channels, markers)
+        compact = channels > 0
+        ring.header[STATE] = STATE_COMPACT if compact else STATE_LEGACY
+        conn.send(("mode", "activity" if channels == ACTIVITY_CHANNELS else "compact" if compact else "legacy"))
+        if compact:
+            request = build_frame_request(samples, channels, markers)
+            reply_size, interval = frame_size(samples, channels, markers), 0.0
+        else:
+            request, reply_size, interval = echo_request, LEGACY_PACKET_SIZE, LEGACY_INTERVAL
+        reply = None
+
+        next_poll = time.monotonic()
+        while not stop_event.is_set():
+            # forwarded commands (parameter uploads, echoes) go ahead of the stream
+            while conn.poll():
+                command_id, payload, response_size, timeout = conn.recv()
+                response = _transact(port, payload, response_size, timeout)
+                error = None if len(response) >= response_size else \
+                    f"Timed out ({len(response)}/{response_size} bytes)"
+                conn.send(("reply", command_id, response, error))
+
+            now = time.monotonic()
+            if now < next_poll:
+                # wake early for a forwarded command
+                conn.poll(next_poll - now)
+                continue
+            if reply is None:
+                reply = _transact(port, request, reply_size, 1.0)
+            arrival = time.monotonic()
+            next_poll = arrival + interval
+
+            if compact:
+                block = decode_frames(reply, samples, channels, markers) if len(reply) == reply_size else None
+                if block is None or not block.valid[0]:
+                    ring.header[CORRUPT_FRAMES] += 1
+                else:
+                    times = timebase.place(block.seq[0], samples, block.period_us[0], arrival) - start
+                    ring.write(times, block.atrial, block.ventricular)
+                    if block.has_activity:
+                        activity_ring.write(times, block.activity, block.sensor_rate)
+                    if markers:
+                        event_times, codes = frame_events(block, times, samples)
+                        marker_ring.write(event_times, codes, np.zeros(codes.size))
+                    ring.header[FRAMES] = timebase.frames
+                    ring.header[LOST_FRAMES] = timebase.lost_frames
+                    ring.header[DRIFT_PPB] = int(timebase.drift_ppm * 1000)
+            else:
+                values = decode_legacy_packet(reply)
+                if values is not None:
+                    ring.write([arrival - start], [values[0]], [values[1]])
+            reply = None
+    except (serial.SerialException, OSError) as e:
+        reason = f"I/O error: {e}"
+    except (EOFError, BrokenPipeError):
+        # GUI process went away
+        reason = "GUI closed"
+    finally:
+        port.close()
+        ring.header[STATE] = STATE_STOPPED if reason == "stopped" else STATE_FAILED
+        try:
+            conn.send(("stopped", reason))
+        except (OSError, BrokenPipeError):
+            pass
+        for r in rings:
+            r.close()
+
+
+# ---------------------------------------------------------------------------
+# GUI-side handle
+# ---------------------------------------------------------------------------
+
+class CaptureEngine:
+    """
+    Runs egram capture in its own process so Tk/matplotlib work can't starve it.
+
+    While capturing, the child process owns the serial port; commands
+    submitted here are forwarded to it and served between stream polls.
+    Decoded samples arrive in `ring` (a SampleRing) for lock-free reading.
+    """
+
+    def __init__(self, capacity: int = RING_CAPACITY, activity_capacity: int = ACTIVITY_RING_CAPACITY,
+                 marker_capacity: int = MARKER_RING_CAPACITY):
+        self.ring = SampleRing(capacity)
+        self.activity_ring = SampleRing(activity_capacity)
+        self.marker_ring = SampleRing(marker_capacity)
+        self._ctx = multiprocessing.get_context("spawn")
+        self._process = None
+        self._conn = None
+        self._stop_event = None
+        self._listener = None
+        self._send_lock = threading.Lock()
+        self._pending: Dict[int, SerialCommand] = {}
+        self._ids = itertools.count()
+        self._on_stop = None
+        self.mode = None
+
+    @property
+    def running(self) -> bool:
+        return self._process is not None and self._process.is_alive()
+
+    def start(self, port: str, baudrate: int, samples: int, echo_request: bytes,
+              on_stop: Optional[Callable[[str], None]] = None, channels: int = DEFAULT_CHANNELS,
+              markers: int = 0) -> bool:
+        """Spawn the capture process; the caller must have released the port first"""
+        if self.running:
+            return False
+        self.ring.reset()
+        self.activity_ring.reset()
+        self.marker_ring.reset()
+        self.mode = None
+        self._on_stop = on_stop
+        parent_conn, child_conn = self._ctx.Pipe()
+        self._conn = parent_conn
+        self._stop_event = self._ctx.Event()
+        self._process = self._ctx.Process(
+            target=_capture_main, name="egram-capture", daemon=True,
+            args=(self.ring.name, self.activity_ring.name, self.marker_ring.name, port, baudrate, samples,
+                  channels, markers, bytes(echo_request), child_conn, self._stop_event))
+        self._process.start()
+        child_conn.close()
+        self._listener = threading.Thread(target=self._listen, name="egram-capture-listener", daemon=True)
+        self._listener.start()
+        return True
+
+    def stop(self, timeout: float = 2.0):
+        """Ask the capture process to finish and wait for it (and its stop report)"""
+        if self._process is None:
+            return
+        self._stop_event.set()
+        self._process.join(timeout)
+        if self._process.is_alive():
+            self._process.terminate()
+            self._process.join()
+        if self._listener is not None and self._listener is not threading.current_thread():
+            self._listener.join(timeout)
+
+    def close(self):
+        self.stop()
+        self.ring.close()
+        self.activity_ring.close()
+        self.marker_ring.close()
+
+    def submit(self, payload: bytes, response_size: int = 0, priority: int = 0,
+               timeout: float = 2.0) -> SerialCommand:
+        """Forward a command to the port owner; same contract as SerialWorker.submit"""
+        command = SerialCommand(payload, response_size, priority, timeout)
+        if not self.running:
+            command.finish(error="Capture engine not running")
+            return command
+        command_id = next(self._ids)
+        self._pending[command_id] = command
+        try:
+            with self._send_lock:
+                self._conn.send((command_id, bytes(payload), response_size, timeout))
+        except (OSError, BrokenPipeError) as e:
+            self._pending.pop(command_id, None)
+            command.finish(error=f"Capture engine unavailable: {e}")
+        return command
+
+    def _listen(self):
+        reason = "capture process exited"
+        while True:
+            try:
+                message = self._conn.recv()
+            except (EOFError, OSError):
+                break
+            if message[0] == "reply":
+                _, command_id, response, error = message
+                command = self._pending.pop(command_id, None)
+                if command is not None:
+                    command.finish(response, error)
+            elif message[0] == "mode":
+                self.mode = message[1]
+            elif message[0] == "stopped":
+                reason = message[1]
+                break
+
+        for command in self._pending.values():
+            command.finish(error=reason)
+        self._pending.clear()
+        self._process.join()
+        self._conn.close()
+        if self._on_stop is not None:
+            try:
+                self._on_stop(reason)
+            except Exception as e:
+                print(f"Capture stop callback error: {e}")
+
+
+class RingPump:
+    """
+    Reads new samples from a SampleRing on a short interval and hands them to
+    on_block(times, atrial, ventricular), starting at `cursor` (0 = everything
+    since the ring was reset). stop() does one last read so nothing the capture
+    process wrote before exiting is missed.
+    """
+
+    def __init__(self, ring: SampleRing, on_block: Callable, interval: float = 0.01, cursor: int = 0):
+        self.ring = ring
+        self.on_block = on_block
+        self.interval = interval
+        self.cursor = cursor
+        self.overruns = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="egram-ring-pump", daemon=True)
+        self._thread.start()
+
+    def _pump(self):
+        self.cursor, block, lost = self.ring.read(self.cursor)
+        self.overruns += lost
+        if block.shape[1]:
+            self.on_block(block[0], block[1], block[2])
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._pump()
+        self._pump()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not threading.current_thread():
+            self._thread.join()
@@ -0,0 +1,143 @@
+import json
+import os
+import struct
+import tempfile
+import threading
+import time
+from typing import Dict, Optional
+
+try:
+    from serial.tools import list_ports
+except ImportError:  # only needed for the USB serial number fallback
+    list_ports = None
+
+SYNC = 0x16
+FN_IDENTIFY = 0x33
+
+# Identify reply, little-endian:
+#   sync (u8) | fn (u8) | device uid (8 bytes) | firmware major, minor, patch (u8 each)
+#   | protocol version (u8) | checksum (u8) = sum of all previous bytes & 0xFF
+IDENTITY_FORMAT = "<BB8sBBBB"
+IDENTITY_REPLY_SIZE = struct.calcsize(IDENTITY_FORMAT) + 1
+# Firmware that predates the identify command never answers, don't hold up the connect for long
+IDENTIFY_TIMEOUT = 0.5
+
+DEVICE_CACHE_PATH = "data/devices.json"
+
+
+class DeviceIdentity:
+    """Which board is on the other end of the port"""
+
+    def __init__(self, device_id: str, firmware: str = "", protocol: int = 0):
+        self.device_id = device_id
+        self.firmware = firmware
+        self.protocol = protocol
+
+    def __repr__(self):
+        return f"DeviceIdentity({self.device_id!r}, firmware={self.firmware!r})"
+
+    def describe(self) -> str:
+        text = self.device_id
+        if self.firmware:
+            text += f", fw {self.firmware}"
+        return text
+
+
+def build_identify_request() -> bytes:
+    """18-byte request, same shape as the parameter/echo packets"""
+    request = bytearray(18)
+    request[0] = SYNC
+    request[1] = FN_IDENTIFY
+    return bytes(request)
+
+
+def parse_identity(reply: Optional[bytes]) -> Optional[DeviceIdentity]:
+    """DeviceIdentity from an identify reply, None if it isn't one"""
+    if reply is None or len(reply) != IDENTITY_REPLY_SIZE:
+        return None
+    if sum(reply[:-1]) & 0xFF != reply[-1]:
+        return None
+    sync, fn, uid, major, minor, patch, protocol = struct.unpack_from(IDENTITY_FORMAT, reply)
+    if sync != SYNC or fn != FN_IDENTIFY:
+        return None
+    return DeviceIdentity(uid.hex(), f"{major}.{minor}.{patch}", protocol)
+
+
+def usb_identity(port: str) -> Optional[DeviceIdentity]:
+    """Fallback for firmware without the identify command: the USB adapter's serial number"""
+    if list_ports is None:
+        return None
+    for info in list_ports.comports():
+        if info.device == port and info.serial_number:
+            return DeviceIdentity(f"usb:{info.serial_number}")
+    return None
+
+
+class CachedState:
+    """Last parameter echo confirmed by a device"""
+
+    def __init__(self, parameters: bytes, firmware: str, confirmed_at: float):
+        self.parameters = parameters
+        self.firmware = firmware
+        self.confirmed_at = confirmed_at
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.confirmed_at
+
+
+class DeviceCache:
+    """
+    Per-device parameter echoes that survive restarts.
+
+    Kept in one small JSON file next to the user database; every write goes
+    to a temporary file first so a crash can't leave it half written.
+    """
+
+    def __init__(self, path: str = DEVICE_CACHE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._devices: Optional[Dict[str, dict]] = None
+
+    def _load(self) -> Dict[str, dict]:
+        if self._devices is None:
+            try:
+                with open(self.path, "r") as f:
+                    self._devices = json.load(f)
+            except (OSError, ValueError):
+                self._devices = {}
+        return self._devices
+
+    def _save(self):
+        directory = os.path.dirname(self.path) or "."
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(self._devices, f, indent=4)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"Could not save device cache: {e}")
+
+    def get(self, device_id: str) -> Optional[CachedState]:
+        with self._lock:
+            entry = self._load().get(device_id)
+        if entry is None:
+            return None
+        return CachedState(bytes(entry["parameters"]), entry.get("firmware", ""), entry.get("confirmed_at", 0.0))
+
+    def confirm(self, identity: DeviceIdentity, parameters: bytes):
+        """Record parameters the device itself just echoed"""
+        with self._lock:
+            self._load()[identity.device_id] = {
+                "firmware": identity.firmware,
+                "protocol": identity.protocol,
+                "parameters": list(parameters),
+                "confirmed_at": time.time(),
+            }
+            self._save()
+
+    def forget(self, device_id: str):
+        with self._lock:
+            if self._load().pop(device_id, None) is not None:
+                self._save()
@@ -0,0 +1,272 @@
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from typing import Callable, Optional
+
+import numpy as np
+
+# Defaults for detection
+BEAT_REFRACTORY = 0.2      # s - ignore re-triggers inside this window
+SPIKE_SLOPE_FACTOR = 8.0   # spike if |dx| is this many MADs above typical slope
+SPIKE_MIN_GAP = 0.05       # s - edges closer than this belong to one spike
+CAPTURE_WINDOW = 0.3       # s - a paced beat must follow the spike within this window
+
+CHANNELS = ("atrial", "ventricular")
+
+
+# ---------------------------------------------------------------------------
+# Vectorized detection (runs inside the worker process)
+# ---------------------------------------------------------------------------
+
+def channel_stats(x: np.ndarray) -> dict:
+    """Summary statistics for one channel"""
+    if x.size == 0:
+        return {"min": 0.0, "max": 0.0, "mean": 0.0, "std": 0.0, "rms": 0.0}
+    return {
+        "min": float(x.min()),
+        "max": float(x.max()),
+        "mean": float(x.mean()),
+        "std": float(x.std()),
+        "rms": float(np.sqrt(np.mean(x * x))),
+    }
+
+
+def detect_beats(t: np.ndarray, x: np.ndarray, threshold: Optional[float] = None,
+                 refractory: float = BEAT_REFRACTORY) -> np.ndarray:
+    """
+    Find beat onsets as upward crossings of |x - baseline| over threshold
+
+    Args:
+        t: sample times (s)
+        x: channel samples
+        threshold: crossing level, defaults to half the peak deviation
+        refractory: minimum spacing between beats (s)
+
+    Returns:
+        np.ndarray: beat times
+    """
+    if x.size < 2:
+        return np.empty(0)
+    dev = np.abs(x - np.median(x))
+    if threshold is None:
+        threshold = 0.5 * float(dev.max())
+    if threshold <= 0:
+        return np.empty(0)
+
+    above = dev >= threshold
+    onsets = np.flatnonzero(above[1:] & ~above[:-1]) + 1
+    if above[0]:
+        onsets = np.concatenate(([0], onsets))
+    times = t[onsets]
+    if times.size < 2:
+        return times
+
+    # Greedy refractory pass; the number of onsets is small compared to samples
+    keep = [times[0]]
+    for bt in times[1:]:
+        if bt - keep[-1] >= refractory:
+            keep.append(bt)
+    return np.asarray(keep)
+
+
+def detect_pacing_spikes(t: np.ndarray, x: np.ndarray, factor: float = SPIKE_SLOPE_FACTOR) -> np.ndarray:
+    """Pacing artefacts show up as slopes far steeper than anything physiological"""
+    if x.size < 3:
+        return np.empty(0)
+    slope = np.abs(np.diff(x))
+    baseline = np.median(slope)
+    scale = np.median(np.abs(slope - baseline))
+    if scale == 0:
+        # flat baseline between spikes (typical when pacing) - fall back to the mean slope
+        scale = slope.mean()
+    if scale == 0:
+        return np.empty(0)
+    idx = np.flatnonzero(slope > baseline + factor * scale) + 1
+    if idx.size == 0:
+        return np.empty(0)
+    # collapse the leading and trailing edges of the same spike
+    times = t[idx]
+    return times[np.concatenate(([True], np.diff(times) > SPIKE_MIN_GAP))]
+
+
+def heart_rate(beat_times: np.ndarray) -> Optional[float]:
+    """Rate in bpm from the median beat interval"""
+    if beat_times.size < 2:
+        return None
+    intervals = np.diff(beat_times)
+    intervals = intervals[intervals > 0]
+    if intervals.size == 0:
+        return None
+    return float(60.0 / np.median(intervals))
+
+
+def capture_ratio(spikes: np.ndarray, beats: np.ndarray, window: float = CAPTURE_WINDOW) -> Optional[float]:
+    """Fraction of pacing spikes followed by a beat within window"""
+    if spikes.size == 0:
+        return None
+    if beats.size == 0:
+        return 0.0
+    # first beat at or after each spike
+    pos = np.searchsorted(beats, spikes, side="left")
+    valid = pos < beats.size
+    captured = np.zeros(spikes.size, dtype=bool)
+    captured[valid] = (beats[pos[valid]] - spikes[valid]) <= window
+    return float(captured.mean())
+
+
+def analyze_block(t: np.ndarray, channels: np.ndarray) -> dict:
+    """Run every detector over a block of samples, returns a compact result dict"""
+    result = {"start": float(t[0]) if t.size else 0.0,
+              "end": float(t[-1]) if t.size else 0.0,
+              "samples": int(t.size)}
+    for name, x in zip(CHANNELS, channels):
+        beats = detect_beats(t, x)
+        spikes = detect_pacing_spikes(t, x)
+        result[name] = {
+            "beats": beats.tolist(),
+            "rate": heart_rate(beats),
+            "spikes": spikes.tolist(),
+            "capture": capture_ratio(spikes, beats),
+            "stats": channel_stats(x),
+        }
+    return result
+
+
+def _analyze_shared(shm_name: str, n: int) -> dict:
+    """Worker entry point: attach to the shared block and analyze it in place"""
+    # Pool workers share the parent's resource tracker, so attaching here
+    # doesn't take ownership; the parent unlinks the segment in close()
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        block = np.ndarray((3, n), dtype=np.float64, buffer=shm.buf)
+        result = analyze_block(block[0], block[1:])
+        del block  # release the buffer before closing
+        return result
+    finally:
+        shm.close()
+
+
+# ---------------------------------------------------------------------------
+# GUI-side front end
+# ---------------------------------------------------------------------------
+
+class EgramAnalyzer:
+    """
+    Offloads analyze_block to a worker process.
+
+    Blocks are copied into shared memory (time, atrial, ventricular rows) so
+    only the segment name crosses the process boundary. submit() never blocks:
+    if a job is still running the block is held as "next", replacing any older
+    pending block, so the analysis always works on the most recent data.
+    """
+
+    def __init__(self, on_result: Callable[[dict], None], max_samples: int = 1 << 16):
+        self.on_result = on_result
+        self.max_samples = max_samples
+        self._pool = None
+        self._lock = threading.Lock()
+        self._busy = False
+        self._pending = None
+        # only one job is ever in flight, so a single segment is reused
+        self._segment = None
+        self._closed = False
+        self.dropped = 0
+
+    def start(self):
+        self._closed = False
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=1)
+
+    def close(self):
+        self._closed = True
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+        if self._segment is not None:
+            self._segment.close()
+            self._segment.unlink()
+            self._segment = None
+        self._busy = False
+        self._pending = None
+
+    def submit(self, t, atrial, ventricular) -> bool:
+        """Queue a block for analysis, returns False if it replaced an older pending block"""
+        block = (np.asarray(t, dtype=np.float64)[-self.max_samples:],
+                 np.asarray(atrial, dtype=np.float64)[-self.max_samples:],
+                 np.asarray(ventricular, dtype=np.float64)[-self.max_samples:])
+        with self._lock:
+            if self._busy:
+                replaced = self._pending is not None
+                if replaced:
+                    self.dropped += 1
+                self._pending = block
+                return not replaced
+            self._busy = True
+        self._dispatch(block)
+        return True
+
+    def _segment_for(self, n: int) -> shared_memory.SharedMemory:
+        size = 3 * n * 8
+        shm = self._segment
+        if shm is None or shm.size < size:
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+            # grow in powers of two so a slowly growing window doesn't reallocate every time
+            shm = shared_memory.SharedMemory(create=True, size=1 << max(size, 8).bit_length())
+            self._segment = shm
+        return shm
+
+    def _discard_pool(self):
+        """Drop a broken worker pool; the next dispatch starts a fresh one"""
+        pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _dispatch(self, block):
+        if self._closed:
+            return
+        try:
+            self.start()
+            n = min(len(block[0]), len(block[1]), len(block[2]))
+            shm = self._segment_for(n)
+            view = np.ndarray((3, n), dtype=np.float64, buffer=shm.buf)
+            for row, data in zip(view, block):
+                row[:] = data[-n:] if n else data[:0]
+            del view
+            future = self._pool.submit(_analyze_shared, shm.name, n)
+        except Exception as e:
+            # nothing is in flight, so nothing would ever clear _busy: give up on this block instead
+            print(f"Egram analysis could not start: {e}")
+            self._discard_pool()
+            with self._lock:
+                self._busy = False
+                self._pending = None
+            return
+        future.add_done_callback(self._done)
+
+    def _done(self, future):
+        if future.cancelled() or self._closed:
+            return
+        try:
+            result = future.result()
+        except BrokenProcessPool as e:
+            print(f"Egram analysis worker died: {e}")
+            self._discard_pool()
+            result = None
+        except Exception as e:
+            print(f"Egram analysis error: {e}")
+            result = None
+
+        with self._lock:
+            block, self._pending = self._pending, None
+            self._busy = block is not None
+        if block is not None:
+            self._dispatch(block)
+
+        if result is not None:
+            try:
+                self.on_result(result)
+            except Exception as e:
+                print(f"Egram analysis callback error: {e}")
@@ -0,0 +1,191 @@
+import os
+import shutil
+import tempfile
+import zlib
+from typing import Optional
+
+import numpy as np
+
+from egram_store import (ACTIVITY_CHANNELS, ARCHIVE_EXT, CHANNELS, INDEX_EXT, EgramHistory, EgramRecorder,
+                         _summarize, activity_path, index_dtype, new_capture_path)
+
+try:
+    import lzma
+except ImportError:  # some Python builds leave out lzma; zlib is always there
+    lzma = None
+
+ARCHIVE_INDEX_EXT = ".egzi"
+
+# Codec ids stored per chunk, so one archive can mix them
+RAW, ZLIB, LZMA = 0, 1, 2
+CODECS = {"raw": RAW, "zlib": ZLIB, "lzma": LZMA}
+# zlib level 1 compresses far faster than any live stream; lzma is for cold storage
+DEFAULT_CODEC = "zlib"
+DEFAULT_LEVEL = 1
+
+
+def archive_index_dtype(channels=CHANNELS) -> np.dtype:
+    """The capture index (with its min/max summaries) plus where each compressed chunk lives"""
+    return np.dtype(index_dtype(channels).descr + [
+        ("offset", "<u8"), ("length", "<u4"), ("samples", "<u4"), ("codec", "u1")])
+
+
+def archive_index_path(path: str) -> str:
+    return os.path.splitext(path)[0] + ARCHIVE_INDEX_EXT
+
+
+def encode_chunk(chunk: np.ndarray, codec: int = ZLIB, level: int = DEFAULT_LEVEL) -> bytes:
+    """
+    Lossless chunk encoding: each column's float64 bit patterns are delta
+    coded (as int64) and split into byte planes before compression.
+
+    Slowly changing samples differ only in their low mantissa bytes, so the
+    high planes come out almost all zero and compress to nearly nothing.
+    """
+    names = chunk.dtype.names
+    bits = np.stack([np.ascontiguousarray(chunk[name]).view("<i8") for name in names])
+    delta = np.diff(bits, axis=1, prepend=np.zeros((len(names), 1), dtype="<i8"))
+    planes = delta.view(np.uint8).reshape(len(names), chunk.size, 8).transpose(0, 2, 1).tobytes()
+    if codec == ZLIB:
+        return zlib.compress(planes, level)
+    if codec == LZMA:
+        return lzma.compress(planes, preset=level)
+    return planes
+
+
+def decode_chunk(payload: bytes, samples: int, codec: int, dtype: np.dtype) -> np.ndarray:
+    if codec == ZLIB:
+        payload = zlib.decompress(payload)
+    elif codec == LZMA:
+        if lzma is None:
+            raise ValueError("Archive chunk needs lzma, which this Python was built without")
+        payload = lzma.decompress(payload)
+    names = dtype.names
+    planes = np.frombuffer(payload, dtype=np.uint8).reshape(len(names), 8, samples)
+    delta = np.ascontiguousarray(planes.transpose(0, 2, 1)).view("<i8").reshape(len(names), samples)
+    # integer wrap-around in diff and cumsum cancels, so this is exact
+    bits = np.cumsum(delta, axis=1)
+    out = np.empty(samples, dtype=dtype)
+    for i, name in enumerate(names):
+        out[name] = bits[i].view("<f8")
+    return out
+
+
+class ArchiveWriter(EgramRecorder):
+    """
+    EgramRecorder that writes compressed chunks.
+
+    Chunking and the append()/extend()/close() interface are the recorder's;
+    compression happens on its background writer thread (zlib and lzma
+    release the GIL), so the producer only ever copies samples into a buffer.
+    """
+
+    def __init__(self, path: Optional[str] = None, channels=CHANNELS, codec: str = DEFAULT_CODEC,
+                 level: int = DEFAULT_LEVEL):
+        if codec not in CODECS:
+            raise ValueError(f"Unknown codec '{codec}'. Must be one of: {list(CODECS)}")
+        if codec == "lzma" and lzma is None:
+            print("lzma is not available, archiving with zlib instead")
+            codec = "zlib"
+        self.codec = CODECS[codec]
+        self.level = level
+        self.compressed = 0
+        super().__init__(path, channels)
+
+    def _new_path(self) -> str:
+        return os.path.splitext(new_capture_path())[0] + ARCHIVE_EXT
+
+    def _index_path(self, path: str) -> str:
+        return archive_index_path(path)
+
+    def _writer(self):
+        entry_dtype = archive_index_dtype(self.channels)
+        with self._data as data, self._index as index:
+            while True:
+                chunk = self._queue.get()
+                if chunk is None:
+                    return
+                payload = encode_chunk(chunk, self.codec, self.level)
+                entry = np.zeros(1, dtype=entry_dtype)
+                summary = _summarize(chunk, self.channels)
+                for name in summary.dtype.names:
+                    entry[name] = summary[name]
+                entry["offset"] = data.tell()
+                entry["length"] = len(payload)
+                entry["samples"] = chunk.size
+                entry["codec"] = self.codec
+                data.write(payload)
+                index.write(entry.tobytes())
+                # the index entry only goes out once its chunk is on disk
+                data.flush()
+                index.flush()
+                self.compressed += len(payload)
+
+
+class ArchiveHistory(EgramHistory):
+    """
+    EgramHistory over a compressed archive.
+
+    The index holds each chunk's offset, so any time range decompresses only
+    the chunks it overlaps; zoomed-out views still come from the min/max
+    summaries without decompressing anything.
+    """
+
+    def reload(self):
+        self.index_path = archive_index_path(self.path)
+        self.index_dtype = archive_index_dtype(self.channels)
+        self.index = np.fromfile(self.index_path, dtype=self.index_dtype) if os.path.exists(self.index_path) \
+            else np.empty(0, dtype=self.index_dtype)
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        # only trust entries whose chunk is completely on disk
+        complete = self.index["offset"] + self.index["length"] <= size
+        self.chunks = int(np.argmin(complete)) if not complete.all() else self.index.size
+        self.index = self.index[:self.chunks]
+        self.samples = int(self.index["samples"].sum())
+
+    def _read_chunk(self, i: int) -> np.ndarray:
+        entry = self.index[i]
+        with open(self.path, "rb") as f:
+            f.seek(int(entry["offset"]))
+            payload = f.read(int(entry["length"]))
+        return decode_chunk(payload, int(entry["samples"]), int(entry["codec"]), self.dtype)
+
+
+def archive_capture(path: str, codec: str = DEFAULT_CODEC, level: int = DEFAULT_LEVEL,
+                    remove: bool = False) -> str:
+    """
+    Compress a finished capture (and its activity sidecar, if any) chunk by chunk
+
+    Args:
+        path: .egr capture to archive
+        remove: delete the uncompressed capture once the archive is complete
+
+    Returns:
+        str: path of the archive
+    """
+    sources = [(path, CHANNELS)]
+    if os.path.exists(activity_path(path)):
+        sources.append((activity_path(path), ACTIVITY_CHANNELS))
+    for source, channels in sources:
+        target = os.path.splitext(source)[0] + ARCHIVE_EXT
+        # build the archive out of sight and move it into place whole, so an interrupted
+        # run never leaves a partial archive and a rerun replaces rather than appends
+        staging = tempfile.mkdtemp(prefix=".archiving-", dir=os.path.dirname(target) or ".")
+        history = EgramHistory(source, cache_chunks=1, channels=channels)
+        writer = ArchiveWriter(os.path.join(staging, os.path.basename(target)), channels, codec, level)
+        try:
+            try:
+                for i in range(history.chunks):
+                    chunk = history.chunk(i)
+                    writer.extend(chunk["t"], *(chunk[name] for name in channels))
+            finally:
+                history.close()
+                writer.close()
+            os.replace(writer.path, target)
+            os.replace(writer.index_path, archive_index_path(target))
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        if remove:
+            os.remove(source)
+            os.remove(os.path.splitext(source)[0] + INDEX_EXT)
+    return os.path.splitext(path)[0] + ARCHIVE_EXT
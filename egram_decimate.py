@@ -0,0 +1,202 @@
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+
+
+class GrowableArray:
+    """Append-only 1-D numpy buffer with amortized O(1) appends"""
+
+    def __init__(self, dtype=np.float64, capacity: int = 1024):
+        self._data = np.empty(capacity, dtype=dtype)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def extend(self, values):
+        values = np.asarray(values, dtype=self._data.dtype).ravel()
+        needed = self._size + values.size
+        if needed > self._data.size:
+            capacity = max(needed, 2 * self._data.size)
+            grown = np.empty(capacity, dtype=self._data.dtype)
+            grown[:self._size] = self._data[:self._size]
+            self._data = grown
+        self._data[self._size:needed] = values
+        self._size = needed
+
+    def clear(self):
+        self._size = 0
+
+    @property
+    def view(self) -> np.ndarray:
+        return self._data[:self._size]
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the values appended so far"""
+        return self._size * self._data.itemsize
+
+
+def minmax_columns(starts: np.ndarray, mins: np.ndarray, maxs: np.ndarray,
+                   edges: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Reduce (min, max) units into columns
+
+    Args:
+        starts: sample index where each unit begins (ascending)
+        mins, maxs: per-unit envelope
+        edges: column boundaries in sample index space (len = columns + 1)
+
+    Returns:
+        (column index, column min, column max) for every non-empty column
+    """
+    # units past the last edge would otherwise be folded into the last column
+    cutoff = np.searchsorted(starts, edges[-1], side="right")
+    mins, maxs = mins[:cutoff], maxs[:cutoff]
+    first = np.searchsorted(starts, edges[:-1], side="left")
+    last = np.searchsorted(starts, edges[1:], side="left")
+    last[-1] = cutoff
+    nonempty = last > first
+    if not nonempty.any():
+        return np.empty(0, dtype=int), np.empty(0), np.empty(0)
+    # Columns are contiguous, so each non-empty column ends where the next one
+    # starts and reduceat over just their offsets gives exact per-column results
+    offsets = first[nonempty]
+    col_min = np.minimum.reduceat(mins, offsets)
+    col_max = np.maximum.reduceat(maxs, offsets)
+    return np.flatnonzero(nonempty), col_min, col_max
+
+
+def interleave_envelope(x: np.ndarray, lo: np.ndarray, hi: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Turn per-column min/max into a single polyline (min, max at each x) for set_data"""
+    xs = np.repeat(x, 2)
+    ys = np.empty(xs.size)
+    ys[0::2] = lo
+    ys[1::2] = hi
+    return xs, ys
+
+
+class MinMaxPyramid:
+    """
+    Multi-resolution min/max envelope over an appendable sampled signal.
+
+    Level 0 is the raw samples. Level k holds the min and max of each block of
+    fanout**k samples. Levels are only built from complete blocks, so each append
+    costs amortized O(1). A query chooses the coarsest level that still gives at
+    least two blocks per pixel column. The few raw samples after the last
+    complete block are read from level 0. Query cost is O(columns) whatever the
+    recording length, and single-sample pacing spikes always reach the plot.
+
+    With `retain` set, samples more than that many seconds older than the
+    newest are dropped. Once the expired prefix outgrows what is kept, the
+    kept samples are copied into fresh buffers and the levels rebuilt from
+    them, so memory stays within about twice the horizon at amortized O(1)
+    per sample. Arrays handed out earlier are never overwritten.
+    """
+
+    def __init__(self, fanout: int = 4, levels: int = 10, retain: Optional[float] = None):
+        self.fanout = fanout
+        self.levels = levels
+        self.retain = retain
+        self.times = GrowableArray()
+        self.samples = GrowableArray()
+        self._mins = [GrowableArray() for _ in range(levels)]
+        self._maxs = [GrowableArray() for _ in range(levels)]
+
+    def __len__(self):
+        return len(self.samples)
+
+    def clear(self):
+        self.times.clear()
+        self.samples.clear()
+        for level in self._mins + self._maxs:
+            level.clear()
+
+    @property
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in [self.times, self.samples] + self._mins + self._maxs)
+
+    def extend(self, times: Sequence[float], values: Sequence[float]):
+        self.times.extend(times)
+        self.samples.extend(values)
+        if self.retain is not None:
+            self._expire()
+
+        below_min = below_max = self.samples.view
+        for mins, maxs in zip(self._mins, self._maxs):
+            done = len(mins)
+            complete = len(below_min) // self.fanout
+            if complete == done:
+                break
+            lo = below_min[done * self.fanout:complete * self.fanout].reshape(-1, self.fanout)
+            hi = below_max[done * self.fanout:complete * self.fanout].reshape(-1, self.fanout)
+            mins.extend(lo.min(axis=1))
+            maxs.extend(hi.max(axis=1))
+            below_min, below_max = mins.view, maxs.view
+
+    def _expire(self):
+        times = self.times.view
+        cut = int(np.searchsorted(times, times[-1] - self.retain, side="left"))
+        if cut == 0 or cut < times.size - cut:
+            return
+        kept_times, kept_samples = times[cut:], self.samples.view[cut:]
+        capacity = max(2 * kept_times.size, 1024)
+        self.times = GrowableArray(capacity=capacity)
+        self.samples = GrowableArray(capacity=capacity)
+        self.times.extend(kept_times)
+        self.samples.extend(kept_samples)
+        # levels are rebuilt by extend() from the kept samples
+        self._mins = [GrowableArray() for _ in range(self.levels)]
+        self._maxs = [GrowableArray() for _ in range(self.levels)]
+
+    def append(self, t: float, value: float):
+        self.extend((t,), (value,))
+
+    def envelope(self, t0: float, t1: float, columns: int, scale: float = 1.0) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Points to draw between t0 and t1 at roughly `columns` pixels wide
+
+        Returns raw samples when there are fewer than two per column, otherwise
+        an interleaved min/max polyline with one pair per non-empty column.
+        """
+        times = self.times.view
+        i0 = int(np.searchsorted(times, t0, side="left"))
+        i1 = int(np.searchsorted(times, t1, side="right"))
+        columns = max(int(columns), 1)
+        n = i1 - i0
+        if n <= 2 * columns:
+            return times[i0:i1], self.samples.view[i0:i1] * scale
+
+        # coarsest level with at least two blocks per column
+        per_column = n / columns
+        level = 0
+        while (level < len(self._mins) and self.fanout ** (level + 1) * 2 <= per_column
+               and len(self._mins[level]) > 0):
+            level += 1
+
+        if level == 0:
+            starts = np.arange(i0, i1)
+            mins = maxs = self.samples.view[i0:i1]
+        else:
+            block = self.fanout ** level
+            b0 = i0 // block
+            b1 = min(-(-i1 // block), len(self._mins[level - 1]))
+            covered = max(b1 * block, i0)
+            # the first block may begin before i0; count it from i0
+            starts = np.maximum(np.arange(b0, b1) * block, i0)
+            mins = self._mins[level - 1].view[b0:b1]
+            maxs = self._maxs[level - 1].view[b0:b1]
+            if covered < i1:
+                # samples after the last complete block come straight from level 0
+                tail = self.samples.view[covered:i1]
+                starts = np.concatenate((starts, np.arange(covered, i1)))
+                mins = np.concatenate((mins, tail))
+                maxs = np.concatenate((maxs, tail))
+
+        edges = np.linspace(i0, i1, columns + 1)
+        cols, lo, hi = minmax_columns(starts, mins, maxs, edges)
+        # place each column at the time of its first sample
+        col_idx = np.minimum(edges[cols].astype(int), len(times) - 1)
+        if scale < 0:
+            lo, hi = hi, lo
+        return interleave_envelope(times[col_idx], lo * scale, hi * scale)
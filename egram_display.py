@@ -0,0 +1,209 @@
+from typing import Optional, Tuple
+
+import numpy as np
+from matplotlib.collections import LineCollection, PolyCollection
+from matplotlib.figure import Figure
+
+from egram_decimate import MinMaxPyramid
+from egram_markers import (ATRIAL_CODES, ATRIAL_REFRACTORY_START, VENTRICULAR_CODES, VENTRICULAR_REFRACTORY_START,
+                           MarkerIndex, marker_segments, refractory_spans)
+
+# Seconds of samples the live display keeps (display window, analysis window and margin);
+# the whole session is only ever kept on disk by the recorder
+DISPLAY_HISTORY = 30.0
+# Seconds shown at once
+DISPLAY_WINDOW = 5.0
+# ARP / VRP in seconds, when the caller has no parameters to hand
+DEFAULT_REFRACTORY = (0.25, 0.25)
+
+
+class EgramDisplay:
+    """
+    The live egram figure, without any GUI toolkit.
+
+    Keeps the last DISPLAY_HISTORY seconds as min/max pyramids (raw and
+    high-pass), the activity / sensor rate pyramids and the pace/sense
+    markers, and lays out a Figure with atrial, ventricular and activity axes.
+    Every artist is created here once and only updated afterwards. EgramPage
+    shows the figure on a Tk canvas and the soak harness on Agg; each calls
+    update() and then draws its own canvas.
+    """
+
+    def __init__(self, window: float = DISPLAY_WINDOW, history: float = DISPLAY_HISTORY):
+        self.window = window
+        self.pyramids = {name: MinMaxPyramid(retain=history) for name in
+                         ("atrial", "ventricular", "atrial_filtered", "ventricular_filtered")}
+        self.activity_pyramids = {"activity": MinMaxPyramid(retain=history),
+                                  "sensor_rate": MinMaxPyramid(retain=history)}
+        self.marker_index = MarkerIndex(retain=history)
+        # last raw sample of each channel, for the high-pass filter across blocks
+        self._last = None
+
+        # Three subplots: atrial (top), ventricular, and a smaller activity / sensor rate strip
+        self.fig = Figure(figsize=(6, 6), dpi=100)
+        grid = self.fig.add_gridspec(3, 1, height_ratios=(2, 2, 1))
+        self.ax_atrial = self.fig.add_subplot(grid[0])
+        self.ax_vent = self.fig.add_subplot(grid[1])
+        self.ax_activity = self.fig.add_subplot(grid[2])
+        self.ax_rate = self.ax_activity.twinx()
+
+        # Labeling and grid
+        self.ax_atrial.set_title('Atrial Data', fontsize=10)
+        self.ax_atrial.set_ylabel('Amplitude', fontsize=8)
+        self.ax_vent.set_title('Ventricular Data', fontsize=10)
+        self.ax_vent.set_ylabel('Amplitude', fontsize=8)
+        for ax in (self.ax_atrial, self.ax_vent):
+            ax.set_ylim(-5, 5)
+            ax.set_xlim(0, window)
+            ax.grid(True, alpha=0.3)
+        self.ax_activity.set_xlabel('Time (s)', fontsize=8)
+        self.ax_activity.set_ylabel('Activity', fontsize=8)
+        self.ax_activity.grid(True, alpha=0.3)
+        self.ax_rate.set_ylabel('Sensor rate (ppm)', fontsize=8)
+        self.ax_rate.set_ylim(30, 180)
+
+        self.atrial_line, = self.ax_atrial.plot([], [], 'b-', linewidth=1, label='Atrial')
+        self.ventricular_line, = self.ax_vent.plot([], [], 'r-', linewidth=1, label='Ventricular')
+        self.activity_line, = self.ax_activity.plot([], [], 'g-', linewidth=1)
+        self.sensor_rate_line, = self.ax_rate.plot([], [], 'm-', linewidth=1.5)
+        # Detected beats overlaid as markers along the top of each plot
+        self.atrial_beats, = self.ax_atrial.plot([], [], 'kv', markersize=4)
+        self.ventricular_beats, = self.ax_vent.plot([], [], 'kv', markersize=4)
+
+        # Event markers: one collection per axis for the ticks and one for the refractory
+        # spans, whatever the number of events on screen
+        self.marker_artists = {}
+        for name, ax in (("atrial", self.ax_atrial), ("ventricular", self.ax_vent)):
+            spans = PolyCollection([], facecolors="0.85", edgecolors="none", alpha=0.5, zorder=0)
+            ticks = LineCollection([], linewidths=1.5, zorder=3)
+            ax.add_collection(spans)
+            ax.add_collection(ticks)
+            self.marker_artists[name] = (ticks, spans)
+
+        self.fig.tight_layout()
+
+    @property
+    def latest(self) -> Optional[float]:
+        times = self.pyramids["atrial"].times
+        return float(times.view[-1]) if len(times) else None
+
+    @property
+    def artists(self) -> int:
+        return sum(len(ax.get_children()) for ax in self.fig.axes)
+
+    @property
+    def retained_bytes(self) -> int:
+        pyramids = list(self.pyramids.values()) + list(self.activity_pyramids.values())
+        return sum(p.nbytes for p in pyramids) + self.marker_index.nbytes
+
+    # Data in
+    def add_data_block(self, times, atrial, ventricular):
+        times = np.asarray(times, dtype=float)
+        atrial = np.asarray(atrial, dtype=float)
+        ventricular = np.asarray(ventricular, dtype=float)
+        if times.size == 0:
+            return
+
+        # high pass is (x[i] - x[i-1]) / 2, the very first sample passes through unfiltered
+        if self._last is not None:
+            atrial_hp = np.diff(atrial, prepend=self._last[0]) / 2.0
+            ventricular_hp = np.diff(ventricular, prepend=self._last[1]) / 2.0
+        else:
+            atrial_hp = np.concatenate((atrial[:1], np.diff(atrial) / 2.0))
+            ventricular_hp = np.concatenate((ventricular[:1], np.diff(ventricular) / 2.0))
+        self._last = (atrial[-1], ventricular[-1])
+
+        self.pyramids["atrial"].extend(times, atrial)
+        self.pyramids["ventricular"].extend(times, ventricular)
+        self.pyramids["atrial_filtered"].extend(times, atrial_hp)
+        self.pyramids["ventricular_filtered"].extend(times, ventricular_hp)
+
+    def add_activity_block(self, times, activity, sensor_rate):
+        self.activity_pyramids["activity"].extend(times, activity)
+        self.activity_pyramids["sensor_rate"].extend(times, sensor_rate)
+
+    def add_marker_block(self, times, codes):
+        self.marker_index.extend(times, codes)
+
+    def recent(self, seconds: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Raw (times, atrial, ventricular) of the last `seconds`, as views into the pyramids"""
+        atrial, ventricular = self.pyramids["atrial"], self.pyramids["ventricular"]
+        latest = self.latest
+        if latest is None:
+            return atrial.times.view, atrial.samples.view, ventricular.samples.view
+        start = int(np.searchsorted(atrial.times.view, latest - seconds))
+        return atrial.times.view[start:], atrial.samples.view[start:], ventricular.samples.view[start:]
+
+    def clear(self):
+        for pyramid in list(self.pyramids.values()) + list(self.activity_pyramids.values()):
+            pyramid.clear()
+        self.marker_index.clear()
+        self._last = None
+        for ticks, spans in self.marker_artists.values():
+            ticks.set_segments([])
+            spans.set_verts([])
+        for line in (self.atrial_line, self.ventricular_line, self.activity_line, self.sensor_rate_line,
+                     self.atrial_beats, self.ventricular_beats):
+            line.set_data([], [])
+        self.ax_atrial.set_xlim(0, self.window)
+        self.ax_vent.set_xlim(0, self.window)
+
+    # Artists out
+    def update(self, gain: float = 1.0, filtered: bool = False, markers: bool = True,
+               refractory: Tuple[float, float] = DEFAULT_REFRACTORY) -> Optional[float]:
+        """
+        Point every artist at the last `window` seconds
+
+        Returns:
+            the newest sample time, or None if there is nothing to show yet
+        """
+        latest = self.latest
+        if latest is None:
+            return None
+        suffix = "_filtered" if filtered else ""
+        start = latest - self.window
+
+        # one min/max pair per pixel column, gain applied after decimation
+        columns = int(self.ax_atrial.bbox.width)
+        self.atrial_line.set_data(*self.pyramids["atrial" + suffix].envelope(start, latest, columns, gain))
+        self.ventricular_line.set_data(*self.pyramids["ventricular" + suffix].envelope(start, latest, columns, gain))
+        self.ax_atrial.set_xlim(start, latest)
+        self.ax_vent.set_xlim(start, latest)
+        self.update_activity(start, latest, columns)
+        self.update_markers(start, latest, markers, refractory)
+        return latest
+
+    # rebuild the marker collections for the visible window (a handful of numpy ops, no per-event artists)
+    def update_markers(self, start: float, end: float, show: bool = True,
+                       refractory: Tuple[float, float] = DEFAULT_REFRACTORY):
+        times, codes = self.marker_index.between(start, end)
+        if not show:
+            times, codes = times[:0], codes[:0]
+        lanes = (("atrial", self.ax_atrial, ATRIAL_CODES, ATRIAL_REFRACTORY_START, refractory[0]),
+                 ("ventricular", self.ax_vent, VENTRICULAR_CODES, VENTRICULAR_REFRACTORY_START, refractory[1]))
+        for name, ax, lane_codes, refractory_codes, period in lanes:
+            ticks, spans = self.marker_artists[name]
+            y0, y1 = ax.get_ylim()
+            segments, colours = marker_segments(times, codes, lane_codes, y0, y1)
+            ticks.set_segments(segments)
+            ticks.set_color(colours)
+            spans.set_verts(refractory_spans(times, codes, refractory_codes, period, y0, y1))
+
+    def update_activity(self, start: float, end: float, columns: int):
+        activity = self.activity_pyramids["activity"]
+        if len(activity) == 0:
+            return
+        xs, ys = activity.envelope(start, end, columns)
+        self.activity_line.set_data(xs, ys)
+        self.sensor_rate_line.set_data(*self.activity_pyramids["sensor_rate"].envelope(start, end, columns))
+        self.ax_activity.set_xlim(start, end)
+        if ys.size:
+            pad = max(1.0, 0.1 * float(ys.max() - ys.min()))
+            self.ax_activity.set_ylim(float(ys.min()) - pad, float(ys.max()) + pad)
+
+    def show_beats(self, result: dict):
+        """Detected beats from an EgramAnalyzer result, as ticks along the top of each trace"""
+        for name, line, ax in (("atrial", self.atrial_beats, self.ax_atrial),
+                               ("ventricular", self.ventricular_beats, self.ax_vent)):
+            beats = result[name]["beats"]
+            line.set_data(beats, [ax.get_ylim()[1] * 0.9] * len(beats))
@@ -0,0 +1,298 @@
+import struct
+from typing import Optional, Tuple
+
+import numpy as np
+
+SYNC = 0x16
+FN_EGRAM_FRAME = 0x47
+# Same frame followed by pace/sense event marker slots
+FN_EGRAM_FRAME_MARKERS = 0x49
+
+# Legacy reply: 16 bytes of parameter echo followed by two float64 samples
+LEGACY_PACKET_SIZE = 32
+
+# Compact frame, all little-endian:
+#   sync (u8) | fn (u8) | channels (u8) | samples per channel (u8)
+#   sequence (u16) | sample period in us (u16) | scale in mV per LSB (f32)
+#   samples: int16[samples][channels], interleaved
+#   markers (fn 0x49 only): [sample index (u8), event code (u8)] * slots, code 0 = empty slot
+#   checksum (u8) = sum of all previous bytes & 0xFF
+HEADER_FORMAT = "<BBBBHHf"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+DEFAULT_CHANNELS = 2
+DEFAULT_SAMPLES = 32
+
+# Rate-adaptive firmware can add two columns after atrial/ventricular:
+# raw activity (accelerometer counts) and the sensor-indicated rate (ppm).
+# Only the egram columns are multiplied by the frame's scale.
+EGRAM_CHANNELS = 2
+ACTIVITY_CHANNELS = 4
+
+# Marker slots per frame when event markers are requested (see egram_markers for the codes)
+MARKER_SLOTS = 4
+
+
+def frame_size(samples: int = DEFAULT_SAMPLES, channels: int = DEFAULT_CHANNELS, markers: int = 0) -> int:
+    return HEADER_SIZE + 2 * samples * channels + 2 * markers + 1
+
+
+def frame_dtype(samples: int = DEFAULT_SAMPLES, channels: int = DEFAULT_CHANNELS, markers: int = 0) -> np.dtype:
+    """Structured dtype for one frame, so a run of frames decodes with a single frombuffer"""
+    marker_field = [("markers", "u1", (markers, 2))] if markers else []
+    return np.dtype([
+        ("sync", "u1"),
+        ("fn", "u1"),
+        ("channels", "u1"),
+        ("samples", "u1"),
+        ("seq", "<u2"),
+        ("period_us", "<u2"),
+        ("scale", "<f4"),
+        ("data", "<i2", (samples, channels)),
+    ] + marker_field + [
+        ("checksum", "u1"),
+    ])
+
+
+def build_frame_request(samples: int = DEFAULT_SAMPLES, channels: int = DEFAULT_CHANNELS, markers: int = 0) -> bytes:
+    """18-byte request, same shape as the parameter/echo packets, asking for one compact frame"""
+    request = bytearray(18)
+    request[0] = SYNC
+    request[1] = FN_EGRAM_FRAME
+    request[2] = samples
+    # 0 keeps the request identical to what egram-only firmware expects
+    request[3] = channels if channels != DEFAULT_CHANNELS else 0
+    request[4] = markers
+    return bytes(request)
+
+
+def negotiation_order(channels: int = DEFAULT_CHANNELS, markers: int = 0):
+    """(channels, markers) formats to try, richest first, ending with plain egram frames"""
+    order = []
+    for option in ((channels, markers), (channels, 0), (DEFAULT_CHANNELS, markers), (DEFAULT_CHANNELS, 0)):
+        if option not in order:
+            order.append(option)
+    return order
+
+
+def encode_frame(seq: int, atrial, ventricular, period_us: int = 1000, scale: float = 0.001,
+                 activity=None, sensor_rate=None, markers=None, marker_slots: int = MARKER_SLOTS) -> bytes:
+    """Device-side encoder (used by simulators and tests of the decoder)"""
+    channels = ACTIVITY_CHANNELS if activity is not None else EGRAM_CHANNELS
+    data = np.empty((len(atrial), channels), dtype="<i2")
+    data[:, 0] = np.clip(np.round(np.asarray(atrial) / scale), -32768, 32767)
+    data[:, 1] = np.clip(np.round(np.asarray(ventricular) / scale), -32768, 32767)
+    if activity is not None:
+        data[:, 2] = np.clip(np.round(np.asarray(activity)), -32768, 32767)
+        data[:, 3] = np.clip(np.round(np.asarray(sensor_rate)), -32768, 32767)
+    fn = FN_EGRAM_FRAME if markers is None else FN_EGRAM_FRAME_MARKERS
+    body = struct.pack(HEADER_FORMAT, SYNC, fn, channels, len(atrial), seq & 0xFFFF, period_us, scale)
+    body += data.tobytes()
+    if markers is not None:
+        # markers: (sample index, code) pairs, at most marker_slots of them
+        slots = np.zeros((marker_slots, 2), dtype="u1")
+        for i, (index, code) in enumerate(list(markers)[:marker_slots]):
+            slots[i] = (index, code)
+        body += slots.tobytes()
+    return body + bytes([sum(body) & 0xFF])
+
+
+class FrameBlock:
+    """Decoded run of compact frames"""
+
+    def __init__(self, seq: np.ndarray, period_us: np.ndarray, samples: np.ndarray, valid: np.ndarray,
+                 markers: Optional[np.ndarray] = None):
+        self.seq = seq              # (frames,) sequence numbers
+        self.period_us = period_us  # (frames,) sample period
+        self.samples = samples      # (frames, samples, channels) in mV
+        self.valid = valid          # (frames,) checksum/header ok
+        self.markers = markers      # (frames, slots, 2) sample index / event code, or None
+
+    @property
+    def atrial(self) -> np.ndarray:
+        return self.samples[self.valid, :, 0].ravel()
+
+    @property
+    def ventricular(self) -> np.ndarray:
+        return self.samples[self.valid, :, 1].ravel()
+
+    @property
+    def has_activity(self) -> bool:
+        return self.samples.shape[2] >= ACTIVITY_CHANNELS
+
+    @property
+    def activity(self) -> np.ndarray:
+        return self.samples[self.valid, :, 2].ravel()
+
+    @property
+    def sensor_rate(self) -> np.ndarray:
+        return self.samples[self.valid, :, 3].ravel()
+
+
+def decode_frames(buf: bytes, samples: int = DEFAULT_SAMPLES, channels: int = DEFAULT_CHANNELS,
+                  markers: int = 0) -> FrameBlock:
+    """
+    Decode any whole number of back-to-back frames in one vectorized pass
+
+    Frames with a bad header or checksum are kept in the result but flagged
+    invalid so sequence gaps stay visible to the caller.
+    """
+    size = frame_size(samples, channels, markers)
+    count = len(buf) // size
+    raw = np.frombuffer(buf, dtype=np.uint8, count=count * size).reshape(count, size)
+    frames = raw.view(frame_dtype(samples, channels, markers)).reshape(count)
+
+    checksum_ok = (raw[:, :-1].sum(axis=1, dtype=np.uint32) & 0xFF) == frames["checksum"]
+    fn = FN_EGRAM_FRAME_MARKERS if markers else FN_EGRAM_FRAME
+    header_ok = ((frames["sync"] == SYNC) & (frames["fn"] == fn)
+                 & (frames["channels"] == channels) & (frames["samples"] == samples))
+    scaled = frames["data"].astype(np.float64)
+    scaled[:, :, :EGRAM_CHANNELS] *= frames["scale"].astype(np.float64)[:, None, None]
+    return FrameBlock(frames["seq"].copy(), frames["period_us"].copy(), scaled, checksum_ok & header_ok,
+                      frames["markers"].copy() if markers else None)
+
+
+def decode_legacy_packet(packet: bytes) -> Optional[Tuple[float, float]]:
+    """Legacy 32-byte echo reply -> (atrial, ventricular)"""
+    if len(packet) != LEGACY_PACKET_SIZE:
+        return None
+    return struct.unpack("<dd", packet[16:32])
+
+
+def is_frame(reply: Optional[bytes], samples: int = DEFAULT_SAMPLES, channels: int = DEFAULT_CHANNELS,
+             markers: int = 0) -> bool:
+    """Used when negotiating: did the device answer the frame request with a valid frame?"""
+    if not reply or len(reply) != frame_size(samples, channels, markers):
+        return False
+    return bool(decode_frames(reply, samples, channels, markers).valid[0])
+
+
+class FrameTimebase:
+    """
+    Rebuilds a uniform sample clock from frame sequence numbers.
+
+    Sample k of frame `seq` was taken at device time
+    (seq * samples + k) * period, whatever the host was doing when the frame
+    arrived. Host arrival times only pin that clock to the monotonic host
+    clock. The rate (drift) comes from how the lower envelope moves over the
+    whole capture.
+    The offset is the lower envelope of arrival minus device time, because
+    transport and scheduling delays only ever make frames late, never early.
+    Consecutive frames stay uniformly spaced and are slewed slowly toward that
+    estimate. Sequence jumps are counted as lost frames, and the time axis
+    leaves a hole the size of the missing samples.
+    """
+
+    # fraction of the estimate error corrected per frame
+    SLEW = 0.05
+    SETTLE_FRAMES = 32
+
+    def __init__(self, history: int = 256):
+        self.history = history
+        self._device = np.empty(history)
+        self._host = np.empty(history)
+        self._count = 0
+        self._last_seq = None
+        self._wraps = 0
+        self._first_seq = None
+        self._expected = None
+        self._last_sample = None
+        self._anchor = None
+        self.skew = 1.0
+        self.offset = None
+        self.frames = 0
+        self.lost_frames = 0
+        self.gaps = []          # (unwrapped seq where the gap started, frames lost), most recent last
+
+    def reset(self):
+        self.__init__(self.history)
+
+    @property
+    def loss_rate(self) -> float:
+        total = self.frames + self.lost_frames
+        return self.lost_frames / total if total else 0.0
+
+    @property
+    def drift_ppm(self) -> float:
+        return (self.skew - 1.0) * 1e6
+
+    def _unwrap(self, seq: int) -> int:
+        if self._last_seq is not None and seq < self._last_seq and self._last_seq - seq > 0x8000:
+            self._wraps += 1
+        self._last_seq = seq
+        return seq + (self._wraps << 16)
+
+    def _update_skew(self, device: np.ndarray, host: np.ndarray):
+        """
+        Drift from the lower envelope of each full window, measured against the
+        first window. The baseline keeps growing, so jitter matters less and less.
+        """
+        lowest = int(np.argmin(host - device))
+        anchor = (float(device[lowest]), float(host[lowest] - device[lowest]))
+        if self._anchor is None:
+            self._anchor = anchor
+            return
+        elapsed = anchor[0] - self._anchor[0]
+        if elapsed > 0:
+            self.skew = 1.0 + (anchor[1] - self._anchor[1]) / elapsed
+
+    def place(self, seq: int, samples: int, period_us: int, arrival: float) -> np.ndarray:
+        """
+        Host-clock times for every sample of one frame
+
+        Args:
+            seq: frame sequence number as received (16 bit)
+            samples: samples per channel in the frame
+            period_us: device sample period
+            arrival: time.monotonic() when the frame was fully received
+
+        Returns:
+            np.ndarray: sample times on the host monotonic clock
+        """
+        unwrapped = self._unwrap(int(seq))
+        if self._first_seq is None:
+            self._first_seq = self._expected = unwrapped
+        lost = unwrapped - self._expected
+        if lost > 0:
+            self.lost_frames += lost
+            self.gaps.append((self._expected, lost))
+            del self.gaps[:-100]
+        elif lost < 0:
+            # device restarted its counter - carry on from where the old count left off
+            self._first_seq = unwrapped - (self._expected - self._first_seq)
+            self._wraps = 0
+        self._expected = unwrapped + 1
+        self.frames += 1
+
+        period = period_us * 1e-6
+        # device time at the end of this frame (when it could first have been sent)
+        device_end = (unwrapped - self._first_seq + 1) * samples * period
+
+        i = self._count % self.history
+        self._device[i] = device_end
+        self._host[i] = arrival
+        self._count += 1
+        n = min(self._count, self.history)
+        # measure relative to this frame so a change in skew barely moves the offset
+        device = self._device[:n] - device_end
+        host = self._host[:n]
+
+        if self._count % self.history == 0:
+            self._update_skew(self._device[:n], host)
+        # lower envelope: earliest plausible arrival for this frame given the window
+        self.offset = float(np.min(host - device * self.skew))
+
+        step = period * self.skew
+        predicted = self.offset - (samples - 1) * step
+        if self._last_sample is None or lost < 0 or self._count <= self.SETTLE_FRAMES:
+            # no history yet, a restarted counter, or an estimate that is still settling
+            first = predicted
+        else:
+            # keep spacing uniform and slew gently toward the estimate instead of jumping
+            nominal = self._last_sample + (lost * samples + 1) * step
+            first = nominal + self.SLEW * (predicted - nominal)
+        if self._last_sample is not None:
+            # never step back in time: the pyramids, marker index and recorder need sorted times
+            first = max(first, self._last_sample + 0.5 * step)
+        self._last_sample = first + (samples - 1) * step
+        return first + np.arange(samples) * step
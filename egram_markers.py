@@ -0,0 +1,117 @@
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from egram_decimate import GrowableArray
+from egram_frame import FrameBlock
+
+# Event codes carried in compact frame marker slots (0 = empty slot)
+AS = 1   # atrial sense
+AP = 2   # atrial pace
+VS = 3   # ventricular sense
+VP = 4   # ventricular pace
+AR = 5   # atrial sense inside ARP (ignored by the timing logic)
+VR = 6   # ventricular sense inside VRP
+
+MARKER_LABELS = {AS: "AS", AP: "AP", VS: "VS", VP: "VP", AR: "AR", VR: "VR"}
+MARKER_COLOURS = {AS: "tab:blue", AP: "tab:orange", VS: "tab:green", VP: "tab:red",
+                  AR: "tab:gray", VR: "tab:gray"}
+ATRIAL_CODES = (AS, AP, AR)
+VENTRICULAR_CODES = (VS, VP, VR)
+# Events that start a refractory period
+ATRIAL_REFRACTORY_START = (AS, AP)
+VENTRICULAR_REFRACTORY_START = (VS, VP)
+
+
+def frame_events(block: FrameBlock, times: np.ndarray, samples: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Marker slots of the valid frames in block -> (event times, codes)
+
+    times are the sample times of the valid frames, as placed by FrameTimebase.
+    """
+    if block.markers is None:
+        return np.empty(0), np.empty(0, dtype=np.uint8)
+    slots = block.markers[block.valid]
+    index = slots[:, :, 0].astype(np.int64)
+    codes = slots[:, :, 1]
+    used = (codes > 0) & (index < samples)
+    position = np.arange(slots.shape[0])[:, None] * samples + index
+    return times[position[used]], codes[used]
+
+
+class MarkerIndex:
+    """
+    Time-ordered pace/sense events for a capture.
+
+    Events arrive in time order, so appends are O(1) and range queries are two
+    binary searches. With `retain` set, events more than that many seconds
+    older than the newest are dropped, as MinMaxPyramid drops samples.
+    """
+
+    def __init__(self, retain: Optional[float] = None):
+        self.retain = retain
+        self.times = GrowableArray()
+        self.codes = GrowableArray(dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.times)
+
+    @property
+    def nbytes(self) -> int:
+        return self.times.nbytes + self.codes.nbytes
+
+    def clear(self):
+        self.times.clear()
+        self.codes.clear()
+
+    def extend(self, times, codes):
+        self.times.extend(times)
+        self.codes.extend(codes)
+        if self.retain is not None and len(self.times):
+            self._expire()
+
+    def _expire(self):
+        times = self.times.view
+        cut = int(np.searchsorted(times, times[-1] - self.retain, side="left"))
+        if cut == 0 or cut < times.size - cut:
+            return
+        kept_times, kept_codes = times[cut:], self.codes.view[cut:]
+        capacity = max(2 * kept_times.size, 1024)
+        self.times = GrowableArray(capacity=capacity)
+        self.codes = GrowableArray(dtype=np.uint8, capacity=capacity)
+        self.times.extend(kept_times)
+        self.codes.extend(kept_codes)
+
+    def between(self, t0: float, t1: float) -> Tuple[np.ndarray, np.ndarray]:
+        times = self.times.view
+        i0 = int(np.searchsorted(times, t0, side="left"))
+        i1 = int(np.searchsorted(times, t1, side="right"))
+        return times[i0:i1], self.codes.view[i0:i1]
+
+    def counts(self, t0: float = -np.inf, t1: float = np.inf) -> Dict[str, int]:
+        _, codes = self.between(t0, t1)
+        found = np.bincount(codes, minlength=max(MARKER_LABELS) + 1)
+        return {label: int(found[code]) for code, label in MARKER_LABELS.items()}
+
+
+def marker_segments(times: np.ndarray, codes: np.ndarray, lane_codes, y0: float, y1: float):
+    """Vertical tick segments and colours for one lane, ready for LineCollection.set_segments"""
+    mask = np.isin(codes, lane_codes)
+    t = times[mask]
+    segments = np.empty((t.size, 2, 2))
+    segments[:, :, 0] = t[:, None]
+    segments[:, 0, 1] = y0
+    segments[:, 1, 1] = y1
+    colours = [MARKER_COLOURS[int(c)] for c in codes[mask]]
+    return segments, colours
+
+
+def refractory_spans(times: np.ndarray, codes: np.ndarray, start_codes, period: float, y0: float, y1: float):
+    """Rectangles covering each refractory period, ready for PolyCollection.set_verts"""
+    t = times[np.isin(codes, start_codes)]
+    verts = np.empty((t.size, 4, 2))
+    verts[:, 0] = np.column_stack((t, np.full(t.size, y0)))
+    verts[:, 1] = np.column_stack((t, np.full(t.size, y1)))
+    verts[:, 2] = np.column_stack((t + period, np.full(t.size, y1)))
+    verts[:, 3] = np.column_stack((t + period, np.full(t.size, y0)))
+    return verts
@@ -0,0 +1,189 @@
+import multiprocessing
+import time
+from typing import Dict, Optional
+
+import numpy as np
+
+from capture_engine import RING_CAPACITY, SampleRing
+from egram_decimate import MinMaxPyramid
+from pipeline import DROP_OLDEST, ConsumerThread, SampleBus
+
+try:
+    import pyqtgraph
+except ImportError:  # no Qt here; the egram page keeps drawing with Tk
+    pyqtgraph = None
+
+FRAME_INTERVAL_MS = 16        # ~60 fps
+DEFAULT_WINDOW = 5.0          # s on screen
+# bus -> viewer ring; the viewer only ever needs the newest samples
+VIEWER_QUEUE_BLOCKS = 256
+# How long the viewer may stay unresponsive before stop() gives up on it
+STOP_TIMEOUT = 2.0
+
+CHANNELS = (("atrial", "Atrial Data", "b"), ("ventricular", "Ventricular Data", "r"))
+
+
+def available() -> bool:
+    """True if pyqtgraph (and a Qt binding it can use) is installed"""
+    return pyqtgraph is not None
+
+
+def _high_pass(x: np.ndarray, previous: Optional[float]) -> np.ndarray:
+    """Same (x[i] - x[i-1]) / 2 filter as the Tk display; the very first sample passes through"""
+    if previous is None:
+        return np.concatenate((x[:1], np.diff(x) / 2.0))
+    return np.diff(x, prepend=previous) / 2.0
+
+
+def _viewer_main(ring_name: str, window: float, gain, filtered, fps, stop_event):
+    """
+    Viewer process entry point.
+
+    Reads the shared ring on a 16 ms Qt timer, extends its own min/max
+    pyramids and redraws both channels from one min/max pair per pixel
+    column, so the cost per frame doesn't grow with the sample rate.
+    """
+    import pyqtgraph as pg
+    from pyqtgraph.Qt import QtCore
+
+    ring = SampleRing.attach(ring_name)
+    app = pg.mkQApp("Egram")
+    pg.setConfigOptions(antialias=False, background="w", foreground="k")
+
+    view = pg.GraphicsLayoutWidget(title="Egram")
+    view.resize(900, 600)
+    plots, curves = {}, {}
+    for row, (name, title, colour) in enumerate(CHANNELS):
+        plot = view.addPlot(row=row, col=0, title=title)
+        plot.setLabel("left", "Amplitude")
+        plot.showGrid(x=True, y=True, alpha=0.3)
+        plot.setYRange(-5, 5)
+        plot.setMouseEnabled(x=False, y=True)
+        plots[name] = plot
+        curves[name] = plot.plot(pen=pg.mkPen(colour, width=1))
+    plots["ventricular"].setXLink(plots["atrial"])
+    plots["ventricular"].setLabel("bottom", "Time (s)")
+    view.show()
+
+    pyramids: Dict[str, MinMaxPyramid] = {}
+    state = {"cursor": 0, "last": {}, "frames": 0, "since": time.monotonic()}
+
+    def reset():
+        # only the window on screen is ever drawn; keep one more for slack
+        for name, _, _ in CHANNELS:
+            pyramids[name] = MinMaxPyramid(retain=2 * window)
+            pyramids[name + "_filtered"] = MinMaxPyramid(retain=2 * window)
+        state["last"] = {}
+
+    def tick():
+        if stop_event.is_set():
+            app.quit()
+            return
+        cursor, block, _ = ring.read(state["cursor"])
+        state["cursor"] = cursor
+        if block.shape[1]:
+            times = block[0]
+            atrial = pyramids["atrial"]
+            # a new capture starts its clock at zero again
+            if len(atrial) and times[0] < atrial.times.view[-1]:
+                reset()
+            for row, (name, _, _) in enumerate(CHANNELS, start=1):
+                values = block[row]
+                pyramids[name].extend(times, values)
+                pyramids[name + "_filtered"].extend(times, _high_pass(values, state["last"].get(name)))
+                state["last"][name] = float(values[-1])
+
+        if len(pyramids["atrial"]):
+            end = float(pyramids["atrial"].times.view[-1])
+            start = end - window
+            suffix = "_filtered" if filtered.value else ""
+            for name, _, _ in CHANNELS:
+                columns = max(int(plots[name].vb.width()), 1)
+                curves[name].setData(*pyramids[name + suffix].envelope(start, end, columns, gain.value))
+            plots["atrial"].setXRange(start, end, padding=0)
+
+        state["frames"] += 1
+        now = time.monotonic()
+        if now - state["since"] >= 1.0:
+            fps.value = state["frames"] / (now - state["since"])
+            state["frames"], state["since"] = 0, now
+
+    reset()
+    timer = QtCore.QTimer()
+    timer.timeout.connect(tick)
+    timer.start(FRAME_INTERVAL_MS)
+    try:
+        app.exec() if hasattr(app, "exec") else app.exec_()
+    finally:
+        timer.stop()
+        ring.close()
+
+
+class QtEgramViewer:
+    """
+    Optional pyqtgraph egram window, fed from the same SampleBus as the Tk display.
+
+    A bus subscriber copies every decoded block into a shared-memory
+    SampleRing (the capture engine's ring layout), and a separate process
+    owns the Qt event loop and draws from it. Qt never shares a process with
+    Tk, and a slow Qt frame can only cost this viewer its oldest blocks.
+    """
+
+    def __init__(self, bus: SampleBus, window: float = DEFAULT_WINDOW, capacity: int = RING_CAPACITY):
+        self.bus = bus
+        self.window = window
+        self.ring = SampleRing(capacity)
+        self._ctx = multiprocessing.get_context("spawn")
+        self._gain = self._ctx.Value("d", 1.0)
+        self._filtered = self._ctx.Value("b", 0)
+        self._fps = self._ctx.Value("d", 0.0)
+        self._stop_event = None
+        self._process = None
+        self._consumer = None
+
+    @property
+    def running(self) -> bool:
+        return self._process is not None and self._process.is_alive()
+
+    @property
+    def fps(self) -> float:
+        """Frames drawn per second over the last second"""
+        return self._fps.value if self.running else 0.0
+
+    def start(self) -> bool:
+        if not available():
+            print("pyqtgraph is not installed, the Qt egram viewer is unavailable")
+            return False
+        if self.running:
+            return True
+        self.ring.reset()
+        self._stop_event = self._ctx.Event()
+        self._process = self._ctx.Process(
+            target=_viewer_main, name="egram-qt-viewer", daemon=True,
+            args=(self.ring.name, self.window, self._gain, self._filtered, self._fps, self._stop_event))
+        self._process.start()
+        channel = self.bus.subscribe("qt viewer", VIEWER_QUEUE_BLOCKS, DROP_OLDEST)
+        self._consumer = ConsumerThread(channel, lambda block: self.ring.write(*block), name="egram-qt-feed")
+        return True
+
+    def set_display(self, gain: float, filtered: bool):
+        """Mirror the egram page's gain and high-pass settings"""
+        self._gain.value = gain
+        self._filtered.value = int(filtered)
+
+    def stop(self):
+        if self._consumer is not None:
+            self.bus.unsubscribe("qt viewer")
+            self._consumer.join()
+            self._consumer = None
+        if self._process is not None:
+            self._stop_event.set()
+            self._process.join(STOP_TIMEOUT)
+            if self._process.is_alive():
+                self._process.terminate()
+                self._process.join()
+            self._process = None
+
+    def close(self):
+        self.stop()
+        self.ring.close()
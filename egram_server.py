@@ -0,0 +1,380 @@
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import socket
+import stat
+import struct
+import tempfile
+import threading
+from typing import Iterator, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+from pipeline import DROP_OLDEST, BoundedChannel, ChannelClosed, ConsumerThread, SampleBus
+
+# A bare socket name is placed in the per-user runtime directory (see runtime_dir)
+DEFAULT_SOCKET = "pacemaker_egram.sock"
+DEFAULT_WS_PORT = 8765
+
+# Browser pages allowed to open the WebSocket; clients that send no Origin
+# (anything that is not a browser) still need the session token
+LOCAL_ORIGIN_HOSTS = ("localhost", "127.0.0.1", "::1")
+
+# Wire format for one block, shared by both transports:
+#   magic "EGRM" | sample count (u32) | t[n] | atrial[n] | ventricular[n]   (all float64 little-endian)
+# On the Unix socket each block is preceded by its length (u32); on the
+# WebSocket each block is one binary message.
+MAGIC = b"EGRM"
+BLOCK_HEADER = "<4sI"
+BLOCK_HEADER_SIZE = struct.calcsize(BLOCK_HEADER)
+
+# Blocks queued per client before its oldest are dropped
+CLIENT_QUEUE_BLOCKS = 256
+# Blocks queued between the bus and the serializer
+SERVER_QUEUE_BLOCKS = 256
+
+WS_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+def runtime_dir() -> str:
+    """
+    Private directory for the Unix socket: $XDG_RUNTIME_DIR if set, else a
+    pacemaker-<uid> directory in the temp dir, created 0700. Refuses a
+    directory another user owns or others can get into.
+    """
+    path = os.environ.get("XDG_RUNTIME_DIR")
+    if not path or not os.path.isdir(path):
+        path = os.path.join(tempfile.gettempdir(), f"pacemaker-{os.getuid()}")
+        try:
+            os.mkdir(path, 0o700)
+        except FileExistsError:
+            pass
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise OSError(f"{path} is not a private directory")
+    return path
+
+
+def _is_local_origin(origin: str) -> bool:
+    parts = urlsplit(origin)
+    return parts.scheme in ("http", "https") and parts.hostname in LOCAL_ORIGIN_HOSTS
+
+
+def encode_block(times, atrial, ventricular) -> bytes:
+    times = np.asarray(times, dtype="<f8")
+    body = np.concatenate((times, np.asarray(atrial, dtype="<f8"), np.asarray(ventricular, dtype="<f8")))
+    return struct.pack(BLOCK_HEADER, MAGIC, times.size) + body.tobytes()
+
+
+def decode_block(payload: bytes) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    magic, n = struct.unpack_from(BLOCK_HEADER, payload)
+    if magic != MAGIC:
+        raise ValueError("Not an egram block")
+    data = np.frombuffer(payload, dtype="<f8", count=3 * n, offset=BLOCK_HEADER_SIZE)
+    return data[:n], data[n:2 * n], data[2 * n:]
+
+
+def ws_frame(payload: bytes) -> bytes:
+    """Unmasked server->client binary frame"""
+    n = len(payload)
+    if n < 126:
+        header = struct.pack("!BB", 0x82, n)
+    elif n < 1 << 16:
+        header = struct.pack("!BBH", 0x82, 126, n)
+    else:
+        header = struct.pack("!BBQ", 0x82, 127, n)
+    return header + payload
+
+
+def _recv_exact(sock: socket.socket, size: int) -> Optional[bytes]:
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return bytes(data)
+
+
+def read_blocks(sock: socket.socket) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """Client helper for the Unix socket: yields (times, atrial, ventricular) until the server goes away"""
+    while True:
+        prefix = _recv_exact(sock, 4)
+        if prefix is None:
+            return
+        payload = _recv_exact(sock, struct.unpack("<I", prefix)[0])
+        if payload is None:
+            return
+        yield decode_block(payload)
+
+
+class _Client:
+    """One subscriber: its own bounded queue and sender thread, so a slow reader only hurts itself"""
+
+    def __init__(self, server, sock: socket.socket, kind: str, address: str):
+        self.server = server
+        self.sock = sock
+        self.kind = kind          # "unix" or "ws"
+        self.address = address
+        self.channel = BoundedChannel(f"client {address}", server.client_queue, DROP_OLDEST)
+        self._thread = threading.Thread(target=self._send_loop, name=f"egram-client-{address}", daemon=True)
+        self._thread.start()
+
+    def _send_loop(self):
+        try:
+            while True:
+                try:
+                    data = self.channel.get()
+                except ChannelClosed:
+                    break
+                self.sock.sendall(data)
+        except OSError:
+            pass
+        finally:
+            self.channel.close()
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.server._remove_client(self)
+
+    def close(self):
+        self.channel.close()
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+class EgramServer:
+    """
+    Fans live egram blocks from a SampleBus out to local clients.
+
+    Each block is serialized once per transport, whatever the number of
+    clients, and put on every client's own drop-oldest queue. A stalled
+    client loses its oldest blocks; capture and the other clients carry on.
+    Listens on a Unix socket and/or a localhost WebSocket port.
+
+    The socket sits in a private per-user directory and is made 0600. The
+    WebSocket only upgrades requests that carry this session's random token
+    (ws_url has it) and, if they come from a browser, a localhost Origin, so
+    an arbitrary web page cannot read the egram.
+    """
+
+    def __init__(self, bus: SampleBus, unix_path: Optional[str] = DEFAULT_SOCKET,
+                 ws_port: Optional[int] = None, host: str = "127.0.0.1",
+                 client_queue: int = CLIENT_QUEUE_BLOCKS):
+        self.bus = bus
+        # the ownership checks need a POSIX uid; elsewhere serve the WebSocket only
+        self.unix_path = unix_path if hasattr(socket, "AF_UNIX") and hasattr(os, "getuid") else None
+        self.ws_port = ws_port
+        self.host = host
+        self.client_queue = client_queue
+        self.token = secrets.token_urlsafe(16)
+        # (st_dev, st_ino) of the socket file we bound, the only one stop() removes
+        self._bound = None
+        self._clients: List[_Client] = []
+        self._lock = threading.Lock()
+        self._listeners: List[socket.socket] = []
+        self._accept_threads: List[threading.Thread] = []
+        self._consumer = None
+        self._running = False
+        self.blocks = 0
+
+    def start(self) -> bool:
+        if self._running:
+            return True
+        try:
+            if self.unix_path:
+                if not os.path.dirname(self.unix_path):
+                    self.unix_path = os.path.join(runtime_dir(), self.unix_path)
+                self._remove_stale_socket()
+                listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                listener.bind(self.unix_path)
+                os.chmod(self.unix_path, 0o600)
+                info = os.stat(self.unix_path)
+                self._bound = (info.st_dev, info.st_ino)
+                self._listen(listener, "unix")
+            if self.ws_port is not None:
+                listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                listener.bind((self.host, self.ws_port))
+                # port 0 picks a free port
+                self.ws_port = listener.getsockname()[1]
+                self._listen(listener, "ws")
+        except OSError as e:
+            print(f"Egram server failed to start: {e}")
+            self.stop()
+            return False
+
+        self._running = True
+        channel = self.bus.subscribe("server", SERVER_QUEUE_BLOCKS, DROP_OLDEST)
+        self._consumer = ConsumerThread(channel, self._fan_out, name="egram-server")
+        return True
+
+    def stop(self):
+        self._running = False
+        self.bus.unsubscribe("server")
+        if self._consumer is not None:
+            self._consumer.join(1.0)
+            self._consumer = None
+        listeners, self._listeners = self._listeners, []
+        for listener in listeners:
+            # close() alone leaves a thread blocked in accept() holding the socket open
+            try:
+                listener.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            try:
+                listener.close()
+            except OSError:
+                pass
+        for thread in self._accept_threads:
+            thread.join(1.0)
+        self._accept_threads = []
+        with self._lock:
+            clients = list(self._clients)
+        for client in clients:
+            client.close()
+        if self._bound is not None:
+            try:
+                info = os.lstat(self.unix_path)
+                if (info.st_dev, info.st_ino) == self._bound:
+                    os.unlink(self.unix_path)
+            except OSError:
+                pass
+            self._bound = None
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    @property
+    def ws_url(self) -> Optional[str]:
+        if self.ws_port is None:
+            return None
+        return f"ws://{self.host}:{self.ws_port}/?token={self.token}"
+
+    def _remove_stale_socket(self):
+        """Clear a socket left by a crashed run of ours; anything else at the path is an error"""
+        try:
+            info = os.lstat(self.unix_path)
+        except FileNotFoundError:
+            return
+        if not stat.S_ISSOCK(info.st_mode) or info.st_uid != os.getuid():
+            raise OSError(f"{self.unix_path} exists and is not our socket")
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.unix_path)
+        except ConnectionRefusedError:
+            os.unlink(self.unix_path)
+            return
+        finally:
+            probe.close()
+        raise OSError(f"{self.unix_path} is in use by another server")
+
+    def _authorized(self, request: bytes, headers: dict) -> bool:
+        try:
+            target = request.split(b"\r\n", 1)[0].split(b" ")[1].decode("ascii")
+        except (IndexError, UnicodeDecodeError):
+            return False
+        token = parse_qs(urlsplit(target).query).get("token", [""])[0]
+        if not hmac.compare_digest(token.encode(), self.token.encode()):
+            return False
+        origin = headers.get(b"origin")
+        return origin is None or _is_local_origin(origin.decode("latin-1"))
+
+    def _listen(self, listener: socket.socket, kind: str):
+        listener.listen()
+        self._listeners.append(listener)
+        thread = threading.Thread(target=self._accept_loop, args=(listener, kind),
+                                  name=f"egram-server-{kind}", daemon=True)
+        thread.start()
+        self._accept_threads.append(thread)
+
+    def _accept_loop(self, listener: socket.socket, kind: str):
+        while True:
+            try:
+                sock, address = listener.accept()
+            except OSError:
+                return
+            if listener not in self._listeners:
+                # accepted just as the server stopped
+                sock.close()
+                return
+            address = f"{kind}:{address or len(self._clients)}"
+            if kind == "ws":
+                # the handshake waits on the client, don't hold up other accepts
+                threading.Thread(target=self._ws_handshake, args=(sock, address), daemon=True).start()
+            else:
+                self._add_client(sock, kind, address)
+
+    def _ws_handshake(self, sock: socket.socket, address: str):
+        try:
+            sock.settimeout(5.0)
+            request = b""
+            while b"\r\n\r\n" not in request and len(request) < 8192:
+                chunk = sock.recv(1024)
+                if not chunk:
+                    raise OSError("closed during handshake")
+                request += chunk
+            headers = {}
+            for line in request.split(b"\r\n\r\n")[0].split(b"\r\n")[1:]:
+                name, _, value = line.partition(b":")
+                headers[name.strip().lower()] = value.strip()
+            key = headers.get(b"sec-websocket-key")
+            if key is None:
+                sock.sendall(b"HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\n\r\n")
+                raise OSError("not a WebSocket request")
+            if not self._authorized(request, headers):
+                sock.sendall(b"HTTP/1.1 403 Forbidden\r\nContent-Length: 0\r\n\r\n")
+                raise OSError("bad token or non-local origin")
+            accept = base64.b64encode(hashlib.sha1(key + WS_GUID).digest())
+            sock.sendall(b"HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\n"
+                         b"Connection: Upgrade\r\nSec-WebSocket-Accept: " + accept + b"\r\n\r\n")
+            sock.settimeout(None)
+        except OSError as e:
+            print(f"WebSocket handshake with {address} failed: {e}")
+            sock.close()
+            return
+        self._add_client(sock, "ws", address)
+
+    def _add_client(self, sock: socket.socket, kind: str, address: str):
+        client = _Client(self, sock, kind, address)
+        with self._lock:
+            self._clients.append(client)
+        print(f"Egram client connected: {address}")
+
+    def _remove_client(self, client: _Client):
+        with self._lock:
+            if client in self._clients:
+                self._clients.remove(client)
+                print(f"Egram client disconnected: {client.address}")
+
+    def _fan_out(self, block):
+        with self._lock:
+            clients = list(self._clients)
+        self.blocks += 1
+        if not clients:
+            return
+        payload = encode_block(*block)
+        # one serialization per transport, shared by every client on it
+        encoded = {}
+        if any(c.kind == "unix" for c in clients):
+            encoded["unix"] = struct.pack("<I", len(payload)) + payload
+        if any(c.kind == "ws" for c in clients):
+            encoded["ws"] = ws_frame(payload)
+        samples = len(block[0])
+        for client in clients:
+            try:
+                client.channel.put(encoded[client.kind], samples)
+            except ChannelClosed:
+                pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            clients = {c.address: c.channel.stats() for c in self._clients}
+        return {"blocks": self.blocks, "clients": clients}
@@ -0,0 +1,315 @@
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import numpy as np
+
+from egram_decimate import interleave_envelope, minmax_columns
+
+CAPTURE_DIR = "data/captures"
+CAPTURE_EXT = ".egr"
+INDEX_EXT = ".idx"
+# Compressed captures (see egram_archive)
+ARCHIVE_EXT = ".egz"
+
+CHANNELS = ("atrial", "ventricular")
+# Rate-adaptive captures also write "<name>_activity.egr" next to the egram file
+ACTIVITY_CHANNELS = ("activity", "sensor_rate")
+ACTIVITY_SUFFIX = "_activity"
+
+CHUNK_SAMPLES = 4096
+# Each chunk also gets a coarse min/max summary so zoomed-out views never touch sample data
+SUMMARY_BINS = 64
+
+
+def sample_dtype(channels=CHANNELS) -> np.dtype:
+    """One record per sample, one chunk = CHUNK_SAMPLES records"""
+    return np.dtype([("t", "<f8")] + [(name, "<f8") for name in channels])
+
+
+def index_dtype(channels=CHANNELS) -> np.dtype:
+    fields = [("t0", "<f8"), ("t1", "<f8")]
+    for name in channels:
+        fields += [(name + "_min", "<f4", SUMMARY_BINS), (name + "_max", "<f4", SUMMARY_BINS)]
+    return np.dtype(fields)
+
+
+SAMPLE_DTYPE = sample_dtype(CHANNELS)
+INDEX_DTYPE = index_dtype(CHANNELS)
+
+
+def new_capture_path(directory: str = CAPTURE_DIR, pattern: str = "egram_%Y%m%d_%H%M%S") -> str:
+    """A capture name (strftime pattern) that no capture or archive in directory already uses"""
+    os.makedirs(directory, exist_ok=True)
+    stem = os.path.join(directory, time.strftime(pattern))
+    # one-second names collide when recording is toggled quickly; number the later ones
+    base, n = stem, 1
+    while any(os.path.exists(base + ext) for ext in (CAPTURE_EXT, ARCHIVE_EXT)):
+        base, n = f"{stem}_{n}", n + 1
+    return base + CAPTURE_EXT
+
+
+def activity_path(path: str) -> str:
+    base, ext = os.path.splitext(path)
+    return base + ACTIVITY_SUFFIX + ext
+
+
+def list_captures(directory: str = CAPTURE_DIR):
+    if not os.path.isdir(directory):
+        return []
+    return sorted(f for f in os.listdir(directory)
+                  for ext in (CAPTURE_EXT, ARCHIVE_EXT)
+                  if f.endswith(ext) and not f.endswith(ACTIVITY_SUFFIX + ext))
+
+
+def open_capture(path: str, cache_chunks: int = 32, channels=CHANNELS) -> "EgramHistory":
+    """EgramHistory for a plain capture or a compressed archive, by extension"""
+    if path.endswith(ARCHIVE_EXT):
+        from egram_archive import ArchiveHistory
+        return ArchiveHistory(path, cache_chunks, channels)
+    return EgramHistory(path, cache_chunks, channels)
+
+
+def _summarize(chunk: np.ndarray, channels=CHANNELS) -> np.ndarray:
+    entry = np.zeros(1, dtype=index_dtype(channels))
+    entry["t0"] = chunk["t"][0]
+    entry["t1"] = chunk["t"][-1]
+    bins = np.array_split(np.arange(chunk.size), min(SUMMARY_BINS, chunk.size))
+    starts = np.array([b[0] for b in bins])
+    for name in channels:
+        lo = np.minimum.reduceat(chunk[name], starts)
+        hi = np.maximum.reduceat(chunk[name], starts)
+        # very short (final) chunks repeat their last bin so every entry has SUMMARY_BINS
+        entry[name + "_min"][0] = np.pad(lo, (0, SUMMARY_BINS - lo.size), mode="edge")
+        entry[name + "_max"][0] = np.pad(hi, (0, SUMMARY_BINS - hi.size), mode="edge")
+    return entry
+
+
+class EgramRecorder:
+    """
+    Append-only capture writer.
+
+    Samples are buffered into CHUNK_SAMPLES records and each full chunk is
+    written (with its index entry) by a background thread, so append() only
+    ever touches memory.
+    """
+
+    def __init__(self, path: Optional[str] = None, channels=CHANNELS):
+        # never append to an existing capture: its index offsets would no longer line up
+        while True:
+            self.path = path or self._new_path()
+            self.index_path = self._index_path(self.path)
+            try:
+                self._data, self._index = self._create()
+                break
+            except FileExistsError:
+                if path is not None:
+                    raise
+        self.channels = tuple(channels)
+        self.dtype = sample_dtype(self.channels)
+        self._buffer = np.empty(CHUNK_SAMPLES, dtype=self.dtype)
+        self._fill = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._writer, name="egram-recorder", daemon=True)
+        self._thread.start()
+        self.samples = 0
+
+    def append(self, t: float, *values: float):
+        self._buffer[self._fill] = (t,) + values
+        self._fill += 1
+        self.samples += 1
+        if self._fill == CHUNK_SAMPLES:
+            self._queue.put(self._buffer)
+            self._buffer = np.empty(CHUNK_SAMPLES, dtype=self.dtype)
+            self._fill = 0
+
+    def extend(self, times, *columns):
+        """Append a block of samples (one array per channel) without a per-sample Python loop"""
+        times = np.asarray(times)
+        columns = [np.asarray(c) for c in columns]
+        done = 0
+        while done < times.size:
+            take = min(CHUNK_SAMPLES - self._fill, times.size - done)
+            dest = self._buffer[self._fill:self._fill + take]
+            dest["t"] = times[done:done + take]
+            for name, values in zip(self.channels, columns):
+                dest[name] = values[done:done + take]
+            self._fill += take
+            self.samples += take
+            done += take
+            if self._fill == CHUNK_SAMPLES:
+                self._queue.put(self._buffer)
+                self._buffer = np.empty(CHUNK_SAMPLES, dtype=self.dtype)
+                self._fill = 0
+
+    def close(self):
+        """Flush the partial last chunk and wait for the writer to finish"""
+        if self._fill:
+            self._queue.put(self._buffer[:self._fill].copy())
+            self._fill = 0
+        self._queue.put(None)
+        self._thread.join()
+
+    def _new_path(self) -> str:
+        return new_capture_path()
+
+    def _index_path(self, path: str) -> str:
+        return os.path.splitext(path)[0] + INDEX_EXT
+
+    def _create(self):
+        data = open(self.path, "xb")
+        try:
+            index = open(self.index_path, "xb")
+        except OSError:
+            data.close()
+            os.remove(self.path)
+            raise
+        return data, index
+
+    def _writer(self):
+        with self._data as data, self._index as index:
+            while True:
+                chunk = self._queue.get()
+                if chunk is None:
+                    return
+                data.write(chunk.tobytes())
+                index.write(_summarize(chunk, self.channels).tobytes())
+                data.flush()
+                index.flush()
+
+
+class EgramHistory:
+    """
+    Random access over a recorded capture.
+
+    Only the chunk index (a few hundred bytes per chunk) is read up front;
+    sample chunks are read on demand into a small LRU cache, and neighbours of
+    the last requested range are prefetched on a background thread.
+    """
+
+    def __init__(self, path: str, cache_chunks: int = 32, channels=CHANNELS):
+        self.path = path
+        self.index_path = os.path.splitext(path)[0] + INDEX_EXT
+        self.channels = tuple(channels)
+        self.dtype = sample_dtype(self.channels)
+        self.index_dtype = index_dtype(self.channels)
+        self.cache_chunks = cache_chunks
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._prefetch = queue.Queue()
+        self._prefetcher = threading.Thread(target=self._prefetch_loop, name="egram-prefetch", daemon=True)
+        self._prefetcher.start()
+        self.reload()
+
+    def reload(self):
+        """Re-read the index (picks up chunks a live recorder has written since)"""
+        self.index = np.fromfile(self.index_path, dtype=self.index_dtype) if os.path.exists(self.index_path) \
+            else np.empty(0, dtype=self.index_dtype)
+        self.samples = os.path.getsize(self.path) // self.dtype.itemsize if os.path.exists(self.path) else 0
+        # index and data are flushed separately, only trust chunks that have both
+        self.chunks = min(self.index.size, -(-self.samples // CHUNK_SAMPLES))
+        self.index = self.index[:self.chunks]
+
+    def close(self):
+        self._prefetch.put(None)
+
+    @property
+    def start(self) -> float:
+        return float(self.index["t0"][0]) if self.chunks else 0.0
+
+    @property
+    def end(self) -> float:
+        return float(self.index["t1"][-1]) if self.chunks else 0.0
+
+    def _read_chunk(self, i: int) -> np.ndarray:
+        with open(self.path, "rb") as f:
+            f.seek(i * CHUNK_SAMPLES * self.dtype.itemsize)
+            return np.fromfile(f, dtype=self.dtype, count=CHUNK_SAMPLES)
+
+    def chunk(self, i: int) -> np.ndarray:
+        with self._lock:
+            cached = self._cache.get(i)
+            if cached is not None:
+                self._cache.move_to_end(i)
+                return cached
+        data = self._read_chunk(i)
+        with self._lock:
+            self._cache[i] = data
+            self._cache.move_to_end(i)
+            while len(self._cache) > self.cache_chunks:
+                self._cache.popitem(last=False)
+        return data
+
+    def _chunk_range(self, t0: float, t1: float) -> Tuple[int, int]:
+        first = max(int(np.searchsorted(self.index["t1"], t0, side="left")), 0)
+        last = min(int(np.searchsorted(self.index["t0"], t1, side="right")), self.chunks)
+        return first, last
+
+    def samples_between(self, t0: float, t1: float) -> np.ndarray:
+        """Raw records with t0 <= t <= t1"""
+        first, last = self._chunk_range(t0, t1)
+        if last <= first:
+            return np.empty(0, dtype=self.dtype)
+        data = np.concatenate([self.chunk(i) for i in range(first, last)])
+        lo = np.searchsorted(data["t"], t0, side="left")
+        hi = np.searchsorted(data["t"], t1, side="right")
+        self.request_prefetch(first - 1, last)
+        return data[lo:hi]
+
+    def request_prefetch(self, *chunks: int):
+        for i in chunks:
+            if 0 <= i < self.chunks:
+                self._prefetch.put(i)
+
+    def _prefetch_loop(self):
+        while True:
+            i = self._prefetch.get()
+            if i is None:
+                return
+            with self._lock:
+                if i in self._cache:
+                    continue
+            try:
+                self.chunk(i)
+            except OSError as e:
+                print(f"Prefetch error: {e}")
+
+    def view(self, t0: float, t1: float, columns: int) -> dict:
+        """
+        Plot-ready data for [t0, t1] at `columns` pixels wide
+
+        Returns:
+            dict: channel name -> (xs, ys)
+        """
+        first, last = self._chunk_range(t0, t1)
+        columns = max(int(columns), 1)
+        if last <= first:
+            return {name: (np.empty(0), np.empty(0)) for name in self.channels}
+
+        # Zoomed out far enough that summary bins are finer than pixels: use the index only
+        samples_in_view = (last - first) * CHUNK_SAMPLES
+        if samples_in_view / columns >= 2 * CHUNK_SAMPLES / SUMMARY_BINS:
+            entries = self.index[first:last]
+            # spread each chunk's bins evenly across its time span
+            frac = np.arange(SUMMARY_BINS) / SUMMARY_BINS
+            bin_t = (entries["t0"][:, None] + (entries["t1"] - entries["t0"])[:, None] * frac).ravel()
+            edges = np.linspace(t0, t1, columns + 1)
+            out = {}
+            for name in self.channels:
+                cols, lo, hi = minmax_columns(bin_t, entries[name + "_min"].ravel().astype(np.float64),
+                                              entries[name + "_max"].ravel().astype(np.float64), edges)
+                out[name] = interleave_envelope(edges[cols], lo, hi)
+            return out
+
+        data = self.samples_between(t0, t1)
+        if data.size <= 2 * columns:
+            return {name: (data["t"], data[name]) for name in self.channels}
+        edges = np.linspace(t0, t1, columns + 1)
+        out = {}
+        for name in self.channels:
+            cols, lo, hi = minmax_columns(data["t"], data[name], data[name], edges)
+            out[name] = interleave_envelope(edges[cols], lo, hi)
+        return out
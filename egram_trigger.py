@@ -0,0 +1,260 @@
+import json
+import os
+from abc import ABC, abstractmethod
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from egram_store import CAPTURE_DIR, CHANNELS, EgramRecorder, new_capture_path, sample_dtype
+
+DEFAULT_PRE = 5.0        # s of signal kept before each trigger
+DEFAULT_POST = 5.0       # s recorded after the last trigger of a snippet
+# Highest sample rate the pre-trigger buffer is sized for
+MAX_SAMPLE_RATE = 2000.0
+
+# Beat detection shared by the rhythm conditions
+DEFAULT_SENSITIVITY = 1.0   # mV
+BEAT_BLANKING = 0.15        # s - onsets closer than this to the previous one are the same beat
+RATE_TOLERANCE = 0.1        # fraction outside LRL/URL before an interval counts
+
+
+class BeatDetector:
+    """Threshold-crossing beat times on one channel, carried across blocks"""
+
+    def __init__(self, sensitivity: float = DEFAULT_SENSITIVITY, blanking: float = BEAT_BLANKING):
+        self.sensitivity = sensitivity
+        self.blanking = blanking
+        self.last_beat: Optional[float] = None
+        self._above = False
+
+    def beats(self, t: np.ndarray, x: np.ndarray) -> np.ndarray:
+        above = np.abs(x) >= self.sensitivity
+        rising = above & ~np.concatenate(([self._above], above[:-1]))
+        self._above = bool(above[-1])
+        onsets = t[rising]
+        if onsets.size == 0:
+            return onsets
+        # blank onsets that follow the previous onset too closely (a notched complex is one beat)
+        previous = np.concatenate(([-np.inf if self.last_beat is None else self.last_beat], onsets[:-1]))
+        onsets = onsets[onsets - previous >= self.blanking]
+        if onsets.size:
+            self.last_beat = float(onsets[-1])
+        return onsets
+
+
+class TriggerCondition(ABC):
+    """Base for trigger conditions: check() returns the trigger times within one block"""
+
+    name = "trigger"
+
+    def __init__(self, channel: str):
+        if channel not in CHANNELS:
+            raise ValueError(f"Unknown channel '{channel}'. Must be one of: {list(CHANNELS)}")
+        self.channel = channel
+
+    @abstractmethod
+    def check(self, t: np.ndarray, x: np.ndarray) -> np.ndarray:
+        ...
+
+
+class AmplitudeTrigger(TriggerCondition):
+    """|x| rising above a threshold"""
+
+    def __init__(self, channel: str, threshold: float):
+        super().__init__(channel)
+        self.threshold = threshold
+        self.name = f"{channel} amplitude > {threshold:g} mV"
+        self._above = False
+
+    def check(self, t, x):
+        above = np.abs(x) > self.threshold
+        rising = above & ~np.concatenate(([self._above], above[:-1]))
+        self._above = bool(above[-1])
+        return t[rising]
+
+
+class IntervalTrigger(TriggerCondition):
+    """Beat-to-beat interval slower than LRL or faster than URL (with RATE_TOLERANCE either way)"""
+
+    def __init__(self, channel: str, lrl: float, url: float, sensitivity: float = DEFAULT_SENSITIVITY):
+        super().__init__(channel)
+        self.longest = 60.0 / lrl * (1 + RATE_TOLERANCE)
+        self.shortest = 60.0 / url * (1 - RATE_TOLERANCE)
+        self.detector = BeatDetector(sensitivity)
+        self.name = f"{channel} interval outside {lrl:g}-{url:g} ppm"
+
+    def check(self, t, x):
+        previous = self.detector.last_beat
+        beats = self.detector.beats(t, x)
+        if beats.size == 0:
+            return beats
+        if previous is None:
+            intervals, ends = np.diff(beats), beats[1:]
+        else:
+            intervals, ends = np.diff(beats, prepend=previous), beats
+        return ends[(intervals > self.longest) | (intervals < self.shortest)]
+
+
+class MissingBeatTrigger(TriggerCondition):
+    """No beat for `timeout` seconds; fires once per gap, while the gap is still open"""
+
+    def __init__(self, channel: str, timeout: float, sensitivity: float = DEFAULT_SENSITIVITY):
+        super().__init__(channel)
+        self.timeout = timeout
+        self.detector = BeatDetector(sensitivity)
+        self.name = f"{channel} no beat for {timeout:g} s"
+        self._fired_after: Optional[float] = None
+        # start of the open gap: the last beat, or the first sample if there has been none yet
+        self._gap_start: Optional[float] = None
+
+    def check(self, t, x):
+        if self._gap_start is None:
+            self._gap_start = float(t[0])
+        beats = self.detector.beats(t, x)
+        # gap starts: the open gap, then every beat in this block
+        starts = np.concatenate(([self._gap_start], beats))
+        if beats.size:
+            self._gap_start = float(beats[-1])
+        ends = np.concatenate((starts[1:], [np.inf]))
+        due = starts + self.timeout
+        fired = due[(due < ends) & (due <= t[-1])]
+        if self._fired_after is not None:
+            fired = fired[fired - self.timeout > self._fired_after]
+        if fired.size:
+            self._fired_after = float(fired[-1] - self.timeout)
+        return fired
+
+
+def default_conditions(lrl: float, url: float, sensitivity: float = DEFAULT_SENSITIVITY,
+                       channel: str = "ventricular") -> List[TriggerCondition]:
+    """Out-of-range intervals and pauses longer than 1.5 LRL intervals on one channel"""
+    return [IntervalTrigger(channel, lrl, url, sensitivity),
+            MissingBeatTrigger(channel, 1.5 * 60.0 / lrl, sensitivity)]
+
+
+class PreTriggerBuffer:
+    """Fixed-size circular buffer of the most recent samples"""
+
+    def __init__(self, capacity: int, channels=CHANNELS):
+        self.capacity = capacity
+        self._data = np.zeros(capacity, dtype=sample_dtype(channels))
+        self._head = 0     # total samples ever written
+        self.channels = tuple(channels)
+
+    def extend(self, t: np.ndarray, *columns):
+        n = t.size
+        if n >= self.capacity:
+            t = t[-self.capacity:]
+            columns = [c[-self.capacity:] for c in columns]
+            self._head += n - self.capacity
+            n = self.capacity
+        start = self._head % self.capacity
+        first = min(n, self.capacity - start)
+        for name, values in zip(("t",) + self.channels, (t,) + tuple(columns)):
+            self._data[name][start:start + first] = values[:first]
+            self._data[name][:n - first] = values[first:]
+        self._head += n
+
+    def since(self, t0: float) -> np.ndarray:
+        """Buffered samples with t >= t0, oldest first"""
+        count = min(self._head, self.capacity)
+        start = (self._head - count) % self.capacity
+        ordered = np.roll(self._data, -start)[:count] if start else self._data[:count]
+        return ordered[np.searchsorted(ordered["t"], t0, side="left"):]
+
+
+class TriggeredRecorder:
+    """
+    Writes only the parts of a stream around trigger events.
+
+    Every block is checked by each condition (vectorized over the block) and
+    then pushed into a circular pre-trigger buffer. A trigger opens a snippet
+    holding the last `pre` seconds; further triggers extend it, and it closes
+    `post` seconds after the last one. Each snippet is a regular capture
+    (EgramRecorder) plus a .json sidecar listing its triggers.
+    """
+
+    def __init__(self, conditions: Sequence[TriggerCondition], pre: float = DEFAULT_PRE,
+                 post: float = DEFAULT_POST, directory: str = CAPTURE_DIR,
+                 max_rate: float = MAX_SAMPLE_RATE):
+        self.conditions = list(conditions)
+        self.pre = pre
+        self.post = post
+        self.directory = directory
+        self.buffer = PreTriggerBuffer(max(int(pre * max_rate), 1))
+        self.snippets: List[str] = []
+        self.triggers = 0
+        self._recorder: Optional[EgramRecorder] = None
+        self._events: List[Tuple[float, str]] = []
+        self._end = -np.inf
+        self._written_until = -np.inf
+
+    @property
+    def active(self) -> bool:
+        return self._recorder is not None
+
+    def process(self, t, atrial, ventricular):
+        t = np.asarray(t, dtype=float)
+        if t.size == 0:
+            return
+        columns = {"atrial": np.asarray(atrial, dtype=float), "ventricular": np.asarray(ventricular, dtype=float)}
+        found = [(times, c.name) for c in self.conditions for times in [c.check(t, columns[c.channel])] if times.size]
+        if found:
+            times = np.concatenate([f[0] for f in found])
+            reasons = np.concatenate([np.full(f[0].size, f[1], dtype=object) for f in found])
+            order = np.argsort(times, kind="stable")
+            events = list(zip(times[order].tolist(), reasons[order]))
+            self.triggers += len(events)
+        else:
+            events = []
+
+        position = 0
+        k = 0
+        while True:
+            if self._recorder is None:
+                if k == len(events):
+                    break
+                trigger = events[k][0]
+                self._open(trigger)
+                # pre-trigger samples from earlier blocks, then from this one
+                early = self.buffer.since(max(trigger - self.pre, self._written_until))
+                early = early[early["t"] < t[0]]
+                if early.size:
+                    self._recorder.extend(early["t"], *(early[name] for name in CHANNELS))
+                position = max(position, int(np.searchsorted(t, trigger - self.pre, side="left")))
+                self._end = trigger + self.post
+            # every trigger inside the snippet pushes its end out
+            while k < len(events) and events[k][0] <= self._end:
+                self._events.append(events[k])
+                self._end = max(self._end, events[k][0] + self.post)
+                k += 1
+            stop = int(np.searchsorted(t, self._end, side="right"))
+            if stop > position:
+                self._recorder.extend(t[position:stop], columns["atrial"][position:stop],
+                                      columns["ventricular"][position:stop])
+                self._written_until = float(t[stop - 1])
+                position = stop
+            if stop < t.size:
+                self._close()
+            else:
+                break
+        self.buffer.extend(t, columns["atrial"], columns["ventricular"])
+
+    def _open(self, trigger: float):
+        path = new_capture_path(self.directory, f"trigger_%Y%m%d_%H%M%S_{len(self.snippets):04d}")
+        self._recorder = EgramRecorder(path)
+        self._events = []
+
+    def _close(self):
+        recorder, self._recorder = self._recorder, None
+        recorder.close()
+        with open(os.path.splitext(recorder.path)[0] + ".json", "w") as f:
+            json.dump({"pre": self.pre, "post": self.post,
+                       "triggers": [{"t": t, "reason": reason} for t, reason in self._events]}, f, indent=4)
+        self.snippets.append(recorder.path)
+        print(f"Saved triggered snippet {recorder.path} ({len(self._events)} triggers, {recorder.samples} samples)")
+
+    def close(self):
+        """Finish the open snippet, if any, with what has been received so far"""
+        if self._recorder is not None:
+            self._close()
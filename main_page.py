@@ -2,12 +2,32 @@ import tkinter as tk
 from tkinter import ttk
 import user_db as user_db
 import parameters as parameters
-from threading import Thread
+from serial_io import PRIORITY_ECHO
+from threading import Lock, Thread
 import time
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 from matplotlib.figure import Figure
 import numpy as np
-import struct
+from egram_analysis import EgramAnalyzer
+import pacing_sim
+import sensing_advisor
+from param_history import default_history
+import param_lattice
+from egram_store import (ACTIVITY_CHANNELS as ACTIVITY_STORE_CHANNELS, CAPTURE_DIR,
+                         EgramRecorder, activity_path, list_captures, open_capture)
+from egram_frame import (ACTIVITY_CHANNELS, DEFAULT_CHANNELS, LEGACY_PACKET_SIZE, MARKER_SLOTS, FrameTimebase,
+                         build_frame_request, decode_frames, decode_legacy_packet, frame_size, is_frame,
+                         negotiation_order)
+from egram_markers import frame_events
+from egram_display import EgramDisplay
+from capture_engine import (ACTIVITY_RING_CAPACITY, MARKER_RING_CAPACITY, CaptureEngine, RingPump,
+                            SampleRing)
+from egram_server import DEFAULT_SOCKET, DEFAULT_WS_PORT, EgramServer
+from egram_trigger import TriggeredRecorder, default_conditions
+import egram_qt
+from session_report import ReportQueue, session_job, write_session
+from pipeline import DROP_NEVER, DROP_OLDEST, BoundedChannel, ChannelClosed, ConsumerThread, SampleBus
+import os
 
 
 class Main(tk.Tk):
@@ -36,6 +56,12 @@ class Main(tk.Tk):
 
         # Connection management - initialize FIRST
         self.pacemaker_connected = False
+        # None until the connected board's parameters are known, then "cached" or "confirmed"
+        self.device_state = None
+        # Last 18-byte packet sent by a successful upload, and the latest echo the board
+        # itself sent after it (not a cached one), for session reports
+        self.uploaded_packet = None
+        self.device_echo = None
         
         # Connect button - create BEFORE calling set_connection_status
         self.connect_btn = ttk.Button(self.status_frame, text="Connect", command=self.toggle_connection)
@@ -54,7 +80,7 @@ class Main(tk.Tk):
         self.frames = {}
 
         # Append each page into the frames dict
-        for F in (WelcomePage, ModeSelectPage, ParameterPage, RegisterUserPage, EgramPage):
+        for F in (WelcomePage, ModeSelectPage, ParameterPage, RegisterUserPage, EgramPage, HistoryPage):
             frame = F(container, self)
             self.frames[F] = frame
             frame.grid(row=0, column=0, sticky="nsew")
@@ -62,8 +88,9 @@ class Main(tk.Tk):
         # Show welcome page by default
         self.show_frame(WelcomePage)
         
-        # Start connection monitoring
-        self.monitor_connection()
+        # Get pushed connection state changes from the communicator
+        parameters.pacemaker_comm.add_connection_listener(self.on_connection_event)
+        parameters.pacemaker_comm.add_device_listener(self.on_device_event)
 
     def show_frame(self, page_class):
         frame = self.frames[page_class]
@@ -82,6 +109,9 @@ class Main(tk.Tk):
             self.status_canvas.create_oval(2, 2, 18, 18, fill="red")
             self.status_label.config(text="Pacemaker Disconnected")
             self.connect_btn.config(text="Connect")
+            self.device_state = None
+            self.uploaded_packet = None
+            self.device_echo = None
 
     def toggle_connection(self):
         if not self.pacemaker_connected:
@@ -96,30 +126,24 @@ class Main(tk.Tk):
             self.set_connection_status(False)
     
     
-    # continuously check connection status and attempt to reconnect if disconnected
-    def monitor_connection(self):
-        def check():
-            while True:
-                try:
-                    # If not connected, attempt to reconnect automatically
-                    if self.pacemaker_connected:
-                        # Try to connect
-                        if not parameters.pacemaker_comm.check_connection():
-                            self.after(0, lambda: self.set_connection_status(False))
-                            self.after(0, lambda: parameters.pacemaker_comm.disconnect())
-                            print("Auto Disconnected")
-                        
-                except Exception as e:
-                    print(f"Connection monitor error: {e}")
-                    # If there's an error, assume disconnected
-                    if self.pacemaker_connected:
-                        self.after(0, lambda: self.set_connection_status(False))
-                
-                time.sleep(1)  # Check every second
-        
-        # Start the monitoring thread
-        monitor_thread = Thread(target=check, daemon=True)
-        monitor_thread.start()
+    # called by the communicator (from any thread) whenever the link goes up or down
+    def on_connection_event(self, connected, reason):
+        print(f"Connection event: {'up' if connected else 'down'} ({reason})")
+        self.after(0, lambda c=connected: self.set_connection_status(c))
+
+    # called by the communicator with a known board's cached echo, then with the board's own reply
+    def on_device_event(self, identity, echo, confirmed):
+        self.after(0, lambda: self.apply_device_state(identity, echo, confirmed))
+
+    def apply_device_state(self, identity, echo, confirmed):
+        if not self.pacemaker_connected:
+            return
+        self.device_state = "confirmed" if confirmed else "cached"
+        if confirmed:
+            self.device_echo = bytes(echo)
+        if identity is not None:
+            self.status_label.config(text=f"Pacemaker Connected ({identity.describe()})")
+        self.frames[ParameterPage].on_device_state(echo)
 
     #Update all fonts inside a frame based on current size
     def apply_fonts(self, frame):
@@ -278,6 +302,7 @@ class ParameterPage(tk.Frame):
         super().__init__(parent)
         self.controller = controller
         self.widgets = {}
+        self.device_labels = {}
         self.title = ttk.Label(self, text="", font=("Arial", 14))
         self.title.pack(pady=10)
         self.form_frame = tk.Frame(self)
@@ -302,6 +327,11 @@ class ParameterPage(tk.Frame):
         self.save_profile_button.pack(side="left", padx=5)
         self.load_profile_button = ttk.Button(button_frame,text="Fetch From Profile", command=self.load_profile)
         self.load_profile_button.pack(side="left", padx=5)
+        self.simulate_button = ttk.Button(button_frame, text="Simulate", command=self.simulate_profile)
+        self.simulate_button.pack(side="left", padx=5)
+        self.sensitivity_button = ttk.Button(button_frame, text="Recommend Sensitivity",
+                                             command=self.recommend_sensitivity)
+        self.sensitivity_button.pack(side="left", padx=5)
 
         controller.apply_fonts(self)
         
@@ -320,8 +350,10 @@ class ParameterPage(tk.Frame):
                 display_value = parameters.ACTIVITY_MAP[display_value]
 
             mode_dict[param_name] = display_value
-            profile[mode] = mode_dict
-            user_db.save_user_profile(username, profile)
+
+        # one write per Save, with the whole mode filled in
+        profile[mode] = mode_dict
+        user_db.save_user_profile(username, profile)
 
     # save data to profile
     def load_profile(self):
@@ -344,55 +376,63 @@ class ParameterPage(tk.Frame):
                     entry.delete(0, tk.END)
                     entry.insert(0, str(display))
     
-    # Creates the dropdowns for each param
+    # predict what the form's values would do against a synthetic intrinsic rhythm
+    def simulate_profile(self):
+        mode = self.controller.current_mode
+        params = {name: entry.get().strip() for name, entry in self.widgets.items() if entry.get().strip()}
+        t, atrial, ventricular = pacing_sim.synthetic_egram(600, rate=65, seed=0)
+        try:
+            summary = pacing_sim.simulate(mode, params, t, atrial, ventricular).summary()
+        except ValueError as e:
+            self.upload_msg.config(text=f"Cannot simulate: {e}", foreground="red")
+            return
+        self.upload_msg.config(
+            text=f"10 min at 65 bpm intrinsic: {summary['paces']} paces, {summary['senses']} senses, "
+                 f"{summary['refractory_senses']} refractory senses ({summary['paced_fraction'] * 100:.0f}% paced)",
+            foreground="blue")
+
+    # survey every recorded capture off the UI thread, then fill in the sensitivity dropdowns
+    def recommend_sensitivity(self):
+        self.sensitivity_button.config(state="disabled")
+        self.upload_msg.config(text="Surveying recorded captures...", foreground="blue")
+
+        def worker():
+            survey = sensing_advisor.survey_captures()
+            self.after(0, lambda: self.show_sensitivity(survey))
+
+        Thread(target=worker, daemon=True).start()
+
+    def show_sensitivity(self, survey):
+        self.sensitivity_button.config(state="normal")
+        if survey.captures == 0:
+            self.upload_msg.config(text="No recorded captures to survey", foreground="red")
+            return
+        parts = []
+        colour = "green"
+        for name, result in survey.recommend().items():
+            label = result["parameter"]
+            if result["recommended"] is None:
+                parts.append(f"{label}: {result['warning']}")
+                colour = "red"
+                continue
+            entry = self.widgets.get(label)
+            if entry is not None:
+                entry.set(f"{result['recommended']:.1f}")
+            text = (f"{label}: {result['recommended']:.1f} mV "
+                    f"(5th pct event {result['event_p5']:.2f} mV, noise {result['noise_p999']:.2f} mV)")
+            if result["warning"]:
+                text += f" - {result['warning']}"
+                colour = "red"
+            parts.append(text)
+        self.upload_msg.config(
+            text=f"{survey.captures} captures, {survey.samples} samples. " + "; ".join(parts), foreground=colour)
+
+    # Creates the dropdowns for each param, offering exactly its legal values
     def create_dropdown(self, parent, param_name):
-        if param_name in ["Lower Rate Limit", "Upper Rate Limit", "Maximum Sensor Rate"]:
-            values = [x for x in range(30, 176, 5)]
-            cb = ttk.Combobox(parent, values=values, width=10, state="readonly")
-            cb.pack(side="left", padx=5)
-            return cb
-        if "Amplitude" in param_name:
-            values = [round(x,1) for x in np.arange(0.1, 5.1, 0.1)]
-            # values = [x for x in range(0.1, 5.1, 0.1)]
-            cb = ttk.Combobox(parent, values=values, width=10, state="readonly")
-            cb.pack(side="left", padx=5)
-            return cb
-        if "Pulse Width" in param_name:
-            values = [x for x in range(1, 31, 1)]
-            cb = ttk.Combobox(parent, values=values, width=10, state="readonly")
-            cb.pack(side="left", padx=5)
-            return cb
-        if "Sensitivity" in param_name:
-            values = [round(x,1) for x in np.arange(0.0, 5.1, 0.1)]
-            # values = [x for x in range(0, 5.1, 0.1)]
-            cb = ttk.Combobox(parent, values=values, width=10, state="readonly")
-            cb.pack(side="left", padx=5)
-            return cb
-        if param_name in ["ARP", "VRP"]:
-            values = [x for x in range(150, 510, 10)]
-            cb = ttk.Combobox(parent, values=values, width=10, state="readonly")
-            cb.pack(side="left", padx=5)
-            return cb
-        if param_name == "Activity Threshold":
-            values = ["V-Low", "Low", "Med-Low", "Med", "Med-High", "High", "V-High"]
-            cb = ttk.Combobox(parent, values=values, width=10, state="readonly")
-            cb.pack(side="left", padx=5)
-            return cb
-        if param_name == "Reaction Time":
-            values = [x for x in range(10, 60, 10)]
-            cb = ttk.Combobox(parent, values=values, width=10, state="readonly")
-            cb.pack(side="left", padx=5)
-            return cb
-        if param_name == "Response Factor":
-            values = [x for x in range(1, 17, 1)]
-            cb = ttk.Combobox(parent, values=values, width=10, state="readonly")
-            cb.pack(side="left", padx=5)
-            return cb
-        if param_name == "Recovery Time":
-            values = [x for x in range(2, 17, 1)]
-            cb = ttk.Combobox(parent, values=values, width=10, state="readonly")
-            cb.pack(side="left", padx=5)
-            return cb
+        values = param_lattice.dropdown_values(param_name)
+        cb = ttk.Combobox(parent, values=values, width=10, state="readonly")
+        cb.pack(side="left", padx=5)
+        return cb
 
     # Show the parameters for the given mode
     def show_parameters(self):
@@ -400,6 +440,7 @@ class ParameterPage(tk.Frame):
         for widget in self.form_frame.winfo_children():
             widget.destroy()
         self.widgets.clear()
+        self.device_labels.clear()
 
         mode = self.controller.current_mode
         self.title.config(text=f"{mode} Parameters")
@@ -416,15 +457,26 @@ class ParameterPage(tk.Frame):
             entry = self.create_dropdown(row, p)
             self.widgets[p] = entry
 
-            # Retrieve raw value already stored in pacemaker_params
-            if not self.controller.pacemaker_connected:
-                display_value = "—"
-            else:
-                raw_value = parameters.pacemaker_params.get_parameter(p)
-                display_value = self.format_display_value(p, raw_value)
+            label = ttk.Label(row, text=self.device_label_text(p), foreground="gray")
+            label.pack(side="left", padx=10)
+            self.device_labels[p] = label
+
+    # On-device value from pacemaker_params, once it holds this board's cached or echoed values
+    def device_label_text(self, param_name):
+        if not self.controller.pacemaker_connected or self.controller.device_state is None:
+            return "On-Device: —"
+        raw_value = parameters.pacemaker_params.get_parameter(parameters.FORM_PACKET_FIELDS[param_name][0])
+        text = f"On-Device: {self.format_display_value(param_name, raw_value)}"
+        if self.controller.device_state == "cached":
+            text += " (cached)"
+        return text
+
+    # the connected board's parameters changed (cached on connect, or a fresh echo)
+    def on_device_state(self, echo):
+        self.update_parameters_from_response(echo)
+        for param_name, label in self.device_labels.items():
+            label.config(text=self.device_label_text(param_name))
 
-            ttk.Label(row, text=f"On-Device: {display_value}", foreground="gray").pack(side="left", padx=10)
-            
 
     # convert raw parameter value to display format
     def format_display_value(self, param_name, raw_value):
@@ -443,66 +495,23 @@ class ParameterPage(tk.Frame):
 
     # upload data to pacemaker
     def upload_to_pacemaker(self):
-        for param_name, entry in self.widgets.items():
-            if 'Lower Rate Limit' in self.widgets and 'Upper Rate Limit' in self.widgets:
-                lrl = float(self.widgets['Lower Rate Limit'].get().strip())
-                url = float(self.widgets['Upper Rate Limit'].get().strip())
-                
-                if url < lrl:
-                    self.upload_msg.config(
-                        text="Upper Rate Limit cannot be lower than the Lower Rate Limit",
-                        foreground="red")
-                    return
+        # every range, step and cross-field rule (e.g. URL >= LRL) in one check
+        values = {name: entry.get().strip() for name, entry in self.widgets.items()}
+        valid, msg = param_lattice.lattice(self.controller.current_mode).validate(values)
+        if not valid:
+            self.upload_msg.config(text=msg, foreground="red")
+            return
         if not self.controller.pacemaker_connected:
             self.upload_msg.config(text="Cannot upload - Pacemaker not connected", foreground="red")
             return
         
+        # convert each form value to its packet field and raw units
         for param_name, entry in self.widgets.items():
-            value = entry.get().strip()
-            if param_name == "Activity Threshold":
-                raw = parameters.ACTIVITY_MAP[value]
-                parameters.pacemaker_params.set_parameter("Activity Threshold", raw)
-                continue
-            if not value:
-                self.upload_msg.config(text=f"Please enter value for {param_name}", foreground="red")
+            field, raw_value = parameters.form_to_packet(param_name, entry.get().strip())
+            if not parameters.pacemaker_params.set_parameter(field, raw_value):
+                self.upload_msg.config(text=f"{param_name} cannot be sent to the pacemaker", foreground="red")
                 return
-            
-            # validate the parameter
-            valid, msg = parameters.validate_param(param_name, value)
-            if not valid:
-                self.upload_msg.config(text=msg, foreground="red")
-                return
-            
-            # convert to appropriate format and set in parameter manager
-            if param_name in ["Lower Rate Limit", "Upper Rate Limit", "ARP", "VRP"]:
-                # These are integer values
-                int_value = int(value)
-                if param_name == "Lower Rate Limit":
-                    parameters.pacemaker_params.set_parameter('Lower Rate Limit', int_value)
-                elif param_name == "Upper Rate Limit":
-                    parameters.pacemaker_params.set_parameter('Upper Rate Limit', int_value)
-                elif param_name == "ARP":
-                    parameters.pacemaker_params.set_parameter('ARP', int_value // 10)  # convert to raw value
-                elif param_name == "VRP":
-                    parameters.pacemaker_params.set_parameter('VRP', int_value // 10)  # convert to raw value
-            
-            elif "Amplitude" in param_name:
-                # Convert voltage to raw value
-                raw_value = int(value * 10)
-                if "Atrial" in param_name:
-                    parameters.pacemaker_params.set_parameter('Atrial Amplitude', raw_value)
-                else:
-                    parameters.pacemaker_params.set_parameter('Ventricular Amplitude', raw_value)
-            
-            elif "Pulse Width" in param_name:
-                # convert ms to raw value
-                raw_value = int(value * 10)
-                if "Atrial" in param_name:
-                    parameters.pacemaker_params.set_parameter('Atrial Pulse Width', raw_value)
-                else:
-                    parameters.pacemaker_params.set_parameter('Ventricular Pulse Width', raw_value)
-                        
-        
+
         # get the parameter bytes and send to pacemaker
         try:
             param_bytes = parameters.pacemaker_params.get_parameter_bytes()
@@ -512,6 +521,13 @@ class ParameterPage(tk.Frame):
             
             if success:
                 self.upload_msg.config(text="Parameters successfully uploaded to pacemaker", foreground="green")
+                # verified against the next echo the board confirms, not the one it sent before
+                self.controller.uploaded_packet = bytes(param_bytes)
+                self.controller.device_echo = None
+                device = parameters.pacemaker_comm.device
+                default_history().record_upload(
+                    self.controller.current_user, device.device_id if device is not None else None,
+                    self.controller.current_mode, {name: entry.get().strip() for name, entry in self.widgets.items()})
                 # Print the parameters for verification
                 parameters.pacemaker_params.print_parameters()
             else:
@@ -534,52 +550,38 @@ class ParameterPage(tk.Frame):
     # Fetch params from pacemaker
     def fetch_parameters_thread(self):
         try:
-            # Clear the serial buffer first
-            if parameters.pacemaker_comm.ser.in_waiting > 0:
-                parameters.pacemaker_comm.ser.read(parameters.pacemaker_comm.ser.in_waiting)
-            
-            # Set to echo mode and send request
+            # Set to echo mode and build the request
             parameters.pacemaker_params.set_echo_mode()
             echo_bytes = parameters.pacemaker_params.get_parameter_bytes()
+            # switch back to parameter mode for future uploads
+            parameters.pacemaker_params.set_parameter_mode()
             
-            # Send echo request to pacemaker
-            success = parameters.pacemaker_comm.send_raw_parameters(echo_bytes)
+            # Queue the echo request; the serial worker matches the 18 byte reply to it
+            response, error = parameters.pacemaker_comm.request(
+                echo_bytes, response_size=18, priority=PRIORITY_ECHO, timeout=2.0)
             
-            if success:
-                # Wait for response and read available data
-                time.sleep(2) 
+            if response is not None and len(response) == 18:
+                print(f"Received {len(response)} bytes from pacemaker:")
+                for i, byte in enumerate(response):
+                    print(f"  Byte {i}: {byte} (0x{byte:02x})")
                 
-                # Read response from pacemaker
-                if parameters.pacemaker_comm.ser.in_waiting >= 18:
-                    response = parameters.pacemaker_comm.ser.read(18)
-                    
-                    print(f"Received {len(response)} bytes from pacemaker:")
-                    for i, byte in enumerate(response):
-                        print(f"  Byte {i}: {byte} (0x{byte:02x})")
-                    
-                    # update the parameters from the response
-                    self.update_parameters_from_response(response)
-                    
-                    # refresh the display in main thread
-                    self.after(0, self.refresh_display)
-                    
-                    # switch back to parameter mode for future uploads
-                    parameters.pacemaker_params.set_parameter_mode()
-                    
-                    # update GUI in main thread
-                    self.after(0, lambda: self.upload_msg.config(
-                        text="Successfully fetched parameters from pacemaker", 
-                        foreground="green"
-                    ))
-                else:
-                    bytes_available = parameters.pacemaker_comm.ser.in_waiting
-                    self.after(0, lambda: self.upload_msg.config(
-                        text=f"No response from pacemaker (only {bytes_available} bytes available)", 
-                        foreground="red"
-                    ))
+                # caches it for this board and updates the display through the device listener
+                parameters.pacemaker_comm.confirm_parameters(response)
+                
+                # update GUI in main thread
+                self.after(0, lambda: self.upload_msg.config(
+                    text="Successfully fetched parameters from pacemaker", 
+                    foreground="green"
+                ))
+            elif response is not None:
+                bytes_available = len(response)
+                self.after(0, lambda: self.upload_msg.config(
+                    text=f"No response from pacemaker (only {bytes_available} bytes available)", 
+                    foreground="red"
+                ))
             else:
                 self.after(0, lambda: self.upload_msg.config(
-                    text="Failed to send echo request", 
+                    text=f"Failed to send echo request: {error}", 
                     foreground="red"
                 ))
                 
@@ -618,6 +620,22 @@ class ParameterPage(tk.Frame):
 
 
 
+# samples per channel requested in each compact egram frame
+FRAME_SAMPLES = 32
+
+# Pipeline queue sizes, in blocks (one frame or one legacy sample each)
+RAW_QUEUE_BLOCKS = 1024      # serial worker -> decoder, drops only after RAW_PUT_TIMEOUT
+RECORDER_QUEUE_BLOCKS = 1024  # decoder -> recorder / trigger, drops only after RECORDER_PUT_TIMEOUT
+DISPLAY_QUEUE_BLOCKS = 64     # decoder -> Tk, oldest dropped when the GUI falls behind
+DISPLAY_INTERVAL_MS = 33
+# Longest a full never-drop queue may hold up its producer, in seconds. A stalled
+# recorder blocks the decoder's publish, which fills the raw queue, which blocks the
+# serial worker and with it parameter commands - so each hop gives up eventually,
+# counts the drop and keeps dropping until its consumer catches up.
+RAW_PUT_TIMEOUT = 0.5
+RECORDER_PUT_TIMEOUT = 1.0
+
+
 class EgramPage(tk.Frame):
     def __init__(self, parent, controller):
         super().__init__(parent)
@@ -651,53 +669,104 @@ class EgramPage(tk.Frame):
         ttk.Label(settings_frame, text="  High-Pass Filter:").pack(side="left", padx=(15, 5))
         self.filter_var = tk.BooleanVar(value=False)
         ttk.Checkbutton(settings_frame, text="Enable", variable=self.filter_var, command=self.update_plot).pack(side="left", padx=2)
+
+        # Record every received sample to data/captures for the history browser
+        self.record_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(settings_frame, text="Record to disk", variable=self.record_var, command=self.toggle_recording).pack(side="left", padx=(15, 2))
+        self.recorder = None
+
+        # Record only the seconds around out-of-range intervals and pauses
+        self.trigger_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(settings_frame, text="Triggered capture", variable=self.trigger_var,
+                        command=self.toggle_triggered).pack(side="left", padx=(15, 2))
+        self.triggered = None
+        self.trigger_consumer = None
+
+        # Run the serial capture loop in its own process so redraws can't starve it
+        self.engine_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(settings_frame, text="Separate capture process", variable=self.engine_var).pack(side="left", padx=(15, 2))
+        self.engine = None
+        self.pump = None
+        self.using_engine = False
+
+        # Fan live samples out to other local viewers/scripts (Unix socket + localhost WebSocket)
+        self.serve_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(settings_frame, text="Serve locally", variable=self.serve_var, command=self.toggle_server).pack(side="left", padx=(15, 2))
+        self.server = None
+
+        # Ask rate-adaptive firmware for the activity and sensor-indicated rate columns too
+        self.activity_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(settings_frame, text="Activity channel", variable=self.activity_var).pack(side="left", padx=(15, 2))
+        self.frame_channels = DEFAULT_CHANNELS
+
+        # Pace/sense event markers (AS/AP/VS/VP/refractory sense) from firmware that sends them
+        self.markers_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(settings_frame, text="Event markers", variable=self.markers_var, command=self.update_plot).pack(side="left", padx=(15, 2))
+        self.frame_markers = 0
+
+        # Draw the live traces in a pyqtgraph window instead (needs pyqtgraph + a Qt binding)
+        self.qt_var = tk.BooleanVar(value=False)
+        qt_check = ttk.Checkbutton(settings_frame, text="Qt viewer", variable=self.qt_var, command=self.toggle_qt_viewer)
+        qt_check.pack(side="left", padx=(15, 2))
+        if not egram_qt.available():
+            qt_check.state(["disabled"])
+        self.qt_viewer = None
         
+        ttk.Button(self, text="Browse Recordings", command=lambda: controller.show_frame(HistoryPage)).pack(pady=5)
+        ttk.Button(self, text="Session Report", command=self.make_report).pack(pady=5)
         ttk.Button(self, text="Back to Mode Select", command=self.go_back).pack(pady=5)
 
-        # Two subplots: atrial (top), ventricular (bottom)
-        self.fig = Figure(figsize=(6, 5), dpi=100)
-
-        self.ax_atrial = self.fig.add_subplot(211)
-        self.ax_vent = self.fig.add_subplot(212)
-
-        # Labeling and grid
-        self.ax_atrial.set_title('Atrial Data', fontsize=10)
-        self.ax_atrial.set_ylabel('Amplitude', fontsize=8)
-        self.ax_atrial.grid(True, alpha=0.3)
-        self.ax_atrial.set_ylim(-5, 5)
-        self.ax_vent.set_ylim(-5, 5)
-        self.ax_vent.set_title('Ventricular Data', fontsize=10)
-        self.ax_vent.set_xlabel('Time (s)', fontsize=8)
-        self.ax_vent.set_ylabel('Amplitude', fontsize=8)
-        self.ax_vent.grid(True, alpha=0.3)
-
-        # Create lines for each subplot
-        self.atrial_line, = self.ax_atrial.plot([], [], 'b-', linewidth=1)
-        self.ventricular_line, = self.ax_vent.plot([], [], 'r-', linewidth=1)
-
-        self.fig.tight_layout()
+        # Results from the background analysis process
+        self.analysis_label = ttk.Label(self, text="", foreground="gray")
+        self.analysis_label.pack(pady=2)
+        self.link_label = ttk.Label(self, text="", foreground="gray")
+        self.link_label.pack(pady=2)
 
+        # Traces, markers and the activity strip; the figure and its data know nothing about Tk
+        self.display = EgramDisplay()
+        self.fig = self.display.fig
         self.canvas = FigureCanvasTkAgg(self.fig, master=self)
         self.canvas.draw()
         self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
 
-        
-        # DATA STORAGE
-        self.time_data = []
-        self.atrial_data = []
-        self.ventricular_data = []
-        self.atrial_data_raw = []
-        self.ventricular_data_raw = []
-        self.start_time = None
-        
         # Control flag for continuous reading
         self.reading_egram = False
-        
-        # Display window parameters
-        self.display_window = 5.0
-        # Matplotlib lines
-        self.atrial_line, = self.ax_atrial.plot([], [], 'b-', linewidth=1, label='Atrial')
-        self.ventricular_line, = self.ax_vent.plot([], [], 'r-', linewidth=1, label='Ventricular')
+        self.sample_count = 0
+        self.start_time = None
+        # Rebuilds sample times from compact frame sequence numbers, tracks lost frames
+        self.timebase = FrameTimebase()
+
+        # Capture pipeline: serial worker -> raw channel -> decoder thread -> bus -> display / recorder.
+        # Every hop is a bounded queue with its own drop policy.
+        self.bus = SampleBus()
+        self.display_channel = self.bus.subscribe("display", DISPLAY_QUEUE_BLOCKS, DROP_OLDEST)
+        self.raw_channel = None
+        self.decoder = None
+        self.record_consumer = None
+        self.display_polling = False
+
+        # Activity / sensor rate travel through their own ring (shared-memory, same as the
+        # capture engine's) and display queue, so they can't hold up the egram traces
+        self.activity_ring = SampleRing(ACTIVITY_RING_CAPACITY)
+        self.activity_channel = BoundedChannel("activity display", DISPLAY_QUEUE_BLOCKS, DROP_OLDEST)
+        self.activity_pump = None
+        self.activity_recorder = None
+        self.activity_lock = Lock()
+
+        # Event markers take the same route: their own ring, pump and display queue
+        self.marker_ring = SampleRing(MARKER_RING_CAPACITY)
+        self.marker_channel = BoundedChannel("marker display", DISPLAY_QUEUE_BLOCKS, DROP_OLDEST)
+        self.marker_pump = None
+
+        # Beat/rate/spike detection runs in a worker process, never on this thread
+        self.analyzer = EgramAnalyzer(self.on_analysis_result)
+        self.analysis_interval = 1.0
+        self.analysis_window = 10.0
+        self.last_analysis = 0.0
+
+        # Session reports are rendered by a worker process, never on this thread
+        self.reports = ReportQueue()
+        self.last_capture = None
 
     
     # start the graph
@@ -711,94 +780,370 @@ class EgramPage(tk.Frame):
             return
             
         self.reading_egram = True
-        self.start_time = time.time()
+        self.start_time = time.monotonic()
+        self.timebase.reset()
+        self.sample_count = 0
         self.egram_msg.config(text="Reading egram data...", foreground="green")
+
+        # raw replies are decoded off both the serial worker and the Tk thread
+        self.raw_channel = BoundedChannel("raw", RAW_QUEUE_BLOCKS, DROP_NEVER, put_timeout=RAW_PUT_TIMEOUT)
+        self.decoder = ConsumerThread(self.raw_channel, self.decode_raw, name="egram-decoder")
+        self.start_display_polling()
         
-        # Read data in separate thread.
-        thread = Thread(target=self.fetch_egram_thread, daemon=True)
-        thread.start()
+        # Negotiating the frame format (or spawning the engine) waits, so do it off the Tk thread
+        if self.engine_var.get():
+            Thread(target=self.start_engine_thread, daemon=True).start()
+        else:
+            Thread(target=self.negotiate_egram_thread, daemon=True).start()
+
+
+    # Hand the port to the capture process; samples come back through its shared-memory ring
+    def start_engine_thread(self):
+        comm = parameters.pacemaker_comm
+        if self.engine is None:
+            self.engine = CaptureEngine()
+        if not comm.hand_over_port(self.engine):
+            # nothing to hand over (or already lent) - capture in-process instead
+            self.negotiate_egram_thread()
+            return
+        channels = ACTIVITY_CHANNELS if self.activity_var.get() else DEFAULT_CHANNELS
+        markers = MARKER_SLOTS if self.markers_var.get() else 0
+        try:
+            started = self.engine.start(comm.port, comm.baudrate, FRAME_SAMPLES, self.build_echo_packet(),
+                                        on_stop=self.on_engine_stopped, channels=channels, markers=markers)
+        except Exception as e:
+            print(f"Could not start the capture process: {e}")
+            started = False
+        if not started:
+            # take the port back, or every command would be forwarded to an engine that isn't running
+            comm.reclaim_port()
+            self.negotiate_egram_thread()
+            return
+        self.using_engine = True
+        self.pump = RingPump(self.engine.ring, self.on_ring_block)
+        self.start_aux_pumps(self.engine.activity_ring, self.engine.marker_ring)
+        print("Egram capture running in a separate process")
+
+
+    # Ring pump thread: samples are already decoded and timestamped by the capture process
+    def on_ring_block(self, times, atrial, ventricular):
+        self.sample_count += times.size
+        self.bus.publish((times, atrial, ventricular), samples=times.size)
+
+
+    # called from the engine's listener thread once the capture process has exited
+    def on_engine_stopped(self, reason):
+        if self.pump is not None:
+            self.pump.stop()
+            self.pump = None
+        parameters.pacemaker_comm.reclaim_port()
+        self.on_egram_stopped(reason)
+
+
+    # Ask for a compact frame; older firmware won't answer it, so fall back to the 32 byte echo
+    def negotiate_egram_thread(self):
+        # richest format first (activity columns, event markers), then plain egram frames
+        channels = ACTIVITY_CHANNELS if self.activity_var.get() else DEFAULT_CHANNELS
+        markers = MARKER_SLOTS if self.markers_var.get() else 0
+        self.frame_channels = self.frame_markers = 0
+        for channels, markers in negotiation_order(channels, markers):
+            frame_request = build_frame_request(FRAME_SAMPLES, channels, markers)
+            reply, _ = parameters.pacemaker_comm.request(
+                frame_request, response_size=frame_size(FRAME_SAMPLES, channels, markers),
+                priority=PRIORITY_ECHO, timeout=0.5)
+            if not self.reading_egram:
+                return
+            if is_frame(reply, FRAME_SAMPLES, channels, markers):
+                self.frame_channels, self.frame_markers = channels, markers
+                break
+
+        if self.frame_channels:
+            print(f"Device supports compact egram frames ({FRAME_SAMPLES} samples/frame, "
+                  f"{self.frame_channels} channels, {self.frame_markers} marker slots)")
+            self.activity_ring.reset()
+            self.marker_ring.reset()
+            self.start_aux_pumps(self.activity_ring, self.marker_ring)
+            self.on_egram_frame(reply)
+            # frames are buffered on the device, so poll back to back
+            started = parameters.pacemaker_comm.start_stream(
+                frame_request, frame_size(FRAME_SAMPLES, self.frame_channels, self.frame_markers),
+                self.on_egram_frame, on_stop=self.on_egram_stopped, interval=0.0)
+        else:
+            # The serial worker polls with the echo packet between any queued parameter commands
+            started = parameters.pacemaker_comm.start_stream(
+                self.build_echo_packet(), LEGACY_PACKET_SIZE, self.on_egram_packet, on_stop=self.on_egram_stopped)
+
+        if not started:
+            self.reading_egram = False
+            self.raw_channel.close()
+            self.after(0, lambda: self.egram_msg.config(
+                text="Cannot read egram - Pacemaker not connected", foreground="red"))
+            return
+        print("Echo packet sent to start egram capture")
     
     
     def stop_egram(self):
+        if self.using_engine:
+            # joining the capture process can take a moment, keep it off the Tk thread
+            Thread(target=self.engine.stop, daemon=True).start()
+        else:
+            parameters.pacemaker_comm.stop_stream()
         self.reading_egram = False
         self.egram_msg.config(text="Egram reading stopped", foreground="blue")
     
     
+    def toggle_recording(self):
+        if self.record_var.get():
+            self.recorder = EgramRecorder()
+            # the recorder gets its own never-drop queue so a busy GUI can't cost it samples;
+            # only a recorder stuck for RECORDER_PUT_TIMEOUT (a hung disk) loses any
+            channel = self.bus.subscribe("recorder", RECORDER_QUEUE_BLOCKS, DROP_NEVER,
+                                         put_timeout=RECORDER_PUT_TIMEOUT)
+            self.record_consumer = ConsumerThread(channel, self.recorder_sink, name="egram-recorder-sink")
+            self.egram_msg.config(text=f"Recording to {self.recorder.path}", foreground="green")
+        else:
+            self.stop_recording()
+
+
+    def toggle_triggered(self):
+        if self.trigger_var.get():
+            params = parameters.pacemaker_params
+            channel = "atrial" if params.get_mode_name().startswith("A") else "ventricular"
+            conditions = default_conditions(params.get_parameter("Lower Rate Limit"),
+                                            params.get_parameter("Upper Rate Limit"), channel=channel)
+            self.triggered = TriggeredRecorder(conditions)
+            # same never-drop guarantee as the full recorder; snippets must not have holes
+            channel = self.bus.subscribe("trigger", RECORDER_QUEUE_BLOCKS, DROP_NEVER,
+                                         put_timeout=RECORDER_PUT_TIMEOUT)
+            self.trigger_consumer = ConsumerThread(channel, lambda block: self.triggered.process(*block),
+                                                   name="egram-trigger")
+            self.egram_msg.config(text="Triggered capture armed: " + ", ".join(c.name for c in conditions),
+                                  foreground="green")
+        else:
+            self.stop_triggered()
+
+
+    def stop_triggered(self):
+        if self.triggered is None:
+            return
+        self.bus.unsubscribe("trigger")
+        if self.trigger_consumer is not None:
+            self.trigger_consumer.join()
+            self.trigger_consumer = None
+        triggered, self.triggered = self.triggered, None
+        triggered.close()
+        self.trigger_var.set(False)
+        self.egram_msg.config(text=f"Triggered capture: {triggered.triggers} triggers, "
+                                   f"{len(triggered.snippets)} snippets saved", foreground="blue")
+
+
+    def toggle_server(self):
+        if self.serve_var.get():
+            self.server = EgramServer(self.bus, DEFAULT_SOCKET, DEFAULT_WS_PORT)
+            if self.server.start():
+                self.egram_msg.config(text=f"Serving egram on {self.server.unix_path or ''} "
+                                           f"{self.server.ws_url}", foreground="green")
+                return
+            self.server = None
+            self.serve_var.set(False)
+            self.egram_msg.config(text="Could not start the egram server", foreground="red")
+        elif self.server is not None:
+            self.server.stop()
+            self.server = None
+            self.egram_msg.config(text="Egram server stopped", foreground="blue")
+
+
+    def toggle_qt_viewer(self):
+        if self.qt_var.get():
+            if self.qt_viewer is None:
+                self.qt_viewer = egram_qt.QtEgramViewer(self.bus, self.display.window)
+            self.qt_viewer.set_display(self.gain_var.get(), self.filter_var.get())
+            if not self.qt_viewer.start():
+                self.qt_var.set(False)
+                self.egram_msg.config(text="Qt viewer unavailable - install pyqtgraph", foreground="red")
+                return
+            self.egram_msg.config(text="Live egram drawn in the Qt viewer", foreground="green")
+        elif self.qt_viewer is not None:
+            self.qt_viewer.stop()
+            self.egram_msg.config(text="Qt viewer closed", foreground="blue")
+            self.update_plot()
+
+
+    def recorder_sink(self, block):
+        if self.recorder is not None:
+            self.recorder.extend(*block)
+
+
+    def stop_recording(self):
+        if self.recorder is None:
+            return
+        # let the consumer drain what is queued before closing the file
+        self.bus.unsubscribe("recorder")
+        if self.record_consumer is not None:
+            self.record_consumer.join()
+            self.record_consumer = None
+        with self.activity_lock:
+            recorder, self.recorder = self.recorder, None
+            activity_recorder, self.activity_recorder = self.activity_recorder, None
+        recorder.close()
+        if activity_recorder is not None:
+            activity_recorder.close()
+        self.last_capture = recorder.path
+        packet, echo, username, mode, device_id = self.session_state()
+        write_session(recorder.path, packet, echo, username, mode, device_id)
+        self.record_var.set(False)
+        self.egram_msg.config(text=f"Saved {recorder.samples} samples to {recorder.path}", foreground="blue")
+    
+    
+    # what a session report needs from the rest of the app: uploaded packet, board echo, user, mode, board id
+    def session_state(self):
+        device = parameters.pacemaker_comm.device
+        return (self.controller.uploaded_packet, self.controller.device_echo,
+                self.controller.current_user, self.controller.current_mode,
+                device.device_id if device is not None else None)
+
+
+    def make_report(self):
+        packet, echo, username, mode, _ = self.session_state()
+        capture = self.recorder.path if self.recorder is not None else self.last_capture
+        job = session_job(capture, packet, echo, username, mode)
+        self.reports.submit(job, lambda j, paths, error: self.after(0, lambda: self.on_report_done(j, paths, error)))
+        # a capture still being recorded is reported up to its last complete chunk
+        so_far = " (recording so far)" if self.recorder is not None else ""
+        self.egram_msg.config(text=f"Rendering report {job['name']}{so_far}...", foreground="blue")
+
+
+    def on_report_done(self, job, paths, error):
+        if error is not None:
+            self.egram_msg.config(text=f"Report {job['name']} failed: {error}", foreground="red")
+            return
+        self.egram_msg.config(text=f"Report saved to {paths.get('html') or next(iter(paths.values()))}",
+                              foreground="green")
+
+
     def clear_display(self):
-        self.time_data.clear()
-        self.atrial_data.clear()
-        self.ventricular_data.clear()
-        self.atrial_data_raw.clear()
-        self.ventricular_data_raw.clear()        
-        self.atrial_line.set_data([], [])
-        self.ax_atrial.set_xlim(0, self.display_window)
-        self.ax_vent.set_xlim(0, self.display_window)
-        self.ventricular_line.set_data([], [])
+        self.display.clear()
+        self.analysis_label.config(text="")
         self.canvas.draw()
         self.egram_msg.config(text="Display cleared", foreground="blue")
     
     
-    #Fetch from serial data
-    def fetch_egram_thread(self):
+    # Serial worker callbacks: just timestamp the reply and queue it for the decoder
+    def on_egram_packet(self, packet_data):
+        self.queue_raw("legacy", packet_data)
+
+
+    def on_egram_frame(self, frame):
+        self.queue_raw("frame", frame)
+
+
+    def queue_raw(self, kind, data):
         try:
-            # Clear serial buffer
-            if parameters.pacemaker_comm.ser.in_waiting > 0:
-                parameters.pacemaker_comm.ser.read(parameters.pacemaker_comm.ser.in_waiting)
-            
-            sample_count = 0
-            
-            echo_packet = self.build_echo_packet()
-            parameters.pacemaker_comm.ser.write(echo_packet)
-            print("Echo packet sent to start egram capture")
-            
-            while self.reading_egram:
-                if not self.controller.pacemaker_connected:
-                    self.after(0, lambda: self.egram_msg.config(
-                        text="Pacemaker disconnected",
-                        foreground="red"
-                    ))
-                    self.reading_egram = False
-                    break
-                
-                if parameters.pacemaker_comm.ser.in_waiting >= 32:
-                    packet_data = parameters.pacemaker_comm.ser.read(32)
-                    
-                    if len(packet_data) == 32:
-                        egram_bytes = packet_data[16:32]
-                        
-                        try:
-                            atrial_value = struct.unpack('<d', egram_bytes[0:8])[0]
-                            ventricular_value = struct.unpack('<d', egram_bytes[8:16])[0]
-                            
-                            current_time = time.time() - self.start_time
-                            
-                            self.after(0, lambda t=current_time, a=atrial_value, v=ventricular_value:
-                                       self.add_data_point(t, a, v))
-                            
-                            sample_count += 1
-                            print(f"Sample {sample_count}: Atrial={atrial_value:.6f}, Ventricular={ventricular_value:.6f}")
-                            
-                            self.after(0, self.update_plot)
-                            
-                            parameters.pacemaker_comm.ser.write(echo_packet)
-                        
-                        except struct.error as e:
-                            print(f"Error unpacking egram data: {e}")
-                
-                time.sleep(0.1)
-            
-            self.after(0, lambda c=sample_count: self.egram_msg.config(
-                text=f"Captured {c} egram samples",
-                foreground="green"
-            ))
-                
-        except Exception as e:
-            self.reading_egram = False
-            self.after(0, lambda: self.egram_msg.config(
-                text=f"Error reading egram: {str(e)}",
-                foreground="red"
-            ))
-            print(f"Egram thread error: {e}")
+            # the channel's short put timeout: a stuck decoder must not stall parameter commands on the worker
+            self.raw_channel.put((kind, data, time.monotonic()))
+        except ChannelClosed:
+            pass
+
+
+    # Decoder thread: raw reply -> (times, atrial, ventricular) block published to every consumer
+    def decode_raw(self, item):
+        kind, data, arrival = item
+        if kind == "legacy":
+            values = decode_legacy_packet(data)
+            if values is None:
+                return
+            times = np.array([arrival - self.start_time])
+            atrial, ventricular = np.array([values[0]]), np.array([values[1]])
+        else:
+            block = decode_frames(data, FRAME_SAMPLES, self.frame_channels, self.frame_markers)
+            if not block.valid[0]:
+                print(f"Dropped corrupt egram frame (seq {block.seq[0]})")
+                return
+            # device sequence numbers give a uniform, drift-corrected time base
+            times = self.timebase.place(block.seq[0], FRAME_SAMPLES, block.period_us[0], arrival) - self.start_time
+            atrial, ventricular = block.atrial, block.ventricular
+            if block.has_activity:
+                self.activity_ring.write(times, block.activity, block.sensor_rate)
+            if self.frame_markers:
+                event_times, codes = frame_events(block, times, FRAME_SAMPLES)
+                self.marker_ring.write(event_times, codes, np.zeros(codes.size))
+
+        self.sample_count += times.size
+        self.bus.publish((times, atrial, ventricular), samples=times.size)
+
+
+    # Activity ring -> (optional) recorder and the activity display queue, marker ring -> marker queue
+    def start_aux_pumps(self, activity_ring, marker_ring):
+        self.stop_aux_pumps()
+        self.activity_pump = RingPump(activity_ring, self.on_activity_block, interval=0.05)
+        self.marker_pump = RingPump(marker_ring, self.on_marker_block, interval=0.05)
+
+
+    def stop_aux_pumps(self):
+        for pump in (self.activity_pump, self.marker_pump):
+            if pump is not None:
+                pump.stop()
+        self.activity_pump = self.marker_pump = None
+
+
+    def on_marker_block(self, times, codes, _):
+        self.marker_channel.put((times, codes.astype(np.uint8)), samples=times.size)
+
+
+    def on_activity_block(self, times, activity, sensor_rate):
+        with self.activity_lock:
+            if self.recorder is not None:
+                # alongside the egram capture, created once activity data actually shows up
+                if self.activity_recorder is None:
+                    self.activity_recorder = EgramRecorder(activity_path(self.recorder.path), ACTIVITY_STORE_CHANNELS)
+                self.activity_recorder.extend(times, activity, sensor_rate)
+        self.activity_channel.put((times, activity, sensor_rate), samples=times.size)
+
+
+    # Tk timer: take whatever the decoder produced since the last tick and redraw once
+    def start_display_polling(self):
+        if not self.display_polling:
+            self.display_polling = True
+            self.after(DISPLAY_INTERVAL_MS, self.poll_display)
+
+
+    def poll_display(self):
+        blocks = self.display_channel.drain()
+        for times, atrial, ventricular in blocks:
+            self.add_data_block(times, atrial, ventricular)
+        for times, activity, sensor_rate in self.activity_channel.drain():
+            self.display.add_activity_block(times, activity, sensor_rate)
+        for times, codes in self.marker_channel.drain():
+            self.display.add_marker_block(times, codes)
+        if blocks:
+            self.update_plot()
+
+        if self.reading_egram or len(self.display_channel):
+            self.after(DISPLAY_INTERVAL_MS, self.poll_display)
+        else:
+            self.display_polling = False
+
+
+    # stream ended - either stopped by the user or the pacemaker went away
+    def on_egram_stopped(self, reason):
+        was_reading = self.reading_egram
+        self.reading_egram = False
+        if self.raw_channel is not None:
+            self.raw_channel.close()
+            # let the decoder finish writing to the activity/marker rings before the pumps' last read
+            if self.decoder is not None and not self.using_engine:
+                self.decoder.join(1.0)
+        self.stop_aux_pumps()
+        link = self.link_stats()
+        self.using_engine = False
+        if reason == "stopped":
+            text, colour = f"Captured {self.sample_count} egram samples", "green"
+            if link["frames"]:
+                text += f" ({link['lost_frames']} frames lost, {link['loss_rate'] * 100:.2f}%)"
+        else:
+            text, colour = f"Egram stopped: {reason}", "red"
+        if was_reading or reason != "stopped":
+            self.after(0, lambda: self.egram_msg.config(text=text, foreground=colour))
     
 
     # echo packet builder. will request egram data 
@@ -812,80 +1157,303 @@ class EgramPage(tk.Frame):
 
     # add data point
     def add_data_point(self, time_val, atrial_val, ventricular_val):
-        self.time_data.append(time_val)
-        
-        self.atrial_data_raw.append(atrial_val)
-        self.ventricular_data_raw.append(ventricular_val)
-        
-        gain = self.gain_var.get()
-        use_filter = self.filter_var.get()
-        
-        if use_filter and len(self.atrial_data_raw) and len(self.ventricular_data_raw) > 1:
-            # high pass filter implementation
-            atrial_filtered = (atrial_val - self.atrial_data_raw[-2]) / 2.0
-            ventricular_filtered = (ventricular_val - self.ventricular_data_raw[-2]) / 2.0
-            
-            self.atrial_data.append(atrial_filtered * gain)
-            self.ventricular_data.append(ventricular_filtered * gain)
-        else:
-            self.atrial_data.append(atrial_val * gain)
-            self.ventricular_data.append(ventricular_val * gain)
-        
-        # only keep track of up to 1000 samples
-        if len(self.time_data) > 1000:
-            self.time_data.pop(0)
-            self.atrial_data.pop(0)
-            self.ventricular_data.pop(0)
-            self.atrial_data_raw.pop(0)
-            self.ventricular_data_raw.pop(0)
+        self.add_data_block([time_val], [atrial_val], [ventricular_val])
 
 
-    # update the plot for every new point
+    # add a block of samples (one compact frame, or a single legacy sample)
+    def add_data_block(self, times, atrial, ventricular):
+        self.display.add_data_block(times, atrial, ventricular)
+
+
+    # redraw once per display tick (or when gain/filter/markers change)
     def update_plot(self):
         try:
-            if len(self.time_data) == 0:
+            qt_drawing = self.qt_viewer is not None and self.qt_viewer.running
+            if qt_drawing:
+                self.qt_viewer.set_display(self.gain_var.get(), self.filter_var.get())
+            elif self.qt_viewer is not None and self.qt_var.get():
+                # the Qt window was closed from its own side; drop its bus subscription and feed thread too
+                self.qt_var.set(False)
+                self.qt_viewer.stop()
+
+            # ARP/VRP are stored in units of 10 ms
+            params = parameters.pacemaker_params
+            refractory = (params.get_parameter("ARP") * 0.01, params.get_parameter("VRP") * 0.01)
+            latest_time = self.display.update(self.gain_var.get(), self.filter_var.get(),
+                                              self.markers_var.get(), refractory)
+            if latest_time is None:
                 return
-            
-            gain = self.gain_var.get()
-            use_filter = self.filter_var.get()
-            
-            self.atrial_data.clear()
-            self.ventricular_data.clear()
-            
-            for i in range(len(self.atrial_data_raw)):
-                # apply the filter
-                if use_filter and i > 0:
-                    a_f = (self.atrial_data_raw[i] - self.atrial_data_raw[i - 1]) / 2.0
-                    v_f = (self.ventricular_data_raw[i] - self.ventricular_data_raw[i - 1]) / 2.0
-                    
-                    # scale the FILTERED data point by the selected gain
-                    self.atrial_data.append(a_f * gain)
-                    self.ventricular_data.append(v_f * gain)
-                else:
-                    # scale the data point by the selected gain
-                    self.atrial_data.append(self.atrial_data_raw[i] * gain)
-                    self.ventricular_data.append(self.ventricular_data_raw[i] * gain)
-
-            self.atrial_line.set_data(self.time_data, self.atrial_data)
-            self.ventricular_line.set_data(self.time_data, self.ventricular_data)
+            # while the Qt window draws the traces, skip the Tk canvas (its draw() is the bottleneck)
+            if not qt_drawing:
+                self.canvas.draw()
 
-            latest_time = self.time_data[-1]
+            self.update_link_stats()
 
-            self.ax_atrial.set_xlim(latest_time - self.display_window, latest_time)
-            self.ax_vent.set_xlim(latest_time - self.display_window, latest_time)
-            self.canvas.draw()
+            # hand the raw window to the analysis process at most once per interval
+            now = time.monotonic()
+            if now - self.last_analysis >= self.analysis_interval:
+                self.last_analysis = now
+                self.submit_analysis(latest_time)
         
         except Exception as e:
             print(f"Plot update error: {e}")
-    
+
+
+    # frame loss/drift from whichever side is decoding: the capture process or our decoder thread
+    def link_stats(self):
+        if self.using_engine:
+            return self.engine.ring.stats()
+        return {"frames": self.timebase.frames, "lost_frames": self.timebase.lost_frames,
+                "loss_rate": self.timebase.loss_rate, "drift_ppm": self.timebase.drift_ppm}
+
+
+    # link loss plus what each pipeline queue has had to drop
+    def update_link_stats(self):
+        parts = []
+        link = self.link_stats()
+        if link["frames"]:
+            parts.append(f"Frames lost: {link['lost_frames']} ({link['loss_rate'] * 100:.2f}%)")
+            parts.append(f"Clock drift: {link['drift_ppm']:+.0f} ppm")
+        if self.pump is not None and self.pump.overruns:
+            parts.append(f"Ring overruns: {self.pump.overruns} samples")
+        if self.qt_viewer is not None and self.qt_viewer.running:
+            parts.append(f"Qt viewer: {self.qt_viewer.fps:.0f} fps")
+        display = self.display_channel.stats()
+        parts.append(f"Display dropped: {display['dropped_samples']} samples")
+        if self.raw_channel is not None and self.raw_channel.dropped_samples:
+            parts.append(f"Raw dropped: {self.raw_channel.dropped_samples} samples")
+        bus = self.bus.stats()
+        for name in ("recorder", "trigger"):
+            stats = bus.get(name)
+            if stats is None:
+                continue
+            text = f"{name.capitalize()} queue: {stats['depth']}/{stats['maxsize']}"
+            if stats["dropped_samples"]:
+                text += f" ({stats['dropped_samples']} samples dropped)"
+            parts.append(text)
+        if self.server is not None:
+            clients = self.server.stats()["clients"]
+            dropped = sum(c["dropped"] for c in clients.values())
+            parts.append(f"Clients: {len(clients)} ({dropped} blocks dropped)")
+        self.link_label.config(text="   ".join(parts))
+
+
+    # analyze the last analysis_window seconds straight from the pyramids' raw level
+    def submit_analysis(self, latest_time):
+        self.analyzer.submit(*self.display.recent(self.analysis_window))
+
+
+    # called from the analyzer's callback thread
+    def on_analysis_result(self, result):
+        self.after(0, lambda r=result: self.show_analysis(r))
+
+
+    def show_analysis(self, result):
+        self.display.show_beats(result)
+        parts = []
+        for name in ("atrial", "ventricular"):
+            channel = result[name]
+            rate = f"{channel['rate']:.0f} bpm" if channel["rate"] else "--"
+            text = f"{name.capitalize()}: {rate}"
+            if channel["capture"] is not None:
+                text += f", capture {channel['capture'] * 100:.0f}%"
+            parts.append(text)
+
+        self.analysis_label.config(text="   ".join(parts))
+        self.canvas.draw_idle()
+
+
+    def destroy(self):
+        if self.raw_channel is not None:
+            self.raw_channel.close()
+        self.stop_recording()
+        self.stop_triggered()
+        if self.server is not None:
+            self.server.stop()
+        if self.qt_viewer is not None:
+            self.qt_viewer.close()
+        self.stop_aux_pumps()
+        if self.engine is not None:
+            self.engine.close()
+        self.activity_ring.close()
+        self.marker_ring.close()
+        self.analyzer.close()
+        self.reports.close(wait=False)
+        super().destroy()
+
     def go_back(self):
         if self.reading_egram:
             self.stop_egram()
-            time.sleep(0.5)
         
         self.controller.show_frame(ModeSelectPage)
 
 
+class HistoryPage(tk.Frame):
+    """Pan/zoom over recorded captures, reading only the visible range from disk"""
+
+    def __init__(self, parent, controller):
+        super().__init__(parent)
+        self.controller = controller
+
+        ttk.Label(self, text="Egram Recordings", font=("Arial", 14)).pack(pady=10)
+
+        self.history_msg = ttk.Label(self, text="", foreground="red")
+        self.history_msg.pack(pady=5)
+
+        # Capture picker
+        file_frame = tk.Frame(self)
+        file_frame.pack(pady=5)
+        self.capture_select = ttk.Combobox(file_frame, values=[], width=40, state="readonly")
+        self.capture_select.pack(side="left", padx=5)
+        ttk.Button(file_frame, text="Refresh", command=self.refresh_captures).pack(side="left", padx=5)
+        ttk.Button(file_frame, text="Open", command=self.open_capture).pack(side="left", padx=5)
+
+        # Zoom controls
+        zoom_frame = tk.Frame(self)
+        zoom_frame.pack(pady=5)
+        ttk.Button(zoom_frame, text="Zoom In", command=lambda: self.zoom(0.5)).pack(side="left", padx=5)
+        ttk.Button(zoom_frame, text="Zoom Out", command=lambda: self.zoom(2.0)).pack(side="left", padx=5)
+        ttk.Button(zoom_frame, text="Show All", command=self.show_all).pack(side="left", padx=5)
+        self.range_label = ttk.Label(zoom_frame, text="")
+        self.range_label.pack(side="left", padx=10)
+
+        ttk.Button(self, text="Back to Egram", command=lambda: controller.show_frame(EgramPage)).pack(pady=5)
+
+        # Same layout as the live page; the activity strip stays empty for egram-only captures
+        self.fig = Figure(figsize=(6, 6), dpi=100)
+        grid = self.fig.add_gridspec(3, 1, height_ratios=(2, 2, 1))
+        self.ax_atrial = self.fig.add_subplot(grid[0])
+        self.ax_vent = self.fig.add_subplot(grid[1], sharex=self.ax_atrial)
+        self.ax_activity = self.fig.add_subplot(grid[2], sharex=self.ax_atrial)
+        self.ax_rate = self.ax_activity.twinx()
+        self.ax_atrial.set_title('Atrial Data', fontsize=10)
+        self.ax_atrial.set_ylabel('Amplitude', fontsize=8)
+        self.ax_atrial.grid(True, alpha=0.3)
+        self.ax_vent.set_title('Ventricular Data', fontsize=10)
+        self.ax_vent.set_ylabel('Amplitude', fontsize=8)
+        self.ax_vent.grid(True, alpha=0.3)
+        self.ax_activity.set_xlabel('Time (s)', fontsize=8)
+        self.ax_activity.set_ylabel('Activity', fontsize=8)
+        self.ax_activity.grid(True, alpha=0.3)
+        self.ax_rate.set_ylabel('Sensor rate (ppm)', fontsize=8)
+        self.ax_rate.set_ylim(30, 180)
+        self.activity_line, = self.ax_activity.plot([], [], 'g-', linewidth=1)
+        self.sensor_rate_line, = self.ax_rate.plot([], [], 'm-', linewidth=1.5)
+        self.atrial_line, = self.ax_atrial.plot([], [], 'b-', linewidth=1)
+        self.ventricular_line, = self.ax_vent.plot([], [], 'r-', linewidth=1)
+        self.fig.tight_layout()
+
+        self.canvas = FigureCanvasTkAgg(self.fig, master=self)
+        self.canvas.draw()
+        self.canvas.mpl_connect("scroll_event", self.on_scroll)
+
+        # Scrollbar position = start of the view as a fraction of the capture
+        self.scroll = ttk.Scale(self, from_=0.0, to=1.0, orient="horizontal", command=self.on_scrollbar)
+        self.scroll.pack(fill="x", padx=10)
+        self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+
+        self.history = None
+        self.activity_history = None
+        self.view_start = 0.0
+        self.view_span = 10.0
+        self.redraw_pending = False
+
+        self.refresh_captures()
+        controller.apply_fonts(self)
+
+    def refresh_captures(self):
+        captures = list_captures()
+        self.capture_select.config(values=captures)
+        if captures and not self.capture_select.get():
+            self.capture_select.set(captures[-1])
+
+    def open_capture(self):
+        name = self.capture_select.get()
+        if not name:
+            self.history_msg.config(text="No recording selected", foreground="red")
+            return
+        if self.history is not None:
+            self.history.close()
+        if self.activity_history is not None:
+            self.activity_history.close()
+            self.activity_history = None
+        path = os.path.join(CAPTURE_DIR, name)
+        self.history = open_capture(path)
+        if os.path.exists(activity_path(path)):
+            self.activity_history = open_capture(activity_path(path), channels=ACTIVITY_STORE_CHANNELS)
+        self.activity_line.set_data([], [])
+        self.sensor_rate_line.set_data([], [])
+        if self.history.chunks == 0:
+            self.history_msg.config(text="Recording is empty", foreground="red")
+            return
+        self.history_msg.config(
+            text=f"{self.history.samples} samples, {self.history.end - self.history.start:.1f} s",
+            foreground="green")
+        self.show_all()
+
+    def show_all(self):
+        if self.history is None:
+            return
+        self.set_view(self.history.start, max(self.history.end - self.history.start, 1e-3))
+
+    def zoom(self, factor, centre=None):
+        if self.history is None:
+            return
+        if centre is None:
+            centre = self.view_start + self.view_span / 2
+        span = self.view_span * factor
+        self.set_view(centre - (centre - self.view_start) * factor, span)
+
+    def on_scroll(self, event):
+        # mouse wheel zooms around the cursor
+        if event.xdata is None:
+            return
+        self.zoom(0.8 if event.button == "up" else 1.25, centre=event.xdata)
+
+    def on_scrollbar(self, value):
+        if self.history is None:
+            return
+        total = self.history.end - self.history.start
+        start = self.history.start + float(value) * max(total - self.view_span, 0.0)
+        self.set_view(start, self.view_span, move_scrollbar=False)
+
+    def set_view(self, start, span, move_scrollbar=True):
+        total = self.history.end - self.history.start
+        self.view_span = min(max(span, 1e-3), max(total, 1e-3))
+        self.view_start = min(max(start, self.history.start), self.history.end - self.view_span)
+        if move_scrollbar and total > self.view_span:
+            self.scroll.set((self.view_start - self.history.start) / (total - self.view_span))
+        # coalesce bursts of scroll events into one redraw
+        if not self.redraw_pending:
+            self.redraw_pending = True
+            self.after_idle(self.redraw)
+
+    def redraw(self):
+        self.redraw_pending = False
+        if self.history is None:
+            return
+        start, end = self.view_start, self.view_start + self.view_span
+        view = self.history.view(start, end, int(self.ax_atrial.bbox.width))
+
+        self.atrial_line.set_data(*view["atrial"])
+        self.ventricular_line.set_data(*view["ventricular"])
+        self.ax_atrial.set_xlim(start, end)
+        for ax, (_, ys) in ((self.ax_atrial, view["atrial"]), (self.ax_vent, view["ventricular"])):
+            if len(ys):
+                lo, hi = float(np.min(ys)), float(np.max(ys))
+                pad = (hi - lo) * 0.1 or 1.0
+                ax.set_ylim(lo - pad, hi + pad)
+        if self.activity_history is not None and self.activity_history.chunks:
+            activity = self.activity_history.view(start, end, int(self.ax_activity.bbox.width))
+            xs, ys = activity["activity"]
+            self.activity_line.set_data(xs, ys)
+            self.sensor_rate_line.set_data(*activity["sensor_rate"])
+            if len(ys):
+                pad = max(1.0, 0.1 * float(np.max(ys) - np.min(ys)))
+                self.ax_activity.set_ylim(float(np.min(ys)) - pad, float(np.max(ys)) + pad)
+        self.range_label.config(text=f"{start:.2f}s - {end:.2f}s")
+        self.canvas.draw_idle()
+
 
 if __name__ == "__main__":
     app = Main()
@@ -0,0 +1,288 @@
+import itertools
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+from egram_markers import AP, AR, AS, VP, VR, VS
+from parameters import ACTIVITY_MAP, MODE_PARAMETER_LAYOUT, PARAMETER_RULES
+
+# Used when a profile leaves a parameter out (e.g. ARP in AOO)
+DEFAULT_REFRACTORY_MS = 250
+DEFAULT_SENSITIVITY_MV = 2.5
+
+
+def _number(value) -> float:
+    """Profile values may be numbers or the strings the parameter form saved"""
+    if isinstance(value, str) and value in ACTIVITY_MAP:
+        return float(ACTIVITY_MAP[value])
+    return float(value)
+
+
+class PacingConfig:
+    """
+    Timing-relevant subset of one mode's parameters, in seconds and mV.
+
+    Only single-chamber modes exist in MODE_PARAMETER_LAYOUT, so there is no
+    AV delay here: the chamber in the mode name is both paced and sensed.
+    """
+
+    def __init__(self, mode: str, params: dict):
+        if mode not in MODE_PARAMETER_LAYOUT:
+            raise ValueError(f"Unknown mode '{mode}'. Must be one of: {list(MODE_PARAMETER_LAYOUT)}")
+        self.mode = mode
+        self.chamber = "atrial" if mode[0] == "A" else "ventricular"
+        # second letter is the sensed chamber, O = asynchronous
+        self.inhibited = mode[1] != "O"
+        self.rate_adaptive = mode.endswith("R")
+
+        def get(name, default):
+            value = params.get(name)
+            return default if value in (None, "", "—") else _number(value)
+
+        self.lrl = get("Lower Rate Limit", PARAMETER_RULES["Lower Rate Limit"][0])
+        self.url = get("Upper Rate Limit", PARAMETER_RULES["Upper Rate Limit"][1])
+        self.msr = get("Maximum Sensor Rate", self.url)
+        prefix = "Atrial" if self.chamber == "atrial" else "Ventricular"
+        refractory = "ARP" if self.chamber == "atrial" else "VRP"
+        self.refractory = get(refractory, DEFAULT_REFRACTORY_MS) / 1000.0
+        self.sensitivity = get(f"{prefix} Sensitivity", DEFAULT_SENSITIVITY_MV)
+
+    @property
+    def max_rate(self) -> float:
+        """Fastest the device will ever pace"""
+        return self.msr if self.rate_adaptive else self.url
+
+    def escape_interval(self, rate: Optional[float] = None) -> float:
+        """Pacing interval at a sensor-indicated rate (LRL when there is no sensor input)"""
+        rate = self.lrl if rate is None else min(max(rate, self.lrl), self.max_rate)
+        return 60.0 / rate
+
+
+class SimulationResult:
+    """Pace/sense events produced by a simulation, coded like egram markers"""
+
+    def __init__(self, times: np.ndarray, codes: np.ndarray, start: float, end: float):
+        self.times = times
+        self.codes = codes
+        self.start = start
+        self.end = end
+
+    def count(self, *codes: int) -> int:
+        return int(np.isin(self.codes, codes).sum())
+
+    def summary(self) -> Dict[str, float]:
+        paces = self.count(AP, VP)
+        senses = self.count(AS, VS)
+        duration = max(self.end - self.start, 1e-9)
+        beats = paces + senses
+        return {
+            "paces": paces,
+            "senses": senses,
+            "refractory_senses": self.count(AR, VR),
+            "paced_fraction": paces / beats if beats else 0.0,
+            "mean_rate": 60.0 * beats / duration,
+        }
+
+
+def detect_senses(t: np.ndarray, x: np.ndarray, sensitivity: float) -> np.ndarray:
+    """Times where |x| first rises to the sensitivity threshold (vectorized)"""
+    if x.size < 2 or sensitivity <= 0:
+        return np.empty(0)
+    above = np.abs(x) >= sensitivity
+    onsets = np.flatnonzero(above[1:] & ~above[:-1]) + 1
+    if above[0]:
+        onsets = np.concatenate(([0], onsets))
+    return t[onsets]
+
+
+def simulate(mode: str, params: dict, t: np.ndarray, atrial: np.ndarray, ventricular: np.ndarray,
+             sensor_rate: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> SimulationResult:
+    """
+    Run the pacing timing logic over an intrinsic egram
+
+    Event-driven: work is proportional to the number of sensed events and
+    paces, not samples, once the sense candidates have been found.
+
+    Args:
+        mode: any key of MODE_PARAMETER_LAYOUT
+        params: that mode's parameters, as stored by user_db
+        t, atrial, ventricular: intrinsic signal (s, mV)
+        sensor_rate: optional (times, ppm) trace for R modes, e.g. a recorded
+                     sensor-indicated rate; R modes pace at LRL without it
+
+    Returns:
+        SimulationResult: event times and marker codes
+    """
+    config = PacingConfig(mode, params)
+    return simulate_config(config, t, atrial if config.chamber == "atrial" else ventricular, sensor_rate)
+
+
+def simulate_config(config: PacingConfig, t: np.ndarray, x: np.ndarray,
+                    sensor_rate: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> SimulationResult:
+    start, end = float(t[0]), float(t[-1])
+    pace_code, sense_code, refractory_code = (AP, AS, AR) if config.chamber == "atrial" else (VP, VS, VR)
+
+    use_sensor = config.rate_adaptive and sensor_rate is not None
+    if use_sensor:
+        sensor_t, sensor_ppm = (np.asarray(a, dtype=float) for a in sensor_rate)
+
+    def escape(at: float) -> float:
+        if use_sensor:
+            return config.escape_interval(float(np.interp(at, sensor_t, sensor_ppm)))
+        return config.escape_interval()
+
+    senses = detect_senses(t, x, config.sensitivity) if config.inhibited else np.empty(0)
+    times, codes = [], []
+    # every pacing cycle starts from the last pace or non-refractory sense
+    last = start
+    last_event = start
+
+    def pace_until(limit: float):
+        nonlocal last, last_event
+        if not use_sensor:
+            # fixed escape interval: all paces in the gap at once
+            interval = escape(last)
+            count = int(np.floor((limit - last) / interval + 1e-9))
+            if count > 0:
+                paces = last + interval * np.arange(1, count + 1)
+                times.append(paces)
+                codes.append(np.full(count, pace_code, dtype=np.uint8))
+                last = last_event = float(paces[-1])
+            return
+        while True:
+            due = last + escape(last)
+            if due > limit:
+                return
+            times.append(np.array([due]))
+            codes.append(np.array([pace_code], dtype=np.uint8))
+            last = last_event = due
+
+    for s in senses:
+        pace_until(s)
+        if s - last_event < config.refractory:
+            times.append(np.array([s]))
+            codes.append(np.array([refractory_code], dtype=np.uint8))
+        else:
+            times.append(np.array([s]))
+            codes.append(np.array([sense_code], dtype=np.uint8))
+            last = last_event = s
+    pace_until(end)
+
+    if not times:
+        return SimulationResult(np.empty(0), np.empty(0, dtype=np.uint8), start, end)
+    times = np.concatenate(times)
+    codes = np.concatenate(codes)
+    order = np.argsort(times, kind="stable")
+    return SimulationResult(times[order], codes[order], start, end)
+
+
+def sweep(mode: str, base_params: dict, grid: Dict[str, Iterable], t: np.ndarray,
+          atrial: np.ndarray, ventricular: np.ndarray) -> np.ndarray:
+    """
+    Simulate every combination of the parameter values in grid
+
+    Combinations sharing a sensitivity share one sense detection and are then
+    advanced together, one numpy step per sensed event, instead of one Python
+    loop per combination. R modes without a sensor trace pace exactly like
+    their non-R counterparts, so they sweep the same way.
+
+    Returns:
+        np.ndarray: structured array, one row per combination, with a column
+                    per swept parameter plus paces/senses/refractory_senses/
+                    paced_fraction/mean_rate
+    """
+    names = list(grid)
+    combos = np.array(list(itertools.product(*[[_number(v) for v in grid[n]] for n in names])), dtype=float)
+    if combos.size == 0:
+        combos = np.empty((0, len(names)))
+    fields = [(name, "<f8") for name in names] + [
+        ("paces", "<i8"), ("senses", "<i8"), ("refractory_senses", "<i8"),
+        ("paced_fraction", "<f8"), ("mean_rate", "<f8")]
+    out = np.zeros(len(combos), dtype=fields)
+    for i, name in enumerate(names):
+        out[name] = combos[:, i]
+    if len(combos) == 0:
+        return out
+
+    configs = [PacingConfig(mode, {**base_params, **dict(zip(names, row))}) for row in combos]
+    x = atrial if configs[0].chamber == "atrial" else ventricular
+    start, end = float(t[0]), float(t[-1])
+    interval = np.array([c.escape_interval() for c in configs])
+    refractory = np.array([c.refractory for c in configs])
+    sensitivity = np.array([c.sensitivity for c in configs])
+
+    paces = np.zeros(len(configs), dtype=np.int64)
+    senses = np.zeros(len(configs), dtype=np.int64)
+    refractory_senses = np.zeros(len(configs), dtype=np.int64)
+    groups = np.unique(sensitivity) if configs[0].inhibited else [None]
+    for level in groups:
+        rows = np.arange(len(configs)) if level is None else np.flatnonzero(sensitivity == level)
+        esc, refr = interval[rows], refractory[rows]
+        last = np.full(rows.size, start)
+        candidates = detect_senses(t, x, level) if level is not None else np.empty(0)
+        group_paces = np.zeros(rows.size, dtype=np.int64)
+        group_senses = np.zeros(rows.size, dtype=np.int64)
+        group_refractory = np.zeros(rows.size, dtype=np.int64)
+        for s in candidates:
+            due = np.maximum(np.floor((s - last) / esc + 1e-9), 0)
+            group_paces += due.astype(np.int64)
+            last_event = last + due * esc
+            in_refractory = (s - last_event) < refr
+            group_refractory += in_refractory
+            group_senses += ~in_refractory
+            last = np.where(in_refractory, last_event, s)
+        group_paces += np.maximum(np.floor((end - last) / esc + 1e-9), 0).astype(np.int64)
+        paces[rows] = group_paces
+        senses[rows] = group_senses
+        refractory_senses[rows] = group_refractory
+
+    beats = paces + senses
+    out["paces"] = paces
+    out["senses"] = senses
+    out["refractory_senses"] = refractory_senses
+    out["paced_fraction"] = np.where(beats > 0, paces / np.maximum(beats, 1), 0.0)
+    out["mean_rate"] = 60.0 * beats / max(end - start, 1e-9)
+    return out
+
+
+def synthetic_egram(duration: float, rate: float = 70.0, fs: float = 1000.0, amplitude: float = 3.0,
+                    variability: float = 0.05, pause_probability: float = 0.05,
+                    seed: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Intrinsic rhythm for what-if runs: beats at `rate` with beat-to-beat
+    variability and occasional dropped beats (pauses) so inhibited modes
+    have something to pace through.
+
+    Returns:
+        (t, atrial, ventricular) sampled at fs
+    """
+    rng = np.random.default_rng(seed)
+    n = int(duration * fs)
+    t = np.arange(n) / fs
+    mean_interval = 60.0 / rate
+    count = int(duration / mean_interval * 1.2) + 2
+    intervals = mean_interval * (1 + variability * rng.standard_normal(count))
+    beats = np.cumsum(np.clip(intervals, 0.2 * mean_interval, None))
+    beats = beats[(beats < duration) & (rng.random(beats.size) >= pause_probability)]
+
+    # short biphasic deflection per beat, P wave on atrial and QRS (160 ms later) on ventricular
+    shape = np.concatenate((np.hanning(int(0.02 * fs) or 1), -0.4 * np.hanning(int(0.03 * fs) or 1)))
+    atrial = np.zeros(n)
+    ventricular = np.zeros(n)
+    for signal, offset, scale in ((atrial, 0.0, 0.5), (ventricular, 0.16, 1.0)):
+        starts = np.round((beats + offset) * fs).astype(int)
+        starts = starts[starts + shape.size < n]
+        index = (starts[:, None] + np.arange(shape.size)).ravel()
+        np.add.at(signal, index, np.tile(shape * amplitude * scale, starts.size))
+    return t, atrial, ventricular
+
+
+def load_capture(path: str, t0: Optional[float] = None, t1: Optional[float] = None):
+    """(t, atrial, ventricular) from a recorded capture, optionally limited to [t0, t1]"""
+    from egram_store import open_capture
+    history = open_capture(path)
+    try:
+        data = history.samples_between(history.start if t0 is None else t0, history.end if t1 is None else t1)
+    finally:
+        history.close()
+    return data["t"], data["atrial"], data["ventricular"]
@@ -0,0 +1,195 @@
+import json
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+HISTORY_PATH = "data/history.db"
+
+PROFILE = "profile"   # a mode's values saved to a user's profile
+UPLOAD = "upload"     # a mode's values sent to a board
+
+# One row per saved/uploaded mode. Rows are never changed or removed: the
+# triggers make that an error. Every query below is a range scan on one of
+# the indexes, so none of them reads more history than it returns.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS versions (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    username TEXT NOT NULL,
+    device_id TEXT,
+    kind TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    params TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS versions_user ON versions (username, kind, mode, ts);
+CREATE INDEX IF NOT EXISTS versions_device ON versions (device_id, ts);
+CREATE INDEX IF NOT EXISTS versions_kind ON versions (kind, mode, ts);
+CREATE TRIGGER IF NOT EXISTS versions_no_update BEFORE UPDATE ON versions
+BEGIN SELECT RAISE(ABORT, 'parameter history is append-only'); END;
+CREATE TRIGGER IF NOT EXISTS versions_no_delete BEFORE DELETE ON versions
+BEGIN SELECT RAISE(ABORT, 'parameter history is append-only'); END;
+"""
+
+
+def _normalize(value):
+    """Profiles hold "30" next to 30; store numbers as numbers so they compare equal"""
+    if isinstance(value, str):
+        try:
+            value = float(value)
+        except ValueError:
+            return value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def _encode(params: dict) -> str:
+    return json.dumps({name: _normalize(value) for name, value in params.items()}, sort_keys=True)
+
+
+class Version:
+    """One row of the history"""
+
+    def __init__(self, row: tuple):
+        self.id, self.ts, self.username, self.device_id, self.kind, self.mode, params = row
+        self.params = json.loads(params)
+
+    def __repr__(self):
+        when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.ts))
+        return f"Version({self.id}, {self.kind} {self.mode} by {self.username} at {when})"
+
+
+def diff(old: dict, new: dict) -> Dict[str, Tuple[object, object]]:
+    """{parameter: (old value, new value)} for every parameter that differs; missing values are None"""
+    return {name: (old.get(name), new.get(name))
+            for name in sorted(set(old) | set(new)) if old.get(name) != new.get(name)}
+
+
+class ParameterHistory:
+    """
+    Append-only record of profile saves and device uploads, per user and device.
+
+    Backed by SQLite so history can grow to millions of rows without ever
+    being loaded whole. Safe to share between threads.
+    """
+
+    COLUMNS = "id, ts, username, device_id, kind, mode, params"
+
+    def __init__(self, path: str = HISTORY_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _query(self, sql: str, args: tuple = ()) -> List[Version]:
+        with self._lock:
+            rows = self._db.execute(sql, args).fetchall()
+        return [Version(row) for row in rows]
+
+    def _append(self, rows: List[tuple]):
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT INTO versions (ts, username, device_id, kind, mode, params) VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+    # Recording
+    def record_profile(self, username: str, profile: Dict[str, dict], ts: Optional[float] = None) -> int:
+        """
+        Append a version for each mode of profile that differs from the latest saved one
+
+        Returns:
+            int: number of modes that changed
+        """
+        ts = time.time() if ts is None else ts
+        rows = []
+        for mode, params in profile.items():
+            encoded = _encode(params)
+            latest = self.latest(username, mode)
+            if latest is None or _encode(latest.params) != encoded:
+                rows.append((ts, username, None, PROFILE, mode, encoded))
+        if rows:
+            self._append(rows)
+        return len(rows)
+
+    def record_upload(self, username: str, device_id: Optional[str], mode: str, params: dict,
+                      ts: Optional[float] = None):
+        """Append an upload of one mode's values to a board (device_id None if it wasn't identified)"""
+        ts = time.time() if ts is None else ts
+        self._append([(ts, username, device_id, UPLOAD, mode, _encode(params))])
+
+    # Queries
+    def get(self, version_id: int) -> Optional[Version]:
+        found = self._query(f"SELECT {self.COLUMNS} FROM versions WHERE id = ?", (version_id,))
+        return found[0] if found else None
+
+    def latest(self, username: str, mode: str, kind: str = PROFILE, at: float = float("inf")) -> Optional[Version]:
+        """The user's last version of mode at or before `at`"""
+        found = self._query(
+            f"SELECT {self.COLUMNS} FROM versions WHERE username = ? AND kind = ? AND mode = ? AND ts <= ? "
+            "ORDER BY ts DESC, id DESC LIMIT 1", (username, kind, mode, at))
+        return found[0] if found else None
+
+    def as_of(self, username: str, at: float, kind: str = PROFILE) -> Dict[str, dict]:
+        """The user's profile (or last upload per mode) as it stood at time `at`: {mode: params}"""
+        with self._lock:
+            modes = [row[0] for row in self._db.execute(
+                "SELECT DISTINCT mode FROM versions WHERE username = ? AND kind = ?", (username, kind))]
+        state = {}
+        for mode in modes:
+            version = self.latest(username, mode, kind, at)
+            if version is not None:
+                state[mode] = version.params
+        return state
+
+    def diff_versions(self, old_id: int, new_id: int) -> Dict[str, Tuple[object, object]]:
+        old, new = self.get(old_id), self.get(new_id)
+        if old is None or new is None:
+            raise KeyError(f"No such version: {old_id if old is None else new_id}")
+        return diff(old.params, new.params)
+
+    def versions(self, username: str, mode: str, kind: str = PROFILE, since: float = 0.0,
+                 until: float = float("inf"), limit: int = 1000) -> List[Version]:
+        """The user's versions of mode in [since, until], newest first"""
+        return self._query(
+            f"SELECT {self.COLUMNS} FROM versions WHERE username = ? AND kind = ? AND mode = ? "
+            "AND ts BETWEEN ? AND ? ORDER BY ts DESC, id DESC LIMIT ?", (username, kind, mode, since, until, limit))
+
+    def uploads(self, mode: Optional[str] = None, since: float = 0.0, until: float = float("inf"),
+                device_id: Optional[str] = None, limit: int = 1000) -> List[Version]:
+        """Uploads, newest first, optionally for one mode and/or one board"""
+        if device_id is not None:
+            sql = "device_id = ? AND kind = ? AND ts BETWEEN ? AND ?"
+            args = [device_id, UPLOAD, since, until]
+            if mode is not None:
+                sql += " AND mode = ?"
+                args.append(mode)
+        elif mode is not None:
+            sql, args = "kind = ? AND mode = ? AND ts BETWEEN ? AND ?", [UPLOAD, mode, since, until]
+        else:
+            sql, args = "kind = ? AND ts BETWEEN ? AND ?", [UPLOAD, since, until]
+        return self._query(f"SELECT {self.COLUMNS} FROM versions WHERE {sql} ORDER BY ts DESC, id DESC LIMIT ?",
+                           tuple(args) + (limit,))
+
+
+def week_start(now: Optional[float] = None) -> float:
+    """Local midnight on the most recent Monday, for "this week" queries"""
+    now = time.time() if now is None else now
+    day = time.localtime(now)
+    # mktime normalizes a day-of-month below 1 into the previous month
+    return time.mktime((day.tm_year, day.tm_mon, day.tm_mday - day.tm_wday, 0, 0, 0, 0, 0, -1))
+
+
+_default = None
+
+
+def default_history() -> ParameterHistory:
+    """Shared history next to the user database, opened on first use"""
+    global _default
+    if _default is None:
+        _default = ParameterHistory()
+    return _default
@@ -0,0 +1,225 @@
+import itertools
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from parameters import ACTIVITY_MAP, MODE_PARAMETER_LAYOUT, PARAMETER_RULES, REVERSE_ACTIVITY_MAP
+
+# Step of each parameter's legal values (form units: ppm, V, ms, mV, s, min).
+# Ranges come from PARAMETER_RULES; Activity Threshold is its ACTIVITY_MAP index.
+PARAMETER_STEPS = {
+    "Lower Rate Limit": 5,
+    "Upper Rate Limit": 5,
+    "Maximum Sensor Rate": 5,
+    "Fixed AV Delay": 10,
+    "Atrial Amplitude": 0.1,
+    "Ventricular Amplitude": 0.1,
+    "Atrial Pulse Width": 1,
+    "Ventricular Pulse Width": 1,
+    "Atrial Sensitivity": 0.1,
+    "Ventricular Sensitivity": 0.1,
+    "ARP": 10,
+    "VRP": 10,
+    "Activity Threshold": 1,
+    "Reaction Time": 10,
+    "Response Factor": 1,
+    "Recovery Time": 1,
+}
+
+# (parameter, must be >= parameter), checked wherever both are in a mode
+CROSS_FIELD_RULES = (
+    ("Upper Rate Limit", "Lower Rate Limit"),
+    ("Maximum Sensor Rate", "Lower Rate Limit"),
+)
+
+# Tolerance when deciding whether a value sits on the grid
+ON_GRID = 1e-6
+
+
+class Axis:
+    """One parameter's legal values: start + step * i for i in range(size)"""
+
+    def __init__(self, name: str):
+        self.name = name
+        rule = PARAMETER_RULES[name]
+        if name == "Activity Threshold":
+            low, high = 0, len(rule) - 1
+        else:
+            low, high = rule
+        self.step = PARAMETER_STEPS[name]
+        self.start = low
+        self.size = int(np.floor((high - low) / self.step + ON_GRID)) + 1
+
+    @property
+    def values(self) -> np.ndarray:
+        return np.round(self.start + self.step * np.arange(self.size), 6)
+
+    def display_values(self) -> list:
+        """Values as the form's dropdown lists them"""
+        if self.name == "Activity Threshold":
+            return [REVERSE_ACTIVITY_MAP[i] for i in range(self.size)]
+        values = self.values
+        if float(self.step).is_integer():
+            return [int(v) for v in values]
+        return [round(float(v), 1) for v in values]
+
+    def to_number(self, value) -> float:
+        if self.name == "Activity Threshold" and isinstance(value, str) and value in ACTIVITY_MAP:
+            return float(ACTIVITY_MAP[value])
+        return float(value)
+
+    def index(self, value) -> Optional[int]:
+        """Grid index of value, None if value isn't on the grid"""
+        position = (self.to_number(value) - self.start) / self.step
+        i = int(round(position))
+        if abs(position - i) > ON_GRID or not 0 <= i < self.size:
+            return None
+        return i
+
+    def snap_index(self, value) -> int:
+        return int(np.clip(np.round((self.to_number(value) - self.start) / self.step), 0, self.size - 1))
+
+    def value(self, index: int):
+        if self.name == "Activity Threshold":
+            return REVERSE_ACTIVITY_MAP[index]
+        value = round(self.start + self.step * index, 6)
+        return int(value) if float(self.step).is_integer() else value
+
+
+class ModeLattice:
+    """
+    Legal parameter combinations for one mode.
+
+    Each axis is an arithmetic grid, so membership and snapping are a
+    division and a round per parameter; cross-field rules are resolved once
+    into the pairs that apply to this mode. Combinations can also be ranked
+    (mixed radix over the axes) to walk or sample the space.
+    """
+
+    def __init__(self, mode: str):
+        if mode not in MODE_PARAMETER_LAYOUT:
+            raise ValueError(f"Unknown mode '{mode}'. Must be one of: {list(MODE_PARAMETER_LAYOUT)}")
+        self.mode = mode
+        self.names: List[str] = list(MODE_PARAMETER_LAYOUT[mode])
+        self.axes: Dict[str, Axis] = {name: AXES[name] for name in self.names}
+        self.rules: List[Tuple[str, str]] = [(high, low) for high, low in CROSS_FIELD_RULES
+                                             if high in self.axes and low in self.axes]
+        self.sizes = np.array([self.axes[n].size for n in self.names], dtype=np.int64)
+        # rank strides, last parameter varies fastest
+        self.strides = np.concatenate((np.cumprod(self.sizes[::-1])[::-1][1:], [1]))
+
+    # Membership and validation
+    def contains(self, params: dict) -> bool:
+        return self.validate(params)[0]
+
+    def validate(self, params: dict) -> Tuple[bool, str]:
+        """(ok, message) for one form's worth of values"""
+        numbers = {}
+        for name, axis in self.axes.items():
+            value = params.get(name)
+            if value in (None, ""):
+                return False, f"Please enter value for {name}"
+            try:
+                index = axis.index(value)
+            except (TypeError, ValueError):
+                return False, f"{name} must be numeric."
+            if index is None:
+                return False, f"{name} must be one of {axis.value(0)}..{axis.value(axis.size - 1)} in steps of {axis.step}."
+            numbers[name] = axis.to_number(value)
+        for high, low in self.rules:
+            if numbers[high] < numbers[low]:
+                return False, f"{high} cannot be lower than the {low}"
+        return True, ""
+
+    def valid_rows(self, columns: Dict[str, np.ndarray]) -> np.ndarray:
+        """Vectorized validate() over columns of numbers (e.g. ProfileTable.columns[mode])"""
+        ok = None
+        for name, axis in self.axes.items():
+            values = np.asarray(columns[name], dtype=float)
+            position = (values - axis.start) / axis.step
+            index = np.round(position)
+            on_grid = (np.abs(position - index) <= ON_GRID) & (index >= 0) & (index < axis.size)
+            ok = on_grid if ok is None else ok & on_grid
+        for high, low in self.rules:
+            ok &= np.asarray(columns[high], dtype=float) >= np.asarray(columns[low], dtype=float)
+        return ok
+
+    # Snapping
+    def snap(self, params: dict) -> dict:
+        """Nearest legal combination: each value rounded onto its grid, then cross-field rules enforced"""
+        snapped = {}
+        for name, axis in self.axes.items():
+            value = params.get(name)
+            try:
+                index = axis.snap_index(value)
+            except (TypeError, ValueError):
+                index = 0
+            snapped[name] = index
+        for high, low in self.rules:
+            # raise the upper limit to the lower one rather than lowering what the user asked for
+            high_axis, low_axis = self.axes[high], self.axes[low]
+            low_value = low_axis.start + low_axis.step * snapped[low]
+            floor = int(np.ceil((low_value - high_axis.start) / high_axis.step - ON_GRID))
+            snapped[high] = min(max(snapped[high], floor), high_axis.size - 1)
+        return {name: self.axes[name].value(i) for name, i in snapped.items()}
+
+    # Ranking and enumeration
+    def rank(self, params: dict) -> Optional[int]:
+        """Position of a legal combination in the lattice, None if it isn't legal"""
+        if not self.contains(params):
+            return None
+        return int(sum(self.axes[n].index(params[n]) * int(s) for n, s in zip(self.names, self.strides)))
+
+    def unrank(self, rank: int) -> dict:
+        indices = (rank // self.strides) % self.sizes
+        return {name: self.axes[name].value(int(i)) for name, i in zip(self.names, indices)}
+
+    @property
+    def grid_size(self) -> int:
+        """Combinations before cross-field rules"""
+        return int(np.prod(self.sizes, dtype=object))
+
+    def count(self) -> int:
+        """Number of legal combinations, counted without enumerating them"""
+        if not self.rules:
+            return self.grid_size
+        # every rule here is "x >= LRL"; for each LRL count the x values allowed
+        lrl = self.axes["Lower Rate Limit"].values
+        per_lrl = np.ones(lrl.size, dtype=object)
+        constrained = {"Lower Rate Limit"}
+        for high, low in self.rules:
+            per_lrl = per_lrl * (self.axes[high].values[None, :] >= lrl[:, None]).sum(axis=1).astype(object)
+            constrained.add(high)
+        rest = 1
+        for name in self.names:
+            if name not in constrained:
+                rest *= self.axes[name].size
+        return int(per_lrl.sum()) * rest
+
+    def combinations(self, **choices) -> Iterator[dict]:
+        """
+        Legal combinations, optionally restricting parameters to given values
+
+        e.g. combinations(**{"Lower Rate Limit": [60, 70]}) walks every legal
+        setting with LRL 60 or 70. Unrestricted parameters take every grid value.
+        """
+        grids = [choices[name] if name in choices else self.axes[name].display_values() for name in self.names]
+        for values in itertools.product(*grids):
+            params = dict(zip(self.names, values))
+            if self.contains(params):
+                yield params
+
+
+AXES = {name: Axis(name) for name in PARAMETER_RULES}
+LATTICES = {mode: ModeLattice(mode) for mode in MODE_PARAMETER_LAYOUT}
+
+
+def lattice(mode: str) -> ModeLattice:
+    if mode not in LATTICES:
+        raise ValueError(f"Unknown mode '{mode}'. Must be one of: {list(LATTICES)}")
+    return LATTICES[mode]
+
+
+def dropdown_values(name: str) -> list:
+    """Legal values of one parameter, for the parameter form"""
+    return AXES[name].display_values()
@@ -1,7 +1,18 @@
 import serial
 import struct
+import sys
+import threading
 import time
-from typing import Tuple
+from typing import Callable, List, Optional, Tuple
+
+from device_cache import (IDENTIFY_TIMEOUT, IDENTITY_REPLY_SIZE, DeviceCache, DeviceIdentity,
+                          build_identify_request, parse_identity, usb_identity)
+from serial_io import PRIORITY_ECHO, PRIORITY_PARAMETER, SerialCommand, SerialStream, SerialWorker
+
+try:
+    import pyudev
+except ImportError:  # hot-plug detection is optional (Linux only)
+    pyudev = None
 
 PORT = 'COM3'
 BAUD = 115200
@@ -91,6 +102,25 @@ ACTIVITY_MAP = {
 }
 REVERSE_ACTIVITY_MAP = {v: k for k, v in ACTIVITY_MAP.items()}
 
+# Form field -> (packet field, form units to raw packet units); Activity Threshold goes through ACTIVITY_MAP
+FORM_PACKET_FIELDS = {
+    "Lower Rate Limit": ("Lower Rate Limit", 1),
+    "Upper Rate Limit": ("Upper Rate Limit", 1),
+    "Maximum Sensor Rate": ("MSR", 1),
+    "Atrial Amplitude": ("Atrial Amplitude", 10),
+    "Ventricular Amplitude": ("Ventricular Amplitude", 10),
+    "Atrial Pulse Width": ("Atrial Pulse Width", 10),
+    "Ventricular Pulse Width": ("Ventricular Pulse Width", 10),
+    "Atrial Sensitivity": ("Atrial Sensitivity", 10),
+    "Ventricular Sensitivity": ("Ventricular Sensitivity", 10),
+    "ARP": ("ARP", 0.1),
+    "VRP": ("VRP", 0.1),
+    "Activity Threshold": ("Activity Threshold", None),
+    "Reaction Time": ("Reaction Time", 1),
+    "Response Factor": ("Response Factor", 1),
+    "Recovery Time": ("Recovery Time", 1),
+}
+
 # Mode mapping
 MODE_MAP = {
     "AOO": 1,
@@ -116,51 +146,359 @@ def validate_param(param_name, value):
     
     return True, ""
 
+def form_to_packet(param_name, value) -> Tuple[str, int]:
+    """(packet field, raw value) for a form entry, e.g. ("Atrial Amplitude", "3.5") -> ("Atrial Amplitude", 35)"""
+    field, scale = FORM_PACKET_FIELDS[param_name]
+    if scale is None:
+        return field, ACTIVITY_MAP[value]
+    return field, round(float(value) * scale)
+
+class HotplugMonitor:
+    """Watch udev for the pacemaker's tty appearing/disappearing (Linux + pyudev only)"""
+
+    def __init__(self, port, on_added: Callable[[], None], on_removed: Callable[[], None]):
+        self.port = port
+        self.on_added = on_added
+        self.on_removed = on_removed
+        self._observer = None
+
+    @staticmethod
+    def available() -> bool:
+        return pyudev is not None and sys.platform.startswith("linux")
+
+    def start(self) -> bool:
+        if not self.available() or self._observer is not None:
+            return False
+        context = pyudev.Context()
+        monitor = pyudev.Monitor.from_netlink(context)
+        monitor.filter_by(subsystem="tty")
+        self._observer = pyudev.MonitorObserver(monitor, callback=self._handle_event, name="pacemaker-hotplug")
+        self._observer.daemon = True
+        self._observer.start()
+        return True
+
+    def stop(self):
+        if self._observer is not None:
+            self._observer.send_stop()
+            self._observer = None
+
+    def _handle_event(self, device):
+        # Only care about the node we are configured for
+        if device.device_node != self.port:
+            return
+        if device.action == "add":
+            self.on_added()
+        elif device.action == "remove":
+            self.on_removed()
+
+
 class PacemakerCommunicator:
-    def __init__(self, port=PORT, baudrate=BAUD):
+    # Reconnect backoff (seconds) after an unexpected disconnect
+    RECONNECT_MIN_DELAY = 0.5
+    RECONNECT_MAX_DELAY = 8.0
+
+    def __init__(self, port=PORT, baudrate=BAUD, auto_reconnect=True):
         self.port = port
         self.baudrate = baudrate
         self.ser = None
         self.connected = False
-        
-    def connect(self):
-        """Establish connection with pacemaker"""
+        self.auto_reconnect = auto_reconnect
+
+        self._listeners: List[Callable[[bool, str], None]] = []
+        self._state_lock = threading.Lock()
+        self._reconnect_wakeup = threading.Event()
+        self._reconnect_thread = None
+        self._want_connection = False
+        self._hotplug = HotplugMonitor(port, self._on_device_added, self._on_device_removed)
+        self._hotplug.start()
+
+        # All port access after connect goes through this worker
+        self.io = SerialWorker(self)
+        # Set while another process (the egram capture engine) owns the port
+        self._port_owner = None
+
+        # Board identity and its last confirmed parameters, re-read on every connect
+        self.device: Optional[DeviceIdentity] = None
+        self.device_cache = DeviceCache()
+        self._device_listeners: List[Callable[[Optional[DeviceIdentity], bytes, bool], None]] = []
+
+    def add_connection_listener(self, callback: Callable[[bool, str], None]):
+        """Register callback(connected, reason), called on every connection state change"""
+        if callback not in self._listeners:
+            self._listeners.append(callback)
+
+    def remove_connection_listener(self, callback: Callable[[bool, str], None]):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def add_device_listener(self, callback: Callable[[Optional[DeviceIdentity], bytes, bool], None]):
+        """
+        Register callback(identity, echo, confirmed) for the connected board's parameters.
+
+        Called with confirmed=False straight after connecting to a known board
+        (the cached echo), then with confirmed=True whenever the board answers an
+        echo. identity is None for boards that could not be identified.
+        """
+        if callback not in self._device_listeners:
+            self._device_listeners.append(callback)
+
+    def remove_device_listener(self, callback: Callable[[Optional[DeviceIdentity], bytes, bool], None]):
+        if callback in self._device_listeners:
+            self._device_listeners.remove(callback)
+
+    def _notify_device(self, identity: Optional[DeviceIdentity], echo: bytes, confirmed: bool):
+        for callback in list(self._device_listeners):
+            try:
+                callback(identity, echo, confirmed)
+            except Exception as e:
+                print(f"Device listener error: {e}")
+
+    def _set_connected(self, connected: bool, reason: str = ""):
+        """Update state and notify listeners, only when the state actually changes"""
+        with self._state_lock:
+            if self.connected == connected:
+                return
+            self.connected = connected
+
+        if connected:
+            self.io.start()
+            threading.Thread(target=self._sync_device, name="pacemaker-identify", daemon=True).start()
+        else:
+            self.io.stop(reason or "disconnected")
+            self.device = None
+
+        # Listeners run on whichever thread detected the change
+        for callback in list(self._listeners):
+            try:
+                callback(connected, reason)
+            except Exception as e:
+                print(f"Connection listener error: {e}")
+
+    def _open_port(self) -> bool:
         try:
             if self.ser is None:
                 self.ser = serial.Serial(self.port, self.baudrate, timeout=1)
             elif not self.ser.is_open:
                 self.ser.open()
-                
-            self.connected = True
-            print(f"Connected to {self.port}")
             return True
-        except serial.SerialException as e:
+        except (serial.SerialException, OSError) as e:
             print(f"Connection failed: {e}")
-            self.connected = False
             return False
+
+    def connect(self):
+        """Establish connection with pacemaker"""
+        self._want_connection = True
+        if self._open_port():
+            print(f"Connected to {self.port}")
+            self._set_connected(True, "connected")
+            return True
+        self._set_connected(False, "connect failed")
+        return False
     
     def disconnect(self):
         """Close serial connection"""
-        if self.ser and self.ser.is_open:
-            self.ser.close()
-        self.connected = False
+        # A user-requested disconnect must not be undone by auto-reconnect
+        self._want_connection = False
+        self._reconnect_wakeup.set()
+        self._close_port()
+        self._set_connected(False, "disconnected")
         print("Disconnected")
+
+    def _close_port(self):
+        try:
+            if self.ser and self.ser.is_open:
+                self.ser.close()
+        except (serial.SerialException, OSError):
+            pass
     
     def check_connection(self) -> bool:
         """Check if the pacemaker is still connected"""
+        if self._port_owner is not None:
+            return self.connected
         if not self.ser or not self.ser.is_open:
-            self.connected = False
+            self._set_connected(False, "port closed")
+            return False
+        return self._bytes_waiting() is not None
+
+    # Queued access - safe to call from any thread
+    def submit(self, payload: bytes, response_size: int = 0, priority: int = PRIORITY_PARAMETER,
+               timeout: float = 2.0) -> SerialCommand:
+        """Queue a request for the serial worker and return its handle without blocking"""
+        owner = self._port_owner
+        if owner is not None:
+            return owner.submit(payload, response_size, priority, timeout)
+        return self.io.submit(payload, response_size, priority, timeout)
+
+    def request(self, payload: bytes, response_size: int = 0, priority: int = PRIORITY_PARAMETER,
+                timeout: float = 2.0) -> Tuple[Optional[bytes], str]:
+        """Queue a request and block until its reply arrives, returns (reply, error)"""
+        command = self.submit(payload, response_size, priority, timeout)
+        # leave room for whatever is ahead of us in the queue
+        if not command.wait(timeout + 5.0) and not command.done:
+            return None, "Timed out waiting for serial worker"
+        return command.response, command.error or ""
+
+    def start_stream(self, request: bytes, reply_size: int, on_packet: Callable[[bytes], None],
+                     on_stop: Optional[Callable[[str], None]] = None, interval: float = 0.1) -> bool:
+        """Continuously poll with request, handing each reply_size packet to on_packet"""
+        if not self.connected or self._port_owner is not None:
+            return False
+        self.io.start_stream(SerialStream(request, reply_size, on_packet, on_stop, interval))
+        return True
+
+    def stop_stream(self):
+        self.io.stop_stream()
+
+    # Port hand-over to another process (out-of-process egram capture)
+    def hand_over_port(self, owner) -> bool:
+        """
+        Close the port without reporting a disconnect so another process can open it
+
+        Args:
+            owner: object with a submit() like SerialWorker.submit; commands are
+                   forwarded to it until reclaim_port()
+
+        Returns:
+            bool: False if there was no connection to hand over
+        """
+        if not self.connected or self._port_owner is not None:
+            return False
+        self.io.stop("port handed over")
+        self._close_port()
+        # pyserial handles can't always be reopened after another process used the port
+        self.ser = None
+        self._port_owner = owner
+        return True
+
+    def reclaim_port(self) -> bool:
+        """Take the port back after hand_over_port(), reconnecting as usual if it is gone"""
+        if self._port_owner is None:
+            return self.connected
+        self._port_owner = None
+        if not self.connected:
+            return False
+        if self._open_port():
+            self.io.start()
+            return True
+        self._set_connected(False, "port lost during hand-over")
+        self._start_reconnect()
+        return False
+
+    # Device identity and cached state
+    def identify(self) -> Optional[DeviceIdentity]:
+        """Ask the board who it is, falling back to the USB adapter's serial number"""
+        reply, _ = self.request(build_identify_request(), IDENTITY_REPLY_SIZE, PRIORITY_ECHO, IDENTIFY_TIMEOUT)
+        return parse_identity(reply) or usb_identity(self.port)
+
+    def _sync_device(self):
+        """Serve the cached echo for a known board at once, then revalidate it against the board"""
+        identity = self.identify()
+        if not self.connected:
+            return
+        self.device = identity
+        if identity is None:
+            # nothing to cache against, but the board's own parameters can still be read
+            print("Could not identify the pacemaker")
+        else:
+            print(f"Identified pacemaker {identity.describe()}")
+            cached = self.device_cache.get(identity.device_id)
+            if cached is not None:
+                self._notify_device(identity, cached.parameters, False)
+
+        reply, error = self.request(echo_request(), 18, PRIORITY_ECHO, 2.0)
+        if reply is None or len(reply) != 18:
+            print(f"Could not read the pacemaker's parameters: {error or 'short reply'}")
+            return
+        if self.connected and self.device is identity:
+            self.confirm_parameters(reply)
+
+    def confirm_parameters(self, echo: bytes):
+        """Pass an 18 byte echo from the board to device listeners, caching it if the board is known"""
+        identity = self.device
+        if identity is not None:
+            self.device_cache.confirm(identity, echo)
+        self._notify_device(identity, echo, True)
+
+    # Raw I/O helpers - only the serial worker thread should call these.
+    # Any serial error here means the device went away.
+    def _handle_io_error(self, error):
+        print(f"Serial I/O error, treating as disconnect: {error}")
+        self._close_port()
+        self._set_connected(False, f"I/O error: {error}")
+        self._start_reconnect()
+
+    def _write(self, data: bytes) -> bool:
+        """Write bytes to the pacemaker, returns False (and publishes a disconnect) on failure"""
+        if not self.connected or self.ser is None:
             return False
-        
         try:
-            # Try to read the port status - if it fails, we're disconnected
-            self.ser.in_waiting
-            self.connected = True
+            self.ser.write(data)
             return True
-        except (serial.SerialException, OSError):
-            # Port is disconnected
-            self.connected = False
+        except (serial.SerialException, OSError) as e:
+            self._handle_io_error(e)
             return False
+
+    def _read(self, size: int) -> bytes:
+        """Read up to size bytes, returns b"" on failure"""
+        if not self.connected or self.ser is None:
+            return b""
+        try:
+            return self.ser.read(size)
+        except (serial.SerialException, OSError) as e:
+            self._handle_io_error(e)
+            return b""
+
+    def _bytes_waiting(self):
+        """Number of bytes in the input buffer, or None if the port is gone"""
+        if not self.connected or self.ser is None:
+            return None
+        try:
+            return self.ser.in_waiting
+        except (serial.SerialException, OSError) as e:
+            self._handle_io_error(e)
+            return None
+
+    def _flush_input(self):
+        """Discard anything sitting in the input buffer"""
+        waiting = self._bytes_waiting()
+        if waiting:
+            self._read(waiting)
+
+    # Hot-plug / reconnect handling
+    def _on_device_added(self):
+        print(f"{self.port} appeared")
+        if self._want_connection and not self.connected:
+            self._start_reconnect()
+            # skip the rest of the current backoff sleep
+            self._reconnect_wakeup.set()
+
+    def _on_device_removed(self):
+        print(f"{self.port} removed")
+        self._close_port()
+        self._set_connected(False, "device removed")
+
+    def _start_reconnect(self):
+        if not (self.auto_reconnect and self._want_connection):
+            return
+        if self._reconnect_thread is not None and self._reconnect_thread.is_alive():
+            return
+        self._reconnect_thread = threading.Thread(target=self._reconnect_loop, daemon=True)
+        self._reconnect_thread.start()
+
+    def _reconnect_loop(self):
+        delay = self.RECONNECT_MIN_DELAY
+        while self._want_connection and not self.connected:
+            self._reconnect_wakeup.wait(delay)
+            self._reconnect_wakeup.clear()
+            if not self._want_connection:
+                return
+            # pyserial can't reopen a handle whose device vanished, start fresh
+            self.ser = None
+            if self._open_port():
+                print(f"Reconnected to {self.port}")
+                self._set_connected(True, "reconnected")
+                return
+            delay = min(delay * 2, self.RECONNECT_MAX_DELAY)
     
     def send_parameters(self, mode: str, params: dict) -> Tuple[bool, str]:
         """Send parameters to pacemaker"""
@@ -203,16 +541,14 @@ class PacemakerCommunicator:
             checksum = self._calculate_checksum(full_message)
             full_message += struct.pack("=B", checksum)
             
-            # Send to pacemaker
-            self.ser.write(full_message)
+            # Send to pacemaker and wait for acknowledgment
+            ack, error = self.request(full_message, response_size=1, timeout=0.5)
+            if ack is None:
+                return False, f"Communication error: {error}"
             print(f"Sent {mode} parameters to pacemaker")
             
-            # Wait for acknowledgment
-            time.sleep(0.5)
-            if self.ser.in_waiting > 0:
-                ack = self.ser.read(1)
-                if ack and ack[0] == 0x06:  # ACK
-                    return True, "Parameters successfully sent and acknowledged"
+            if ack and ack[0] == 0x06:  # ACK
+                return True, "Parameters successfully sent and acknowledged"
             
             return True, "Parameters sent (no ACK received)"  # Still return True for testing
                 
@@ -237,12 +573,11 @@ class PacemakerCommunicator:
             samples_collected = 0
             
             # Clear any existing data in the buffer first
-            if self.ser.in_waiting > 0:
-                self.ser.read(self.ser.in_waiting)
+            self._flush_input()
             
-            while time.time() - start_time < duration:
-                if self.ser.in_waiting >= 4:
-                    data = self.ser.read(4)
+            while self.connected and time.time() - start_time < duration:
+                if (self._bytes_waiting() or 0) >= 4:
+                    data = self._read(4)
                     
                     if len(data) == 4:
                         # Interpret as 16-bit unsigned integers
@@ -272,81 +607,92 @@ class PacemakerCommunicator:
         if not self.connected:
             return False
         
-        try:
-            self.ser.write(param_bytes)
+        command = self.submit(param_bytes, priority=PRIORITY_PARAMETER)
+        if command.wait(5.0):
             print(f"Sent {len(param_bytes)} bytes to pacemaker")
             return True
-        except Exception as e:
-            print(f"Failed to send parameters: {e}")
-            return False
+        print(f"Failed to send parameters: {command.error}")
+        return False
 
 class PacemakerParameters:
-    def __init__(self):
-        # Initialize with default values according to the protocol
-        self.parameters = {
-            # Byte 1: Always 0x16 (SYNC)
-            'SYNC': 0x16,
-            
-            # Byte 2: Function Code (0x55 for set parameters, 0x22 for echo)
-            'FnCode': 0x55,
-            
-            # Byte 3: Mode (1-8)
-            'Mode': 1,  # Default to AOO
-            
-            # Byte 4: Lower Rate Limit (30-175 ppm)
-            'Lower Rate Limit': 60,
-            
-            # Byte 5: Upper Rate Limit (50-175 ppm)
-            'Upper Rate Limit': 120,
-            
-            # Byte 6: Maximum Sensor Rate (50-175 ppm)
-            'MSR': 120,
-            
-            # Byte 7: Atrial Amplitude (0-50 = 0-5.0V when divided by 10)
-            'Atrial Amplitude': 25,  # 2.5V
-            
-            # Byte 8: Ventricular Amplitude (0-50 = 0-5.0V when divided by 10)
-            'Ventricular Amplitude': 25,  # 2.5V
-            
-            # Byte 9: Atrial Pulse Width (1-19 = 0.1-1.9ms when divided by 10)
-            'Atrial Pulse Width': 10,  # 1.0ms
-            
-            # Byte 10: Ventricular Pulse Width (1-19 = 0.1-1.9ms when divided by 10)
-            'Ventricular Pulse Width': 10,  # 1.0ms
-            
-            # Byte 11: Atrial Sensitivity (10-100 = 1.0-10.0mV when divided by 10)
-            'Atrial Sensitivity': 50,  # 5.0mV
-            
-            # Byte 12: Ventricular Sensitivity (10-100 = 1.0-10.0mV when divided by 10)
-            'Ventricular Sensitivity': 50,  # 5.0mV
-            
-            # Byte 13: VRP (15-50 = 150-500ms when multiplied by 10)
-            'VRP': 25,  # 250ms
-            
-            # Byte 14: ARP (15-50 = 150-500ms when multiplied by 10)
-            'ARP': 25,  # 250ms
-            
-            # Byte 15: Activity Threshold (0-255, unclear range)
-            'Activity Threshold': 10,
-            
-            # Byte 16: Reaction Time (10-50 seconds)
-            'Reaction Time': 30,
-            
-            # Byte 17: Response Factor (1-16)
-            'Response Factor': 8,
-            
-            # Byte 18: Recovery Time (2-16 minutes)
-            'Recovery Time': 5
-        }
-        
-        # Mode mapping for user-friendly names
-        self.mode_mapping = {
-            'AOO': 1, 'VOO': 2, 'AAI': 3, 'VVI': 4,
-            'AOOR': 5, 'VOOR': 6, 'AAIR': 7, 'VVIR': 8
-        }
-        
-        # Reverse mode mapping for display
-        self.mode_names = {v: k for k, v in self.mode_mapping.items()}
+    """
+    The 18-byte parameter packet, held as the packet itself.
+
+    Each instance is one bytearray; field offsets, defaults, validation
+    ranges and mode names are class-level tables shared by every instance,
+    so thousands of sessions cost a few dozen bytes each. Encoding is a copy
+    of the buffer (or a read-only view of it), decoding a single slice copy.
+    """
+
+    __slots__ = ("_packet",)
+
+    # Byte offset of each field in the packet, in wire order
+    FIELDS = {
+        'SYNC': 0,                       # always 0x16
+        'FnCode': 1,                     # 0x55 set parameters, 0x22 echo
+        'Mode': 2,                       # 1-8
+        'Lower Rate Limit': 3,           # 30-175 ppm
+        'Upper Rate Limit': 4,           # 50-175 ppm
+        'MSR': 5,                        # 50-175 ppm
+        'Atrial Amplitude': 6,           # 0-50 = 0-5.0V when divided by 10
+        'Ventricular Amplitude': 7,      # 0-50 = 0-5.0V when divided by 10
+        'Atrial Pulse Width': 8,         # 1-19 = 0.1-1.9ms when divided by 10
+        'Ventricular Pulse Width': 9,    # 1-19 = 0.1-1.9ms when divided by 10
+        'Atrial Sensitivity': 10,        # 10-100 = 1.0-10.0mV when divided by 10
+        'Ventricular Sensitivity': 11,   # 10-100 = 1.0-10.0mV when divided by 10
+        'VRP': 12,                       # 15-50 = 150-500ms when multiplied by 10
+        'ARP': 13,                       # 15-50 = 150-500ms when multiplied by 10
+        'Activity Threshold': 14,        # 0-255, unclear range
+        'Reaction Time': 15,             # 10-50 seconds
+        'Response Factor': 16,           # 1-16
+        'Recovery Time': 17,             # 2-16 minutes
+    }
+    PACKET_SIZE = 18
+
+    # Default packet according to the protocol: AOO at 60/120 ppm, 2.5V, 1.0ms, 5.0mV, 250ms
+    DEFAULTS = bytes([0x16, 0x55, 1, 60, 120, 120, 25, 25, 10, 10, 50, 50, 25, 25, 10, 30, 8, 5])
+
+    # Parameter validation rules, (min, max) in raw packet units
+    VALIDATION_RULES = {
+        'SYNC': (0x16, 0x16),  # Must always be 0x16
+        'FnCode': (0x22, 0x55),  # Either 0x22 or 0x55
+        'Mode': (1, 8),
+        'Lower Rate Limit': (30, 175),
+        'Upper Rate Limit': (50, 175),
+        'MSR': (50, 175),
+        'Atrial Amplitude': (0, 50),
+        'Ventricular Amplitude': (0, 50),
+        'Atrial Pulse Width': (1, 19),
+        'Ventricular Pulse Width': (1, 19),
+        'Atrial Sensitivity': (10, 100),
+        'Ventricular Sensitivity': (10, 100),
+        'VRP': (15, 50),
+        'ARP': (15, 50),
+        'Activity Threshold': (0, 255),
+        'Reaction Time': (10, 50),
+        'Response Factor': (1, 16),
+        'Recovery Time': (2, 16)
+    }
+
+    # Mode mapping for user-friendly names
+    MODE_MAPPING = {
+        'AOO': 1, 'VOO': 2, 'AAI': 3, 'VVI': 4,
+        'AOOR': 5, 'VOOR': 6, 'AAIR': 7, 'VVIR': 8
+    }
+    # Reverse mode mapping for display
+    MODE_NAMES = {v: k for k, v in MODE_MAPPING.items()}
+
+    # The echo reply carries Mode..Recovery Time in packet order from its first byte
+    REPLY_FIELDS = slice(FIELDS['Mode'], PACKET_SIZE)
+
+    def __init__(self, packet: bytes = DEFAULTS):
+        self._packet = bytearray(packet)
+
+    @property
+    def parameters(self) -> dict:
+        """Field name -> raw value, built on demand (prefer get_parameter in hot paths)"""
+        packet = self._packet
+        return {name: packet[offset] for name, offset in self.FIELDS.items()}
 
     def set_parameter(self, param_name: str, value: int) -> bool:
         """
@@ -359,40 +705,17 @@ class PacemakerParameters:
         Returns:
             bool: True if successful, False if validation failed
         """
-        if param_name not in self.parameters:
+        offset = self.FIELDS.get(param_name)
+        if offset is None:
             print(f"Error: Unknown parameter '{param_name}'")
             return False
-        
-        # Parameter validation rules
-        validation_rules = {
-            'SYNC': (0x16, 0x16),  # Must always be 0x16
-            'FnCode': (0x22, 0x55),  # Either 0x22 or 0x55
-            'Mode': (1, 8),
-            'Lower Rate Limit': (30, 175),
-            'Upper Rate Limit': (50, 175),
-            'MSR': (50, 175),
-            'Atrial Amplitude': (0, 50),
-            'Ventricular Amplitude': (0, 50),
-            'Atrial Pulse Width': (1, 19),
-            'Ventricular Pulse Width': (1, 19),
-            'Atrial Sensitivity': (10, 100),
-            'Ventricular Sensitivity': (10, 100),
-            'VRP': (15, 50),
-            'ARP': (15, 50),
-            'Activity Threshold': (0, 255),
-            'Reaction Time': (10, 50),
-            'Response Factor': (1, 16),
-            'Recovery Time': (2, 16)
-        }
-        
-        min_val, max_val = validation_rules.get(param_name, (0, 255))
-        
+
+        min_val, max_val = self.VALIDATION_RULES[param_name]
         if not (min_val <= value <= max_val):
             print(f"Error: {param_name} must be between {min_val} and {max_val}")
             return False
         
-        self.parameters[param_name] = value
-        print(f"Set {param_name} = {value}")
+        self._packet[offset] = value
         return True
 
     def set_parameters_from_bytes(self, data_bytes: bytes) -> bool:
@@ -409,36 +732,14 @@ class PacemakerParameters:
             print(f"Error: Expected 18 bytes, got {len(data_bytes)}")
             return False
         
-        try:
-            # Based on your received data, the pacemaker returns parameters in this order:
-            # [Mode, LRL, URL, MSR, ATR_AMP, VENT_AMP, ATR_PW, VENT_PW, Atrial Sensitivity, Ventricular Sensitivity, VRP, ARP, 
-            #  Activity Threshold, Reaction Time, Response Factor, Recovery Time, ?, ?]
-            
-            # Map bytes to parameters based on the actual response order
-            self.parameters['Mode'] = data_bytes[0]
-            self.parameters['Lower Rate Limit'] = data_bytes[1]
-            self.parameters['Upper Rate Limit'] = data_bytes[2]
-            self.parameters['MSR'] = data_bytes[3]
-            self.parameters['Atrial Amplitude'] = data_bytes[4]
-            self.parameters['Ventricular Amplitude'] = data_bytes[5]
-            self.parameters['Atrial Pulse Width'] = data_bytes[6]
-            self.parameters['Ventricular Pulse Width'] = data_bytes[7]
-            self.parameters['Atrial Sensitivity'] = data_bytes[8]
-            self.parameters['Ventricular Sensitivity'] = data_bytes[9]
-            self.parameters['VRP'] = data_bytes[10]
-            self.parameters['ARP'] = data_bytes[11]
-            self.parameters['Activity Threshold'] = data_bytes[12]
-            self.parameters['Reaction Time'] = data_bytes[13]
-            self.parameters['Response Factor'] = data_bytes[14]
-            self.parameters['Recovery Time'] = data_bytes[15]
-            # Bytes 16 and 17 seem to be unknown/extra bytes in the response
-            
-            print("All parameters updated successfully from byte data")
-            return True
-            
-        except Exception as e:
-            print(f"Error parsing byte data: {e}")
-            return False
+        # The pacemaker returns [Mode, LRL, URL, MSR, ATR_AMP, VENT_AMP, ATR_PW, VENT_PW,
+        # Atrial Sensitivity, Ventricular Sensitivity, VRP, ARP, Activity Threshold,
+        # Reaction Time, Response Factor, Recovery Time, ?, ?] - the packet's own order
+        # from byte 2, so one slice copy updates every field.
+        # Bytes 16 and 17 seem to be unknown/extra bytes in the response
+        self._packet[self.REPLY_FIELDS] = memoryview(data_bytes)[:16]
+        print("All parameters updated successfully from byte data")
+        return True
 
     def set_mode(self, mode_name: str) -> bool:
         """
@@ -450,12 +751,12 @@ class PacemakerParameters:
         Returns:
             bool: True if successful, False if invalid mode
         """
-        mode_code = self.mode_mapping.get(mode_name.upper())
+        mode_code = self.MODE_MAPPING.get(mode_name.upper())
         if mode_code is None:
-            print(f"Error: Invalid mode '{mode_name}'. Must be one of: {list(self.mode_mapping.keys())}")
+            print(f"Error: Invalid mode '{mode_name}'. Must be one of: {list(self.MODE_MAPPING.keys())}")
             return False
         
-        self.parameters['Mode'] = mode_code
+        self._packet[self.FIELDS['Mode']] = mode_code
         print(f"Set mode to {mode_name} (code: {mode_code})")
         return True
 
@@ -469,7 +770,8 @@ class PacemakerParameters:
         Returns:
             int: Parameter value, or None if parameter doesn't exist
         """
-        return self.parameters.get(param_name)
+        offset = self.FIELDS.get(param_name)
+        return None if offset is None else self._packet[offset]
 
     def get_mode_name(self) -> str:
         """
@@ -478,48 +780,43 @@ class PacemakerParameters:
         Returns:
             str: Mode name
         """
-        mode_code = self.parameters['Mode']
-        return self.mode_names.get(mode_code, f"Unknown ({mode_code})")
+        mode_code = self._packet[self.FIELDS['Mode']]
+        return self.MODE_NAMES.get(mode_code, f"Unknown ({mode_code})")
 
     def get_parameter_bytes(self) -> bytes:
         """
-        Convert all parameters to 18-byte packet for serial transmission
-        Match the format that the pacemaker expects
+        18-byte packet for serial transmission, in the format the pacemaker expects
+
+        A snapshot: safe to queue while the parameters keep changing.
         """
-        byte_array = bytearray(18)
-        
-        # Pack parameters in the order the pacemaker expects
-        byte_array[0] = self.parameters['SYNC']
-        byte_array[1] = self.parameters['FnCode']
-        byte_array[2] = self.parameters['Mode']
-        byte_array[3] = self.parameters['Lower Rate Limit']
-        byte_array[4] = self.parameters['Upper Rate Limit']
-        byte_array[5] = self.parameters['MSR']
-        byte_array[6] = self.parameters['Atrial Amplitude']
-        byte_array[7] = self.parameters['Ventricular Amplitude']
-        byte_array[8] = self.parameters['Atrial Pulse Width']
-        byte_array[9] = self.parameters['Ventricular Pulse Width']
-        byte_array[10] = self.parameters['Atrial Sensitivity']
-        byte_array[11] = self.parameters['Ventricular Sensitivity']
-        byte_array[12] = self.parameters['VRP']
-        byte_array[13] = self.parameters['ARP']
-        byte_array[14] = self.parameters['Activity Threshold']
-        byte_array[15] = self.parameters['Reaction Time']
-        byte_array[16] = self.parameters['Response Factor']
-        byte_array[17] = self.parameters['Recovery Time']
-        
-        return bytes(byte_array)
+        return bytes(self._packet)
+
+    def view(self) -> memoryview:
+        """Read-only zero-copy view of the packet, for immediate use only"""
+        return memoryview(self._packet).toreadonly()
+
+    def print_parameters(self):
+        """Print every field with its raw value"""
+        packet = self._packet
+        for name, offset in self.FIELDS.items():
+            print(f"  {name}: {packet[offset]}")
 
     def set_echo_mode(self):
         """Set function code to echo mode (request pacemaker to echo current values)"""
-        self.parameters['FnCode'] = 0x22
+        self._packet[self.FIELDS['FnCode']] = 0x22
         print("Set to echo mode (0x22)")
 
     def set_parameter_mode(self):
         """Set function code to parameter mode (send parameters to pacemaker)"""
-        self.parameters['FnCode'] = 0x55
+        self._packet[self.FIELDS['FnCode']] = 0x55
         print("Set to parameter mode (0x55)")
 
+def echo_request() -> bytes:
+    """Echo packet for the current parameter set, without touching its function code"""
+    packet = bytearray(pacemaker_params.view())
+    packet[PacemakerParameters.FIELDS['FnCode']] = 0x22
+    return bytes(packet)
+
 # Create global instances
 pacemaker_comm = PacemakerCommunicator()
 pacemaker_params = PacemakerParameters()
\ No newline at end of file
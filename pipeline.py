@@ -0,0 +1,219 @@
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+# What a channel does when it is full
+DROP_NEVER = "never"          # producer waits - nothing is lost unless the put times out (recorder)
+DROP_OLDEST = "drop_oldest"   # discard the oldest queued item (live display)
+DROP_NEWEST = "drop_newest"   # discard the item being added
+DECIMATE = "decimate"         # while full, only keep every `decimate`-th new item
+
+POLICIES = (DROP_NEVER, DROP_OLDEST, DROP_NEWEST, DECIMATE)
+
+
+class ChannelClosed(Exception):
+    pass
+
+
+class BoundedChannel:
+    """
+    Fixed-capacity queue between two pipeline stages with an explicit drop policy.
+
+    Items are usually sample blocks; `samples` is passed alongside so drop
+    counters can be reported in samples as well as items.
+
+    A DROP_NEVER producer waits for room, for at most `put_timeout` seconds
+    unless put() is given its own timeout. Once a wait has timed out the
+    consumer is taken to be stalled: further puts into the full channel drop
+    at once instead of each waiting again, until the consumer takes an item.
+    So a stalled consumer costs its producer one timeout, not one per item.
+    """
+
+    def __init__(self, name: str, maxsize: int, policy: str = DROP_OLDEST, decimate: int = 2,
+                 put_timeout: Optional[float] = None):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown drop policy '{policy}'. Must be one of: {POLICIES}")
+        self.name = name
+        self.maxsize = maxsize
+        self.policy = policy
+        self.decimate = decimate
+        self.put_timeout = put_timeout
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._skip = 0
+        self._stalled = False
+
+        # counters
+        self.put_items = 0
+        self.dropped_items = 0
+        self.dropped_samples = 0
+        self.high_water = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def _drop(self, samples: int):
+        self.dropped_items += 1
+        self.dropped_samples += samples
+
+    def put(self, item, samples: int = 1, timeout: Optional[float] = None) -> bool:
+        """
+        Add an item according to the channel's policy
+
+        Returns:
+            bool: True if the item was queued, False if it was dropped (or timed out)
+        """
+        with self._cond:
+            if self._closed:
+                raise ChannelClosed(self.name)
+            self.put_items += 1
+
+            if len(self._items) >= self.maxsize:
+                if self.policy == DROP_NEVER:
+                    if timeout is None:
+                        timeout = self.put_timeout
+                    if self._stalled and timeout is not None:
+                        self._drop(samples)
+                        return False
+                    deadline = None if timeout is None else time.monotonic() + timeout
+                    while len(self._items) >= self.maxsize and not self._closed:
+                        remaining = None if deadline is None else deadline - time.monotonic()
+                        if remaining is not None and remaining <= 0:
+                            self._stalled = True
+                            self._drop(samples)
+                            return False
+                        self._cond.wait(remaining)
+                    if self._closed:
+                        raise ChannelClosed(self.name)
+                elif self.policy == DROP_OLDEST:
+                    _, old_samples = self._items.popleft()
+                    self._drop(old_samples)
+                elif self.policy == DROP_NEWEST:
+                    self._drop(samples)
+                    return False
+                elif self.policy == DECIMATE:
+                    self._skip += 1
+                    if self._skip % self.decimate:
+                        self._drop(samples)
+                        return False
+                    _, old_samples = self._items.popleft()
+                    self._drop(old_samples)
+            else:
+                self._skip = 0
+
+            self._items.append((item, samples))
+            self.high_water = max(self.high_water, len(self._items))
+            self._cond.notify_all()
+            return True
+
+    def get(self, timeout: Optional[float] = None):
+        """Next item, or None on timeout; raises ChannelClosed once closed and empty"""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._items or self._closed, timeout):
+                return None
+            if not self._items:
+                raise ChannelClosed(self.name)
+            item, _ = self._items.popleft()
+            self._stalled = False
+            self._cond.notify_all()
+            return item
+
+    def drain(self, max_items: Optional[int] = None) -> List:
+        """Everything currently queued (up to max_items), without waiting"""
+        with self._cond:
+            count = len(self._items) if max_items is None else min(max_items, len(self._items))
+            items = [self._items.popleft()[0] for _ in range(count)]
+            if items:
+                self._stalled = False
+                self._cond.notify_all()
+            return items
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def stats(self) -> dict:
+        return {
+            "depth": len(self._items),
+            "maxsize": self.maxsize,
+            "policy": self.policy,
+            "put": self.put_items,
+            "dropped": self.dropped_items,
+            "dropped_samples": self.dropped_samples,
+            "high_water": self.high_water,
+        }
+
+
+class SampleBus:
+    """Fans each published block out to every subscriber's own bounded channel"""
+
+    def __init__(self):
+        self._channels: Dict[str, BoundedChannel] = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, name: str, maxsize: int, policy: str = DROP_OLDEST, decimate: int = 2,
+                  put_timeout: Optional[float] = None) -> BoundedChannel:
+        """
+        A channel that receives every published item from now on
+
+        publish() runs on the producer's thread, so a full DROP_NEVER
+        subscriber holds up every other subscriber and the producer itself;
+        give those a put_timeout to bound that.
+        """
+        channel = BoundedChannel(name, maxsize, policy, decimate, put_timeout)
+        with self._lock:
+            old = self._channels.get(name)
+            self._channels[name] = channel
+        if old is not None:
+            old.close()
+        return channel
+
+    def unsubscribe(self, name: str):
+        with self._lock:
+            channel = self._channels.pop(name, None)
+        if channel is not None:
+            channel.close()
+
+    def publish(self, item, samples: int = 1):
+        with self._lock:
+            channels = list(self._channels.values())
+        for channel in channels:
+            try:
+                channel.put(item, samples)
+            except ChannelClosed:
+                pass
+
+    def stats(self) -> Dict[str, dict]:
+        with self._lock:
+            return {name: channel.stats() for name, channel in self._channels.items()}
+
+
+class ConsumerThread:
+    """Runs handler(item) for everything arriving on a channel until it is closed"""
+
+    def __init__(self, channel: BoundedChannel, handler: Callable, name: Optional[str] = None):
+        self.channel = channel
+        self.handler = handler
+        self._thread = threading.Thread(target=self._run, name=name or channel.name, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                item = self.channel.get()
+            except ChannelClosed:
+                return
+            try:
+                self.handler(item)
+            except Exception as e:
+                print(f"{self.channel.name} consumer error: {e}")
+
+    def join(self, timeout: Optional[float] = None):
+        self._thread.join(timeout)
@@ -0,0 +1,128 @@
+import json
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from parameters import ACTIVITY_MAP, MODE_PARAMETER_LAYOUT, PARAMETER_RULES
+
+USERS_PATH = "data/users.json"
+
+
+def _to_float(value) -> float:
+    """One stored value as a number: "30" and 30 alike, activity names by index, anything else NaN"""
+    if isinstance(value, str):
+        if value in ACTIVITY_MAP:
+            return float(ACTIVITY_MAP[value])
+        try:
+            return float(value)
+        except ValueError:
+            return np.nan
+    if value is None or isinstance(value, bool):
+        return np.nan
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _column(values: list) -> np.ndarray:
+    # the common case, all numbers or numeric strings, converts in C
+    try:
+        return np.array(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        return np.fromiter((_to_float(v) for v in values), dtype=np.float64, count=len(values))
+
+
+class ProfileTable:
+    """
+    Every user's profiles as typed columns: one float64 array per mode and
+    parameter of that mode's layout, one row per user. Missing or unreadable
+    values are NaN, Activity Threshold is its ACTIVITY_MAP index.
+
+    Filters and aggregates are plain numpy over the columns, e.g.
+        lrl, url = table.column("AAI", "Lower Rate Limit"), table.column("AAI", "Upper Rate Limit")
+        table.users(lrl > url - 20)
+    """
+
+    def __init__(self, usernames: np.ndarray, columns: Dict[str, Dict[str, np.ndarray]]):
+        self.usernames = usernames
+        self.columns = columns
+
+    def __len__(self):
+        return self.usernames.size
+
+    @classmethod
+    def from_users(cls, users: Iterable[dict]) -> "ProfileTable":
+        users = list(users)
+        usernames = np.array([u.get("username", "") for u in users], dtype=object)
+        columns = {}
+        for mode, layout in MODE_PARAMETER_LAYOUT.items():
+            profiles = [(u.get("parameters") or {}).get(mode) or {} for u in users]
+            columns[mode] = {name: _column([p.get(name, np.nan) for p in profiles]) for name in layout}
+        return cls(usernames, columns)
+
+    @classmethod
+    def from_file(cls, path: str = USERS_PATH) -> "ProfileTable":
+        with open(path, "r") as f:
+            return cls.from_users(json.load(f))
+
+    # Storage: one uncompressed .npz, loads without re-parsing any JSON
+    def save(self, path: str):
+        arrays = {f"{mode}/{name}": column for mode, cols in self.columns.items() for name, column in cols.items()}
+        np.savez(path, usernames=self.usernames.astype(str), **arrays)
+
+    @classmethod
+    def load(cls, path: str) -> "ProfileTable":
+        with np.load(path) as data:
+            columns: Dict[str, Dict[str, np.ndarray]] = {}
+            for key in data.files:
+                if key == "usernames":
+                    continue
+                mode, name = key.split("/", 1)
+                columns.setdefault(mode, {})[name] = data[key]
+            return cls(data["usernames"].astype(object), columns)
+
+    # Queries
+    def column(self, mode: str, name: str) -> np.ndarray:
+        """Values of one parameter across all users (all NaN if the mode doesn't use it)"""
+        if mode not in self.columns:
+            raise KeyError(f"Unknown mode '{mode}'. Must be one of: {list(self.columns)}")
+        found = self.columns[mode].get(name)
+        return found if found is not None else np.full(len(self), np.nan)
+
+    def users(self, mask: np.ndarray) -> List[str]:
+        return list(self.usernames[np.asarray(mask, dtype=bool)])
+
+    def describe(self, mode: str, name: str, mask: Optional[np.ndarray] = None) -> Dict[str, float]:
+        """Distribution of one parameter over the users in mask (default all), ignoring missing values"""
+        values = self.column(mode, name)
+        if mask is not None:
+            values = values[mask]
+        values = values[~np.isnan(values)]
+        if values.size == 0:
+            return {"count": 0}
+        p5, p25, p50, p75, p95 = np.percentile(values, [5, 25, 50, 75, 95]).tolist()
+        return {"count": int(values.size), "mean": float(values.mean()), "std": float(values.std()),
+                "min": float(values.min()), "p5": p5, "p25": p25, "median": p50, "p75": p75, "p95": p95,
+                "max": float(values.max())}
+
+    def value_counts(self, mode: str, name: str, mask: Optional[np.ndarray] = None) -> Dict[float, int]:
+        values = self.column(mode, name)
+        if mask is not None:
+            values = values[mask]
+        found, counts = np.unique(values[~np.isnan(values)], return_counts=True)
+        return dict(zip(found.tolist(), counts.tolist()))
+
+    def violations(self, mode: str) -> np.ndarray:
+        """Rows whose mode profile is missing a value or breaks PARAMETER_RULES or URL >= LRL"""
+        bad = np.zeros(len(self), dtype=bool)
+        for name, values in self.columns[mode].items():
+            rule = PARAMETER_RULES[name]
+            if name == "Activity Threshold":
+                low, high = 0, len(rule) - 1
+            else:
+                low, high = rule
+            bad |= np.isnan(values) | (values < low) | (values > high)
+        if "Upper Rate Limit" in self.columns[mode]:
+            bad |= self.column(mode, "Upper Rate Limit") < self.column(mode, "Lower Rate Limit")
+        return bad
@@ -0,0 +1,179 @@
+import itertools
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+import numpy as np
+
+from parameters import ACTIVITY_MAP, PARAMETER_RULES
+
+# Activity level (mean |activity - baseline| per step, in raw accelerometer
+# counts) at which each Activity Threshold setting starts raising the rate,
+# indexed by ACTIVITY_MAP value (V-Low .. V-High)
+ACTIVITY_THRESHOLDS = np.array([2.0, 3.0, 4.5, 6.75, 10.0, 15.0, 22.5])
+
+# Response Factor 16 reaches MSR at twice the threshold, factor 1 at 17x
+RESPONSE_SPAN = 16.0
+
+# Sensor rate is evaluated once per step (s)
+DEFAULT_STEP = 1.0
+
+GRID_PARAMETERS = ("Activity Threshold", "Reaction Time", "Response Factor", "Recovery Time", "Maximum Sensor Rate")
+
+
+def default_grid() -> Dict[str, np.ndarray]:
+    """Every value the parameter form offers for the five rate-response settings"""
+    return {
+        "Activity Threshold": np.arange(len(ACTIVITY_THRESHOLDS)),
+        "Reaction Time": np.arange(10, 51, 10),
+        "Response Factor": np.arange(1, 17),
+        "Recovery Time": np.arange(2, 17),
+        "Maximum Sensor Rate": np.arange(PARAMETER_RULES["Maximum Sensor Rate"][0],
+                                         PARAMETER_RULES["Maximum Sensor Rate"][1] + 1, 5),
+    }
+
+
+def _threshold_index(value) -> int:
+    if isinstance(value, str):
+        return ACTIVITY_MAP[value] if value in ACTIVITY_MAP else int(value)
+    return int(value)
+
+
+def activity_level(t: np.ndarray, activity: np.ndarray, step: float = DEFAULT_STEP) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Reduce a raw activity trace to one level per step
+
+    Returns:
+        (step start times, mean |activity - median| in each step)
+    """
+    t = np.asarray(t, dtype=float)
+    activity = np.asarray(activity, dtype=float)
+    if t.size == 0:
+        return np.empty(0), np.empty(0)
+    deviation = np.abs(activity - np.median(activity))
+    bins = ((t - t[0]) // step).astype(np.int64)
+    sums = np.bincount(bins, weights=deviation)
+    counts = np.bincount(bins)
+    times = t[0] + np.arange(sums.size) * step
+    # empty steps (gaps in the capture) carry the previous level
+    level = np.divide(sums, counts, out=np.full(sums.size, np.nan), where=counts > 0)
+    valid = np.flatnonzero(counts > 0)
+    level = level[valid[np.maximum(np.searchsorted(valid, np.arange(level.size), side="right") - 1, 0)]]
+    return times, level
+
+
+def _rate_steps(level: np.ndarray, lrl: np.ndarray, msr: np.ndarray, threshold: np.ndarray,
+                reaction_time: np.ndarray, response_factor: np.ndarray, recovery_time: np.ndarray,
+                step: float) -> Iterator[np.ndarray]:
+    """The rate-response recurrence: yields the rate of every parameter set after each step"""
+    span = np.maximum(msr - lrl, 0.0)
+    thresholds = ACTIVITY_THRESHOLDS[threshold.astype(int)]
+    up = span / reaction_time * step
+    down = span / (recovery_time * 60.0) * step
+    rate = lrl.copy()
+    for value in level:
+        target = lrl + span * np.clip(response_factor * (value / thresholds - 1.0) / RESPONSE_SPAN, 0.0, 1.0)
+        rate = np.clip(target, rate - down, rate + up)
+        yield rate
+
+
+def rate_response(level: np.ndarray, lrl, msr, threshold, reaction_time, response_factor, recovery_time,
+                  step: float = DEFAULT_STEP) -> np.ndarray:
+    """
+    Sensor-indicated rate over time for one or many parameter sets
+
+    The target rate rises with activity above threshold (scaled by response
+    factor) between LRL and MSR. The rate follows the target no faster than
+    LRL->MSR in reaction_time seconds going up, and MSR->LRL in
+    recovery_time minutes going down.
+
+    Parameters may be scalars or equal-length arrays (one row per set).
+
+    Returns:
+        np.ndarray: rates, shape (steps,) for scalar parameters or (sets, steps)
+    """
+    scalar = all(np.ndim(p) == 0 for p in (lrl, msr, threshold, reaction_time, response_factor, recovery_time))
+    lrl, msr, threshold, reaction_time, response_factor, recovery_time = (
+        np.atleast_1d(np.asarray(p, dtype=float)) for p in
+        (lrl, msr, threshold, reaction_time, response_factor, recovery_time))
+    rates = np.empty((lrl.size, level.size))
+    steps = _rate_steps(level, lrl, msr, threshold, reaction_time, response_factor, recovery_time, step)
+    for i, rate in enumerate(steps):
+        rates[:, i] = rate
+    return rates[0] if scalar else rates
+
+
+def sensor_rate_from_profile(params: dict, t: np.ndarray, activity: np.ndarray,
+                             step: float = DEFAULT_STEP) -> Tuple[np.ndarray, np.ndarray]:
+    """(times, ppm) for an R-mode profile, usable as pacing_sim.simulate(sensor_rate=...)"""
+    times, level = activity_level(t, activity, step)
+    rates = rate_response(
+        level,
+        float(params.get("Lower Rate Limit", 60)),
+        float(params.get("Maximum Sensor Rate", 120)),
+        _threshold_index(params.get("Activity Threshold", ACTIVITY_MAP["Med"])),
+        float(params.get("Reaction Time", 30)),
+        float(params.get("Response Factor", 8)),
+        float(params.get("Recovery Time", 5)),
+        step)
+    return times, rates
+
+
+def _score_chunk(level: np.ndarray, target: np.ndarray, lrl: float, combos: np.ndarray, step: float) -> np.ndarray:
+    """Worker entry point: RMS error against target for each row of combos (GRID_PARAMETERS order)"""
+    threshold, reaction, factor, recovery, msr = combos.T
+    lrl = np.full(combos.shape[0], lrl)
+    # same recurrence as rate_response, accumulating the error instead of keeping every rate
+    error = np.zeros(combos.shape[0])
+    steps = _rate_steps(level, lrl, msr, threshold, reaction, factor, recovery, step)
+    for rate, wanted in zip(steps, target):
+        error += (rate - wanted) ** 2
+    return np.sqrt(error / max(len(level), 1))
+
+
+def evaluate_grid(t: np.ndarray, activity: np.ndarray, target: Tuple[np.ndarray, np.ndarray],
+                  lrl: float = 60.0, grid: Optional[Dict[str, Iterable]] = None, top: int = 10,
+                  step: float = DEFAULT_STEP, workers: Optional[int] = None, chunk: int = 4096) -> np.ndarray:
+    """
+    Find the rate-response settings whose sensor rate best follows a target
+
+    Args:
+        t, activity: recorded (or synthetic) activity trace
+        target: (times, ppm) rate profile the settings should produce
+        lrl: Lower Rate Limit of the profile being tuned
+        grid: values to try per GRID_PARAMETERS name, defaults to default_grid()
+        top: number of best settings to return
+        workers: processes to spread the grid over (default: all cores, 0 = in-process)
+
+    Returns:
+        np.ndarray: structured array of the `top` best settings, best first,
+                    with an "rms_error" column in ppm
+    """
+    grid = {**default_grid(), **(grid or {})}
+    values = [np.asarray([_threshold_index(v) for v in grid[name]] if name == "Activity Threshold"
+                         else list(grid[name]), dtype=float) for name in GRID_PARAMETERS]
+    combos = np.array(list(itertools.product(*values)), dtype=float)
+    # MSR below LRL can never be programmed
+    combos = combos[combos[:, 4] >= lrl]
+
+    times, level = activity_level(t, activity, step)
+    wanted = np.interp(times, np.asarray(target[0], dtype=float), np.asarray(target[1], dtype=float))
+
+    chunks = [combos[i:i + chunk] for i in range(0, len(combos), chunk)]
+    workers = os.cpu_count() if workers is None else workers
+    if workers and len(chunks) > 1:
+        # spawn, not fork: a caller such as the GUI has serial and Tk threads that must not be forked
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks)),
+                                 mp_context=multiprocessing.get_context("spawn")) as pool:
+            errors = list(pool.map(_score_chunk, *zip(*[(level, wanted, lrl, c, step) for c in chunks])))
+    else:
+        errors = [_score_chunk(level, wanted, lrl, c, step) for c in chunks]
+    errors = np.concatenate(errors) if errors else np.empty(0)
+
+    best = np.argsort(errors, kind="stable")[:top]
+    out = np.zeros(best.size, dtype=[(name, "<f8") for name in GRID_PARAMETERS] + [("rms_error", "<f8")])
+    for i, name in enumerate(GRID_PARAMETERS):
+        out[name] = combos[best, i]
+    out["rms_error"] = errors[best]
+    return out
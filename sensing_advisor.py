@@ -0,0 +1,153 @@
+import os
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+
+from egram_store import CAPTURE_DIR, CHANNELS, list_captures, open_capture
+from parameters import PARAMETER_RULES
+
+# Amplitude histograms, mV
+HIST_MAX = 10.0
+HIST_BIN = 0.02
+HIST_BINS = int(HIST_MAX / HIST_BIN)
+
+# Chunks analysed together (an event split by a block edge is at most one in ~65k samples)
+BLOCK_CHUNKS = 16
+EVENT_WINDOW = 0.1        # s - an event's amplitude is its peak within this window
+DETECT_FACTOR = 8.0       # onset when |x - baseline| is this many MADs above typical
+
+# Program sensitivity at no more than half the smallest typical event and
+# comfortably above the noise floor
+EVENT_PERCENTILE = 5.0
+NOISE_PERCENTILE = 99.9
+EVENT_MARGIN = 2.0
+NOISE_MARGIN = 1.5
+SENSITIVITY_STEP = 0.1    # matches the parameter form's dropdown
+
+PARAMETER_NAMES = {"atrial": "Atrial Sensitivity", "ventricular": "Ventricular Sensitivity"}
+
+
+class AmplitudeHistogram:
+    """Fixed-bin histogram that can be filled a block at a time"""
+
+    def __init__(self):
+        self.counts = np.zeros(HIST_BINS, dtype=np.int64)
+
+    def add(self, values: np.ndarray):
+        bins = np.minimum((np.abs(values) / HIST_BIN).astype(np.int64), HIST_BINS - 1)
+        self.counts += np.bincount(bins, minlength=HIST_BINS)
+
+    @property
+    def total(self) -> int:
+        return int(self.counts.sum())
+
+    def percentile(self, q: float) -> Optional[float]:
+        if self.total == 0:
+            return None
+        cumulative = np.cumsum(self.counts)
+        index = int(np.searchsorted(cumulative, q / 100.0 * cumulative[-1]))
+        return (index + 1) * HIST_BIN
+
+
+def split_events(t: np.ndarray, x: np.ndarray, window: float = EVENT_WINDOW):
+    """
+    Event peak amplitudes and the noise samples between events for one block
+
+    Returns:
+        (onset indices, event peak |x - baseline|, noise |x - baseline|)
+    """
+    baseline = np.median(x)
+    dev = np.abs(x - baseline)
+    typical = np.median(dev)
+    scale = np.median(np.abs(dev - typical)) or dev.mean()
+    if scale == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0), dev
+    above = dev > typical + DETECT_FACTOR * scale
+    onsets = np.flatnonzero(above[1:] & ~above[:-1]) + 1
+
+    # every sample within `window` of an onset belongs to that event
+    ends = np.searchsorted(t, t[onsets] + window, side="left")
+    # drop onsets that fall inside the previous event's window
+    if onsets.size:
+        keep = np.concatenate(([True], onsets[1:] >= ends[:-1]))
+        onsets, ends = onsets[keep], ends[keep]
+    in_event = np.zeros(x.size + 1, dtype=np.int64)
+    np.add.at(in_event, onsets, 1)
+    np.add.at(in_event, ends, -1)
+    in_event = np.cumsum(in_event[:-1]) > 0
+
+    peaks = _window_peaks(dev, onsets, ends) if onsets.size else np.empty(0)
+    return onsets, peaks, dev[~in_event]
+
+
+def _window_peaks(dev: np.ndarray, onsets: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """Peak of dev[onset:end] for each event, vectorized via a padded 2-D gather"""
+    lengths = np.maximum(ends - onsets, 1)
+    width = int(lengths.max())
+    index = onsets[:, None] + np.arange(width)
+    mask = np.arange(width) < lengths[:, None]
+    index = np.minimum(index, dev.size - 1)
+    return np.where(mask, dev[index], -np.inf).max(axis=1)
+
+
+class SensingSurvey:
+    """Event and noise amplitude histograms per channel, accumulated over any number of captures"""
+
+    def __init__(self):
+        self.events = {name: AmplitudeHistogram() for name in CHANNELS}
+        self.noise = {name: AmplitudeHistogram() for name in CHANNELS}
+        self.samples = 0
+        self.captures = 0
+
+    def add_capture(self, path: str, block_chunks: int = BLOCK_CHUNKS):
+        """Stream a capture block by block; memory use is independent of its length"""
+        history = open_capture(path, cache_chunks=2)
+        try:
+            for first in range(0, history.chunks, block_chunks):
+                last = min(first + block_chunks, history.chunks)
+                self.add_block(np.concatenate([history.chunk(i) for i in range(first, last)]))
+        finally:
+            history.close()
+        self.captures += 1
+
+    def add_block(self, block: np.ndarray):
+        t = block["t"]
+        for name in CHANNELS:
+            _, peaks, noise = split_events(t, block[name])
+            self.events[name].add(peaks)
+            self.noise[name].add(noise)
+        self.samples += block.size
+
+    def recommend(self) -> Dict[str, dict]:
+        """Suggested sensitivity per channel, with the statistics behind it"""
+        low, high = PARAMETER_RULES["Atrial Sensitivity"]
+        out = {}
+        for name in CHANNELS:
+            event = self.events[name].percentile(EVENT_PERCENTILE)
+            noise = self.noise[name].percentile(NOISE_PERCENTILE)
+            result = {"parameter": PARAMETER_NAMES[name], "events": self.events[name].total,
+                      "event_p5": event, "noise_p999": noise, "recommended": None, "warning": ""}
+            if event is None:
+                result["warning"] = "no intrinsic events detected"
+            else:
+                # as high as undersensing allows gives the most margin against noise
+                value = event / EVENT_MARGIN
+                if value < (noise or 0.0) * NOISE_MARGIN:
+                    result["warning"] = "events too close to the noise floor for a safe margin"
+                value = np.floor(value / SENSITIVITY_STEP) * SENSITIVITY_STEP
+                result["recommended"] = float(np.clip(round(value, 1), low, high))
+            out[name] = result
+        return out
+
+
+def survey_captures(paths: Optional[Iterable[str]] = None, directory: str = CAPTURE_DIR) -> SensingSurvey:
+    """Survey the given captures, or every capture in directory"""
+    if paths is None:
+        paths = [os.path.join(directory, name) for name in list_captures(directory)]
+    survey = SensingSurvey()
+    for path in paths:
+        try:
+            survey.add_capture(path)
+        except (OSError, ValueError) as e:
+            print(f"Skipping capture {path}: {e}")
+    return survey
@@ -0,0 +1,211 @@
+import itertools
+import queue
+import threading
+import time
+from typing import Callable, Optional
+
+# Lower number = served first
+PRIORITY_PARAMETER = 0
+PRIORITY_ECHO = 1
+PRIORITY_BACKGROUND = 2
+
+
+class SerialCommand:
+    """A single request written to the pacemaker and the reply it expects"""
+
+    def __init__(self, payload: bytes, response_size: int = 0, priority: int = PRIORITY_PARAMETER,
+                 timeout: float = 2.0):
+        self.payload = bytes(payload)
+        self.response_size = response_size
+        self.priority = priority
+        self.timeout = timeout
+        self.response: Optional[bytes] = None
+        self.error: Optional[str] = None
+        self._done = threading.Event()
+
+    def finish(self, response: Optional[bytes] = None, error: Optional[str] = None):
+        self.response = response
+        self.error = error
+        self._done.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Block until the command has been executed
+
+        Returns:
+            bool: True if it completed without error
+        """
+        if not self._done.wait(timeout):
+            return False
+        return self.error is None
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+
+class SerialStream:
+    """A request that is re-issued continuously (egram capture) at the lowest priority"""
+
+    def __init__(self, request: bytes, reply_size: int, on_packet: Callable[[bytes], None],
+                 on_stop: Optional[Callable[[str], None]] = None, interval: float = 0.1,
+                 timeout: float = 1.0):
+        self.request = bytes(request)
+        self.reply_size = reply_size
+        self.on_packet = on_packet
+        self.on_stop = on_stop
+        self.interval = interval
+        self.timeout = timeout
+        self.packets = 0
+
+
+class SerialWorker:
+    """
+    Sole owner of the serial port.
+
+    Every read and write happens on this worker's thread. Commands are served
+    highest priority first and, because the pacemaker only ever has one request
+    outstanding, each reply is matched to the command that was just written.
+    An active stream is polled in between commands, so parameter traffic
+    preempts the stream without stopping it.
+    """
+
+    def __init__(self, comm):
+        self.comm = comm
+        self._queue = queue.PriorityQueue()
+        self._seq = itertools.count()
+        self._stream: Optional[SerialStream] = None
+        self._stream_lock = threading.Lock()
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="serial-worker", daemon=True)
+        self._thread.start()
+
+    def stop(self, reason: str = "stopped"):
+        """Stop the worker, failing anything still queued"""
+        if not self._running:
+            return
+        self._running = False
+        # wake the thread if it is blocked on an empty queue
+        self._queue.put((-1, next(self._seq), None))
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=2.0)
+        self._thread = None
+        self._fail_pending(reason)
+        self.stop_stream(reason)
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    def submit(self, payload: bytes, response_size: int = 0, priority: int = PRIORITY_PARAMETER,
+               timeout: float = 2.0) -> SerialCommand:
+        command = SerialCommand(payload, response_size, priority, timeout)
+        if not self._running:
+            command.finish(error="Not connected to pacemaker")
+            return command
+        self._queue.put((priority, next(self._seq), command))
+        return command
+
+    def start_stream(self, stream: SerialStream):
+        with self._stream_lock:
+            previous, self._stream = self._stream, stream
+        # the worker may be blocked waiting for a command with no stream to poll
+        self._queue.put((-1, next(self._seq), None))
+        if previous is not None and previous.on_stop:
+            previous.on_stop("replaced")
+
+    def stop_stream(self, reason: str = "stopped"):
+        with self._stream_lock:
+            stream, self._stream = self._stream, None
+        if stream is not None and stream.on_stop:
+            stream.on_stop(reason)
+
+    @property
+    def streaming(self) -> bool:
+        return self._stream is not None
+
+    def _fail_pending(self, reason: str):
+        while True:
+            try:
+                _, _, command = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if command is not None:
+                command.finish(error=reason)
+
+    def _next_command(self, timeout: Optional[float]):
+        try:
+            _, _, command = self._queue.get(timeout=timeout)
+            return command
+        except queue.Empty:
+            return None
+
+    def _run(self):
+        next_poll = time.monotonic()
+        while self._running:
+            stream = self._stream
+            if stream is None:
+                wait = None
+            else:
+                wait = max(0.0, next_poll - time.monotonic())
+
+            command = self._next_command(wait)
+            if not self._running:
+                break
+            if command is not None:
+                self._execute(command)
+                continue
+
+            stream = self._stream
+            if stream is not None and time.monotonic() >= next_poll:
+                self._poll_stream(stream)
+                next_poll = time.monotonic() + stream.interval
+
+        self._fail_pending("Serial worker stopped")
+
+    def _transact(self, payload: bytes, response_size: int, timeout: float) -> Optional[bytes]:
+        """Write payload and collect exactly response_size bytes, None on failure"""
+        if not self.comm._write(payload):
+            return None
+        if response_size == 0:
+            return b""
+
+        data = bytearray()
+        deadline = time.monotonic() + timeout
+        while len(data) < response_size and time.monotonic() < deadline:
+            waiting = self.comm._bytes_waiting()
+            if waiting is None:
+                return None
+            if waiting:
+                data += self.comm._read(min(waiting, response_size - len(data)))
+            else:
+                time.sleep(0.002)
+        return bytes(data)
+
+    def _execute(self, command: SerialCommand):
+        # Anything left over is stale - drop it so the reply lines up with this request
+        self.comm._flush_input()
+        response = self._transact(command.payload, command.response_size, command.timeout)
+        if response is None:
+            command.finish(error="Serial I/O error")
+        elif len(response) < command.response_size:
+            command.finish(response, error=f"Timed out ({len(response)}/{command.response_size} bytes)")
+        else:
+            command.finish(response)
+
+    def _poll_stream(self, stream: SerialStream):
+        response = self._transact(stream.request, stream.reply_size, stream.timeout)
+        if response is None:
+            return
+        if len(response) == stream.reply_size:
+            stream.packets += 1
+            try:
+                stream.on_packet(response)
+            except Exception as e:
+                print(f"Stream callback error: {e}")
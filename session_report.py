@@ -0,0 +1,372 @@
+import argparse
+import html
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from typing import Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from egram_analysis import CHANNELS, analyze_block
+from egram_store import CAPTURE_DIR, list_captures, open_capture
+from parameters import PacemakerParameters
+
+REPORT_DIR = "data/reports"
+FORMATS = ("html", "png", "pdf")
+DEFAULT_FORMATS = ("html", "png")
+# Written next to a capture when it is saved: who, which mode, what was uploaded and echoed
+SESSION_SUFFIX = ".session.json"
+
+ANALYSIS_WINDOW = 10.0    # s of capture analyzed at a time, so long captures never load whole
+SNAPSHOTS = 3             # evenly spaced egram snapshots per report
+SNAPSHOT_SPAN = 5.0       # s per snapshot
+OVERVIEW_COLUMNS = 1200   # min/max pairs across the whole-capture strip
+
+# Packet field names in wire order from Mode on, as the echo reply returns them
+REPLY_NAMES = tuple(sorted((name for name, offset in PacemakerParameters.FIELDS.items()
+                            if offset >= PacemakerParameters.REPLY_FIELDS.start),
+                           key=PacemakerParameters.FIELDS.get))
+MODE_NAMES = PacemakerParameters.MODE_NAMES
+
+
+def session_path(capture: str) -> str:
+    return os.path.splitext(capture)[0] + SESSION_SUFFIX
+
+
+def write_session(capture: str, packet: Optional[bytes], echo: Optional[bytes], username: Optional[str],
+                  mode: Optional[str], device_id: Optional[str] = None):
+    """Record the session a capture belongs to, so its report can be rendered again later"""
+    info = {"username": username, "mode": mode, "device_id": device_id, "saved": time.time(),
+            "packet": list(packet) if packet is not None else None,
+            "echo": list(echo) if echo is not None else None}
+    try:
+        with open(session_path(capture), "w") as f:
+            json.dump(info, f, indent=4)
+    except OSError as e:
+        print(f"Could not save session info: {e}")
+
+
+def session_job(capture: Optional[str], packet: Optional[bytes] = None, echo: Optional[bytes] = None,
+                username: Optional[str] = None, mode: Optional[str] = None, output: str = REPORT_DIR,
+                formats: Iterable[str] = DEFAULT_FORMATS, name: Optional[str] = None) -> dict:
+    """
+    Everything one report needs, as plain picklable values
+
+    Args:
+        capture: egram capture (.egr or .egz), or None for a parameters-only report
+        packet: the 18-byte parameter packet that was uploaded
+        echo: the board's 18-byte echo reply, for verification
+    """
+    formats = tuple(formats)
+    unknown = set(formats) - set(FORMATS)
+    if unknown:
+        raise ValueError(f"Unknown report format(s) {sorted(unknown)}. Must be among: {list(FORMATS)}")
+    if name is None:
+        name = os.path.splitext(os.path.basename(capture))[0] if capture else time.strftime("session_%Y%m%d_%H%M%S")
+    return {"name": name, "capture": capture, "username": username, "mode": mode, "output": output,
+            "formats": formats, "packet": bytes(packet) if packet is not None else None,
+            "echo": bytes(echo) if echo is not None else None}
+
+
+def stored_sessions(directory: str = CAPTURE_DIR, output: str = REPORT_DIR,
+                    formats: Iterable[str] = DEFAULT_FORMATS) -> List[dict]:
+    """A job for every capture in directory, with its session info where one was saved"""
+    jobs = []
+    for name in list_captures(directory):
+        capture = os.path.join(directory, name)
+        info = {}
+        if os.path.exists(session_path(capture)):
+            try:
+                with open(session_path(capture), "r") as f:
+                    info = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable session info for {name}: {e}")
+        packet, echo = info.get("packet"), info.get("echo")
+        jobs.append(session_job(capture, bytes(packet) if packet else None, bytes(echo) if echo else None,
+                                info.get("username"), info.get("mode"), output, formats))
+    return jobs
+
+
+# ---------------------------------------------------------------------------
+# Rendering (runs inside the worker processes)
+# ---------------------------------------------------------------------------
+
+def display_value(name: str, raw: int) -> str:
+    """Raw packet value in the units the parameter form uses"""
+    if name == "Mode":
+        return MODE_NAMES.get(raw, f"Unknown ({raw})")
+    if "Amplitude" in name:
+        return f"{raw / 10:.1f} V"
+    if "Pulse Width" in name:
+        return f"{raw / 10:.1f} ms"
+    if name in ("ARP", "VRP"):
+        return f"{raw * 10} ms"
+    if "Sensitivity" in name:
+        return f"{raw / 10:.1f} mV"
+    return str(raw)
+
+
+def verify_echo(packet: Optional[bytes], echo: Optional[bytes]) -> List[dict]:
+    """One row per reply field: uploaded and echoed values and whether they agree"""
+    rows = []
+    for name in REPLY_NAMES:
+        offset = PacemakerParameters.FIELDS[name]
+        i = offset - PacemakerParameters.REPLY_FIELDS.start
+        sent = packet[offset] if packet is not None else None
+        got = echo[i] if echo is not None and i < len(echo) else None
+        rows.append({"name": name,
+                     "uploaded": display_value(name, sent) if sent is not None else "—",
+                     "echoed": display_value(name, got) if got is not None else "—",
+                     "match": None if sent is None or got is None else sent == got})
+    return rows
+
+
+def analyze_capture(history, window: float = ANALYSIS_WINDOW) -> dict:
+    """Beat/spike counts and a rate trend over a whole capture, one window at a time"""
+    summary = {name: {"beats": 0, "spikes": 0, "captured": 0} for name in CHANNELS}
+    trend_t, trend = [], {name: [] for name in CHANNELS}
+    t = history.start
+    while t < history.end:
+        data = history.samples_between(t, min(t + window, history.end))
+        t += window
+        if data.size < 2:
+            continue
+        result = analyze_block(data["t"], np.stack([data[name] for name in CHANNELS]))
+        trend_t.append(result["end"])
+        for name in CHANNELS:
+            channel = result[name]
+            summary[name]["beats"] += len(channel["beats"])
+            summary[name]["spikes"] += len(channel["spikes"])
+            if channel["capture"] is not None:
+                summary[name]["captured"] += int(round(channel["capture"] * len(channel["spikes"])))
+            trend[name].append(np.nan if channel["rate"] is None else channel["rate"])
+    for name in CHANNELS:
+        rates = np.asarray(trend[name], dtype=float)
+        counts = summary[name]
+        counts["rate"] = float(np.nanmedian(rates)) if np.isfinite(rates).any() else None
+        counts["capture"] = counts["captured"] / counts["spikes"] if counts["spikes"] else None
+    return {"duration": history.end - history.start, "samples": history.samples, "channels": summary,
+            "trend": (np.asarray(trend_t), {name: np.asarray(v, dtype=float) for name, v in trend.items()})}
+
+
+def _draw(job: dict, echo_rows: List[dict], history, analysis: Optional[dict]):
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    snapshots = SNAPSHOTS if history is not None and history.chunks else 0
+    # parameter table, whole-capture strip, snapshots, rate trend
+    rows = 3 + snapshots if snapshots else 1
+    fig = Figure(figsize=(8.5, 3 + 2.2 * (rows - 1)), dpi=100)
+    FigureCanvasAgg(fig)
+    grid = fig.add_gridspec(rows, 2)
+    title = f"Session {job['name']}"
+    if job["username"]:
+        title += f" - {job['username']}"
+    if job["mode"]:
+        title += f" ({job['mode']})"
+    fig.suptitle(title, fontsize=11)
+
+    # parameter / echo table
+    ax = fig.add_subplot(grid[0, :])
+    ax.axis("off")
+    cells = [[r["name"], r["uploaded"], r["echoed"], {True: "ok", False: "MISMATCH", None: ""}[r["match"]]]
+             for r in echo_rows]
+    table = ax.table(cellText=cells, colLabels=["Parameter", "Uploaded", "Echoed", ""], loc="center",
+                     cellLoc="left")
+    table.auto_set_font_size(False)
+    table.set_fontsize(6)
+    table.scale(1, 0.7)
+    if not snapshots:
+        return fig
+
+    # whole capture from the index's min/max summaries, then a few raw snapshots
+    overview = history.view(history.start, history.end, OVERVIEW_COLUMNS)
+    for col, (name, colour) in enumerate(zip(CHANNELS, "br")):
+        ax = fig.add_subplot(grid[1, col])
+        ax.plot(*overview[name], colour + "-", linewidth=0.5)
+        ax.set_title(f"{name.capitalize()} (whole capture)", fontsize=8)
+        ax.tick_params(labelsize=6)
+    span = history.end - history.start
+    starts = np.linspace(history.start, max(history.end - SNAPSHOT_SPAN, history.start), snapshots)
+    for i, t0 in enumerate(starts):
+        snapshot = history.view(t0, t0 + min(SNAPSHOT_SPAN, span), OVERVIEW_COLUMNS // 2)
+        for col, (name, colour) in enumerate(zip(CHANNELS, "br")):
+            ax = fig.add_subplot(grid[2 + i, col])
+            ax.plot(*snapshot[name], colour + "-", linewidth=0.6)
+            ax.set_title(f"{name.capitalize()} at {t0:.1f} s", fontsize=8)
+            ax.tick_params(labelsize=6)
+
+    # per-window rates across the bottom
+    ax = fig.add_subplot(grid[rows - 1, :])
+    trend_t, trend = analysis["trend"]
+    for name, colour in zip(CHANNELS, "br"):
+        ax.plot(trend_t, trend[name], colour + ".-", linewidth=0.8, markersize=3, label=name.capitalize())
+    ax.set_title(f"Rate per {ANALYSIS_WINDOW:g} s window", fontsize=8)
+    ax.set_xlabel("Time (s)", fontsize=6)
+    ax.set_ylabel("bpm", fontsize=6)
+    ax.tick_params(labelsize=6)
+    ax.legend(fontsize=6)
+    # fixed margins: tight_layout would measure every artist and cost more than the drawing itself
+    fig.subplots_adjust(left=0.07, right=0.98, bottom=0.04, top=0.95, hspace=0.6, wspace=0.2)
+    return fig
+
+
+def _html(job: dict, echo_rows: List[dict], analysis: Optional[dict], image: Optional[str]) -> str:
+    e = html.escape
+    parts = [f"<!DOCTYPE html><html><head><meta charset='utf-8'><title>{e(job['name'])}</title>",
+             "<style>body{font-family:sans-serif}td,th{padding:2px 8px;text-align:left}"
+             ".bad{color:#c00;font-weight:bold}</style></head><body>",
+             f"<h1>Session {e(job['name'])}</h1>",
+             f"<p>User: {e(job['username'] or '—')} &nbsp; Mode: {e(job['mode'] or '—')} &nbsp; "
+             f"Rendered {time.strftime('%Y-%m-%d %H:%M:%S')}</p>", "<h2>Parameters</h2>"]
+    if job["packet"] is None:
+        parts.append("<p>No uploaded parameters were recorded for this session.</p>")
+    else:
+        verdict = [r["match"] for r in echo_rows]
+        if job["echo"] is None:
+            parts.append("<p>No echo from the board to verify against.</p>")
+        elif all(verdict):
+            parts.append("<p>Echo verification: every field matches.</p>")
+        else:
+            parts.append(f"<p class='bad'>Echo verification: {verdict.count(False)} field(s) differ.</p>")
+        parts.append("<table><tr><th>Parameter</th><th>Uploaded</th><th>Echoed</th><th></th></tr>")
+        for r in echo_rows:
+            flag = {True: "ok", False: "<span class='bad'>mismatch</span>", None: ""}[r["match"]]
+            parts.append(f"<tr><td>{e(r['name'])}</td><td>{e(r['uploaded'])}</td><td>{e(r['echoed'])}</td>"
+                         f"<td>{flag}</td></tr>")
+        parts.append("</table>")
+    if analysis is not None:
+        parts.append(f"<h2>Egram</h2><p>{analysis['samples']} samples over {analysis['duration']:.1f} s</p>")
+        parts.append("<table><tr><th>Channel</th><th>Beats</th><th>Median rate</th><th>Pacing spikes</th>"
+                     "<th>Capture</th></tr>")
+        for name, c in analysis["channels"].items():
+            rate = f"{c['rate']:.0f} bpm" if c["rate"] else "—"
+            capture = f"{c['capture'] * 100:.0f}%" if c["capture"] is not None else "—"
+            parts.append(f"<tr><td>{name.capitalize()}</td><td>{c['beats']}</td><td>{rate}</td>"
+                         f"<td>{c['spikes']}</td><td>{capture}</td></tr>")
+        parts.append("</table>")
+    if image is not None:
+        parts.append(f"<p><img src='{e(os.path.basename(image))}' style='max-width:100%'></p>")
+    parts.append("</body></html>")
+    return "\n".join(parts)
+
+
+def render_report(job: dict) -> Dict[str, str]:
+    """
+    Render one report (worker entry point)
+
+    Returns:
+        dict: format -> path written
+    """
+    os.makedirs(job["output"], exist_ok=True)
+    base = os.path.join(job["output"], job["name"])
+    echo_rows = verify_echo(job["packet"], job["echo"])
+    history = analysis = None
+    if job["capture"] and os.path.exists(job["capture"]):
+        history = open_capture(job["capture"])
+    try:
+        if history is not None and history.chunks:
+            analysis = analyze_capture(history)
+        written = {}
+        formats = job["formats"]
+        # the HTML page shows the PNG, so asking for HTML renders the PNG too
+        if formats:
+            fig = _draw(job, echo_rows, history, analysis)
+            if "png" in formats or "html" in formats:
+                fig.savefig(base + ".png")
+                written["png"] = base + ".png"
+            if "pdf" in formats:
+                fig.savefig(base + ".pdf")
+                written["pdf"] = base + ".pdf"
+        if "html" in formats:
+            with open(base + ".html", "w", encoding="utf-8") as f:
+                f.write(_html(job, echo_rows, analysis, written.get("png")))
+            written["html"] = base + ".html"
+        return written
+    finally:
+        if history is not None:
+            history.close()
+
+
+# ---------------------------------------------------------------------------
+# Front ends
+# ---------------------------------------------------------------------------
+
+class ReportQueue:
+    """
+    Renders reports in a background process pool.
+
+    submit() returns immediately; on_done(job, paths, error) is called from a
+    pool callback thread when the report is written, so GUI callers should
+    hop back to their own thread (e.g. with after()).
+    """
+
+    def __init__(self, workers: int = 1):
+        self.workers = workers
+        self._pool = None
+
+    def submit(self, job: dict, on_done: Optional[Callable] = None) -> Future:
+        if self._pool is None:
+            # spawned workers start clean instead of inheriting the GUI's threads and Tk state
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        future = self._pool.submit(render_report, job)
+        if on_done is not None:
+            future.add_done_callback(lambda f: self._done(f, job, on_done))
+        return future
+
+    @staticmethod
+    def _done(future: Future, job: dict, on_done: Callable):
+        if future.cancelled():
+            return
+        error = future.exception()
+        try:
+            on_done(job, None if error else future.result(), error)
+        except Exception as e:
+            print(f"Report callback error: {e}")
+
+    def close(self, wait: bool = True):
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait, cancel_futures=True)
+            self._pool = None
+
+
+def render_batch(jobs: List[dict], workers: Optional[int] = None,
+                 on_progress: Optional[Callable[[int, int, dict, Optional[Exception]], None]] = None) -> List[dict]:
+    """
+    Render many reports in parallel, one worker per CPU by default
+
+    Returns:
+        list: one {"job", "paths", "error"} per job, in completion order
+    """
+    results = []
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        futures = {pool.submit(render_report, job): job for job in jobs}
+        for future in as_completed(futures):
+            job = futures[future]
+            error = future.exception()
+            results.append({"job": job, "paths": None if error else future.result(), "error": error})
+            if on_progress is not None:
+                on_progress(len(results), len(jobs), job, error)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render a report for every stored egram session")
+    parser.add_argument("directory", nargs="?", default=CAPTURE_DIR)
+    parser.add_argument("--output", default=REPORT_DIR)
+    parser.add_argument("--formats", default=",".join(DEFAULT_FORMATS), help=f"comma separated, from {FORMATS}")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    jobs = stored_sessions(args.directory, args.output, args.formats.split(","))
+
+    def progress(done, total, job, error):
+        print(f"[{done}/{total}] {job['name']}: {'failed - ' + str(error) if error else 'ok'}")
+
+    started = time.monotonic()
+    results = render_batch(jobs, args.workers, progress)
+    failed = sum(1 for r in results if r["error"])
+    print(f"Rendered {len(results) - failed} reports ({failed} failed) in {time.monotonic() - started:.1f} s")
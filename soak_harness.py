@@ -0,0 +1,623 @@
+import argparse
+import json
+import os
+import select
+import shutil
+import struct
+import tempfile
+import threading
+import time
+import tracemalloc
+from typing import Dict, List, Optional
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from device_cache import FN_IDENTIFY, IDENTITY_FORMAT, DeviceCache
+from capture_engine import ACTIVITY_RING_CAPACITY, MARKER_RING_CAPACITY, RingPump, SampleRing
+from egram_analysis import EgramAnalyzer
+from egram_display import EgramDisplay
+from egram_frame import (ACTIVITY_CHANNELS, DEFAULT_CHANNELS, FN_EGRAM_FRAME, MARKER_SLOTS, SYNC, FrameTimebase,
+                         build_frame_request, decode_frames, encode_frame, frame_size)
+from egram_markers import AS, VS, frame_events
+from egram_store import EgramRecorder
+from main_page import (DISPLAY_INTERVAL_MS, DISPLAY_QUEUE_BLOCKS, FRAME_SAMPLES, RAW_PUT_TIMEOUT, RAW_QUEUE_BLOCKS,
+                       RECORDER_PUT_TIMEOUT, RECORDER_QUEUE_BLOCKS)
+from pacing_sim import synthetic_egram
+from parameters import BAUD, PacemakerCommunicator, PacemakerParameters
+from pipeline import DROP_NEVER, DROP_OLDEST, BoundedChannel, ChannelClosed, ConsumerThread, SampleBus
+from serial_io import PRIORITY_ECHO
+
+try:
+    import resource
+except ImportError:  # not on Windows; RSS then comes from /proc only
+    resource = None
+
+# Defaults for a run
+DEFAULT_DURATION = 3600.0      # s
+DEFAULT_RATE = 1000.0          # simulated egram samples per second per channel
+SAMPLE_INTERVAL = 10.0         # s between measurements
+WARMUP = 60.0                  # s excluded from growth and drift baselines (caches, JIT-ish first draws)
+COMMAND_INTERVAL = 5.0         # s between parameter upload + echo round trips
+ANALYSIS_INTERVAL = 1.0        # s, as on the egram page
+ANALYSIS_WINDOW = 10.0
+TOP_ALLOCATORS = 10
+
+# Default budgets
+RSS_GROWTH_BUDGET = 20.0       # MB/hour of RSS growth not explained by retained egram history
+RETAINED_GROWTH_BUDGET = 5.0   # MB/hour; the display keeps a fixed horizon, so its history must level off
+# s of steady measurements before the growth budgets apply: over a few minutes one allocator
+# step of a MB or two reads as tens of MB/hour while RSS is flat
+MIN_GROWTH_SPAN = 900.0
+LATENCY_DRIFT_RATIO = 2.0      # last window's p95 may not exceed this multiple of the baseline p95...
+LATENCY_DRIFT_FLOOR = 0.005    # ...or the baseline plus this many seconds, whichever is larger
+FRAME_LOSS_BUDGET = 0.001      # fraction of frames lost on the link
+DISPLAY_DROP_BUDGET = 0.01     # fraction of samples the display queue may shed
+
+STAGES = ("link", "decode", "display", "render", "command", "analysis")
+
+
+class SimulatedPacemaker:
+    """
+    Pacemaker on the far side of a pseudo-terminal.
+
+    Answers identify, echo and parameter writes like the board, and compact
+    egram frames paced in real time at `rate` samples per second, so the
+    communicator, serial worker and decoder run exactly as against hardware.
+    Frames carry the activity / sensor rate channels and sense markers when
+    asked for them, as rate-adaptive firmware does. Each frame's send time is
+    kept for link latency.
+    """
+
+    def __init__(self, rate: float = DEFAULT_RATE, heart_rate: float = 70.0, uid: bytes = b"SOAK0001"):
+        self.master, self._slave = os.openpty()
+        self.port = os.ttyname(self._slave)
+        self.rate = rate
+        self.uid = uid
+        self.packet = bytearray(PacemakerParameters.DEFAULTS)
+        # a 10 s loop of synthetic rhythm, read cyclically
+        _, self._atrial, self._ventricular = synthetic_egram(10.0, heart_rate, fs=rate)
+        # a sense marker where each deflection starts
+        self._events = np.zeros(self._atrial.size, dtype=np.uint8)
+        for signal, code in ((self._atrial, AS), (self._ventricular, VS)):
+            active = signal != 0
+            self._events[1:][active[1:] & ~active[:-1]] = code
+        self.sent_at = np.zeros(1 << 16)
+        self.frames = 0
+        self.requests = 0
+        self._start = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="simulated-pacemaker", daemon=True)
+        self._thread.start()
+
+    def _reply(self, request: bytes) -> Optional[bytes]:
+        fn = request[1]
+        if fn == FN_IDENTIFY:
+            body = struct.pack(IDENTITY_FORMAT, SYNC, FN_IDENTIFY, self.uid, 1, 0, 0, 1)
+            return body + bytes([sum(body) & 0xFF])
+        if fn == 0x55:
+            self.packet[:] = request
+            return None
+        if fn == 0x22:
+            return bytes(self.packet[2:]) + bytes(2)
+        if (fn == FN_EGRAM_FRAME and request[3] in (0, DEFAULT_CHANNELS, ACTIVITY_CHANNELS)
+                and request[4] in (0, MARKER_SLOTS)):
+            return self._frame(request[2], request[3] == ACTIVITY_CHANNELS, request[4])
+        return None
+
+    def _frame(self, samples: int, activity: bool = False, markers: int = 0) -> bytes:
+        if self._start is None:
+            self._start = time.monotonic()
+        # the board buffers frames; it can't hand one over before its last sample exists
+        due = self._start + (self.frames + 1) * samples / self.rate
+        wait = due - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        n = self.frames * samples + np.arange(samples)
+        i = n % self._atrial.size
+        seq = self.frames & 0xFFFF
+        extra = {}
+        if activity:
+            # a slow one-minute swell of accelerometer activity and the rate it drives
+            level = np.round(20 + 15 * np.sin(2 * np.pi * n / (60 * self.rate)))
+            extra.update(activity=level, sensor_rate=70 + level)
+        if markers:
+            index = np.flatnonzero(self._events[i])
+            extra.update(markers=list(zip(index, self._events[i][index])), marker_slots=markers)
+        frame = encode_frame(seq, self._atrial[i], self._ventricular[i], period_us=int(round(1e6 / self.rate)),
+                             **extra)
+        self.sent_at[seq] = time.monotonic()
+        self.frames += 1
+        return frame
+
+    def _run(self):
+        pending = bytearray()
+        while not self._stop.is_set():
+            ready, _, _ = select.select([self.master], [], [], 0.1)
+            if not ready:
+                continue
+            try:
+                pending += os.read(self.master, 4096)
+            except OSError:
+                return
+            while len(pending) >= 18:
+                start = pending.find(SYNC)
+                if start < 0:
+                    pending.clear()
+                    break
+                del pending[:start]
+                if len(pending) < 18:
+                    break
+                request, pending[:] = bytes(pending[:18]), pending[18:]
+                self.requests += 1
+                reply = self._reply(request)
+                if reply is not None:
+                    os.write(self.master, reply)
+
+    def close(self):
+        self._stop.set()
+        self._thread.join(1.0)
+        os.close(self.master)
+        os.close(self._slave)
+
+
+class LatencyTracker:
+    """Per-stage latency samples, summarized into percentiles once per measurement window"""
+
+    def __init__(self, stages=STAGES):
+        self._lock = threading.Lock()
+        self._window: Dict[str, List[float]] = {stage: [] for stage in stages}
+        self.history: Dict[str, List[dict]] = {stage: [] for stage in stages}
+
+    def add(self, stage: str, seconds: float):
+        with self._lock:
+            self._window[stage].append(seconds)
+
+    def roll(self, elapsed: float) -> Dict[str, dict]:
+        """Close the current window: percentiles per stage, appended to history"""
+        with self._lock:
+            window = {stage: np.asarray(values) for stage, values in self._window.items()}
+            for values in self._window.values():
+                values.clear()
+        summary = {}
+        for stage, values in window.items():
+            if values.size == 0:
+                continue
+            p50, p95, p99 = np.percentile(values, [50, 95, 99]).tolist()
+            summary[stage] = {"t": elapsed, "count": int(values.size), "p50": p50, "p95": p95, "p99": p99,
+                              "max": float(values.max())}
+            self.history[stage].append(summary[stage])
+        return summary
+
+
+class SoakBudget:
+    """Limits a soak run must stay within; None disables a check"""
+
+    def __init__(self, rss_growth: Optional[float] = RSS_GROWTH_BUDGET,
+                 latency_drift: Optional[float] = LATENCY_DRIFT_RATIO,
+                 latency_floor: float = LATENCY_DRIFT_FLOOR,
+                 frame_loss: Optional[float] = FRAME_LOSS_BUDGET,
+                 display_drop: Optional[float] = DISPLAY_DROP_BUDGET,
+                 retained_growth: Optional[float] = RETAINED_GROWTH_BUDGET,
+                 growth_span: float = MIN_GROWTH_SPAN):
+        self.rss_growth = rss_growth            # MB/hour, RSS growth minus retained egram history
+        self.latency_drift = latency_drift      # ratio of last to baseline p95
+        self.latency_floor = latency_floor      # s
+        self.frame_loss = frame_loss            # fraction
+        self.display_drop = display_drop        # fraction
+        self.retained_growth = retained_growth  # MB/hour of egram history the display keeps
+        self.growth_span = growth_span          # s of steady measurements before the growth budgets apply
+
+
+def rss_bytes() -> int:
+    """Current resident set size (Linux /proc), or the peak where /proc isn't available"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        if resource is None:
+            return 0
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def growth_per_hour(t: np.ndarray, values: np.ndarray) -> float:
+    """Slope of a least-squares line through (t, values), per hour"""
+    if t.size < 2 or np.ptp(t) == 0:
+        return 0.0
+    return float(np.polyfit(t, values, 1)[0] * 3600.0)
+
+
+def growth_interval_per_hour(t: np.ndarray, values: np.ndarray) -> float:
+    """Half-width of the ~95% confidence interval of growth_per_hour, from the fit's residuals"""
+    if t.size < 3 or np.ptp(t) == 0:
+        return float("inf")
+    slope, intercept = np.polyfit(t, values, 1)
+    residuals = values - (slope * t + intercept)
+    stderr = np.sqrt(np.sum(residuals ** 2) / (t.size - 2) / np.sum((t - t.mean()) ** 2))
+    return float(1.96 * stderr * 3600.0)
+
+
+def peak_growth_per_hour(t: np.ndarray, values: np.ndarray) -> float:
+    """
+    Rise of the peak from the first half of the run to the second, per hour
+
+    For memory that is trimmed in steps (a sawtooth), which a line fit over a
+    few periods reads as growth; steady growth still shows at its full rate.
+    """
+    half = t.size // 2
+    if half == 0 or t[-1] == t[half - 1]:
+        return 0.0
+    return float((values[half:].max() - values[:half].max()) / (t[-1] - t[half - 1]) * 3600.0)
+
+
+class SoakDisplay:
+    """
+    The egram page's display path without Tk: the page's EgramDisplay fed
+    from DROP_OLDEST queues for the egram, activity and markers, redrawn
+    with Agg. Artists are created once and only updated, so the artist count
+    must stay flat over the run.
+    """
+
+    def __init__(self, bus: SampleBus):
+        self.channel = bus.subscribe("display", DISPLAY_QUEUE_BLOCKS, DROP_OLDEST)
+        self.activity_channel = BoundedChannel("activity display", DISPLAY_QUEUE_BLOCKS, DROP_OLDEST)
+        self.marker_channel = BoundedChannel("marker display", DISPLAY_QUEUE_BLOCKS, DROP_OLDEST)
+        self.display = EgramDisplay()
+        self.canvas = FigureCanvasAgg(self.display.fig)
+        self.canvas.draw()
+
+    @property
+    def artists(self) -> int:
+        return self.display.artists
+
+    @property
+    def retained_bytes(self) -> int:
+        return self.display.retained_bytes
+
+    @property
+    def latest(self) -> Optional[float]:
+        return self.display.latest
+
+    # RingPump callbacks, as on the egram page
+    def on_activity_block(self, times, activity, sensor_rate):
+        self.activity_channel.put((times, activity, sensor_rate), samples=times.size)
+
+    def on_marker_block(self, times, codes, _):
+        self.marker_channel.put((times, codes.astype(np.uint8)), samples=times.size)
+
+    def drain(self) -> int:
+        blocks = self.channel.drain()
+        for times, atrial, ventricular in blocks:
+            self.display.add_data_block(times, atrial, ventricular)
+        for times, activity, sensor_rate in self.activity_channel.drain():
+            self.display.add_activity_block(times, activity, sensor_rate)
+        for times, codes in self.marker_channel.drain():
+            self.display.add_marker_block(times, codes)
+        return len(blocks)
+
+    def render(self):
+        if self.display.update() is not None:
+            self.canvas.draw()
+
+
+class SoakHarness:
+    """
+    Runs the capture pipeline against a SimulatedPacemaker for `duration` seconds.
+
+    communicator -> serial worker -> raw queue -> decoder -> SampleBus ->
+    display (Agg) / recorder / analysis process, with a parameter upload and
+    echo round trip every COMMAND_INTERVAL. Every `interval` seconds it
+    samples RSS, tracemalloc, queue depths and per-stage latency percentiles;
+    check() then holds the run against a SoakBudget.
+    """
+
+    def __init__(self, duration: float = DEFAULT_DURATION, rate: float = DEFAULT_RATE,
+                 interval: float = SAMPLE_INTERVAL, warmup: float = WARMUP, record: bool = False,
+                 budget: Optional[SoakBudget] = None, trace: bool = True, verbose: bool = True):
+        self.duration = duration
+        self.rate = rate
+        self.interval = interval
+        self.warmup = min(warmup, duration / 2)
+        self.record = record
+        # tracemalloc makes every allocation several times slower; latencies stay comparable within a run
+        self.trace = trace
+        self.budget = budget or SoakBudget()
+        self.verbose = verbose
+        self.latency = LatencyTracker()
+        self.samples: List[dict] = []
+        self.failures: List[str] = []
+        self.warnings: List[str] = []
+        self.command_errors = 0
+        self.echo_mismatches = 0
+        self._workdir = None
+        self._stop = threading.Event()
+
+    # Pipeline stages
+    def _on_frame(self, frame: bytes):
+        try:
+            # the channel's short put timeout, as on the egram page: a stuck decoder must not stall the serial worker
+            self.raw_channel.put((frame, time.monotonic()))
+        except ChannelClosed:
+            pass
+
+    def _decode(self, item):
+        frame, arrival = item
+        block = decode_frames(frame, FRAME_SAMPLES, ACTIVITY_CHANNELS, MARKER_SLOTS)
+        if not block.valid[0]:
+            return
+        seq = int(block.seq[0])
+        self.latency.add("link", arrival - self.device.sent_at[seq])
+        times = self.timebase.place(seq, FRAME_SAMPLES, int(block.period_us[0]), arrival) - self.start_time
+        self.activity_ring.write(times, block.activity, block.sensor_rate)
+        event_times, codes = frame_events(block, times, FRAME_SAMPLES)
+        self.marker_ring.write(event_times, codes, np.zeros(codes.size))
+        self.bus.publish((times, block.atrial, block.ventricular), samples=times.size)
+        self.latency.add("decode", time.monotonic() - arrival)
+
+    def _on_analysis(self, result):
+        submitted = self._analysis_submitted
+        if submitted is not None:
+            self.latency.add("analysis", time.monotonic() - submitted)
+
+    def _commands(self):
+        """Upload a changed parameter set and read it back, as the parameter page does"""
+        params = PacemakerParameters()
+        lrl = 60
+        while not self._stop.wait(COMMAND_INTERVAL):
+            lrl = 60 if lrl >= 90 else lrl + 5
+            params.set_parameter("Lower Rate Limit", lrl)
+            started = time.monotonic()
+            if not self.comm.send_raw_parameters(params.get_parameter_bytes()):
+                self.command_errors += 1
+                continue
+            echo = bytearray(params.get_parameter_bytes())
+            echo[1] = 0x22
+            reply, error = self.comm.request(bytes(echo), 18, PRIORITY_ECHO, 2.0)
+            self.latency.add("command", time.monotonic() - started)
+            if reply is None or len(reply) != 18:
+                print(f"Echo after upload failed: {error or 'short reply'}")
+                self.command_errors += 1
+            elif reply[:16] != params.get_parameter_bytes()[PacemakerParameters.REPLY_FIELDS]:
+                self.echo_mismatches += 1
+
+    def _record_sink(self, block):
+        self.recorder.extend(*block)
+
+    # Measurement
+    def _measure(self, elapsed: float) -> dict:
+        window = self.latency.roll(elapsed)
+        stats = {name: {"depth": s["depth"], "high_water": s["high_water"], "dropped_samples": s["dropped_samples"]}
+                 for name, s in self.bus.stats().items()}
+        raw = self.raw_channel.stats()
+        stats["raw"] = {"depth": raw["depth"], "high_water": raw["high_water"], "dropped_samples": raw["dropped_samples"]}
+        traced, traced_peak = tracemalloc.get_traced_memory()
+        sample = {"t": elapsed, "rss": rss_bytes(), "traced": traced, "traced_peak": traced_peak,
+                  "tracer": tracemalloc.get_tracemalloc_memory(),
+                  "retained": self.display.retained_bytes, "artists": self.display.artists,
+                  "frames": self.timebase.frames, "lost_frames": self.timebase.lost_frames,
+                  "queues": stats, "latency": window}
+        self.samples.append(sample)
+        if self.verbose:
+            p95 = "  ".join(f"{stage} {s['p95'] * 1000:.1f}" for stage, s in window.items())
+            depths = " ".join(f"{name}={q['depth']}/{q['high_water']}" for name, q in stats.items())
+            print(f"[{elapsed:7.0f} s] rss {sample['rss'] / 2**20:7.1f} MB  retained "
+                  f"{sample['retained'] / 2**20:6.1f} MB  traced {traced / 2**20:6.1f} MB  artists "
+                  f"{sample['artists']}  queues {depths}  p95 ms: {p95}")
+        return sample
+
+    def run(self) -> bool:
+        """Run for the configured duration, returns True if every budget held"""
+        self._workdir = tempfile.mkdtemp(prefix="soak_")
+        if self.trace:
+            tracemalloc.start()
+        self.device = SimulatedPacemaker(self.rate)
+        self.comm = PacemakerCommunicator(self.device.port, BAUD, auto_reconnect=False)
+        # keep the run's device cache out of the real one
+        self.comm.device_cache = DeviceCache(os.path.join(self._workdir, "devices.json"))
+        self.bus = SampleBus()
+        self.display = SoakDisplay(self.bus)
+        self.timebase = FrameTimebase()
+        # activity and markers take the egram page's route: ring -> pump -> display queue
+        self.activity_ring = SampleRing(ACTIVITY_RING_CAPACITY)
+        self.marker_ring = SampleRing(MARKER_RING_CAPACITY)
+        pumps = [RingPump(self.activity_ring, self.display.on_activity_block, interval=0.05),
+                 RingPump(self.marker_ring, self.display.on_marker_block, interval=0.05)]
+        self.raw_channel = BoundedChannel("raw", RAW_QUEUE_BLOCKS, DROP_NEVER, put_timeout=RAW_PUT_TIMEOUT)
+        self.decoder = ConsumerThread(self.raw_channel, self._decode, name="soak-decoder")
+        self.analyzer = EgramAnalyzer(self._on_analysis)
+        self._analysis_submitted = None
+        self.recorder = record_consumer = None
+        if self.record:
+            self.recorder = EgramRecorder(os.path.join(self._workdir, "soak.egr"))
+            channel = self.bus.subscribe("recorder", RECORDER_QUEUE_BLOCKS, DROP_NEVER,
+                                         put_timeout=RECORDER_PUT_TIMEOUT)
+            record_consumer = ConsumerThread(channel, self._record_sink, name="soak-recorder")
+        commander = threading.Thread(target=self._commands, name="soak-commands", daemon=True)
+
+        try:
+            if not self.comm.connect():
+                self.failures.append("could not connect to the simulated pacemaker")
+                return False
+            self.start_time = time.monotonic()
+            request = build_frame_request(FRAME_SAMPLES, ACTIVITY_CHANNELS, MARKER_SLOTS)
+            self.comm.start_stream(request, frame_size(FRAME_SAMPLES, ACTIVITY_CHANNELS, MARKER_SLOTS),
+                                   self._on_frame, interval=0.0)
+            commander.start()
+
+            started = time.monotonic()
+            next_sample = started + self.interval
+            next_analysis = started + ANALYSIS_INTERVAL
+            snapshot_base = None
+            while True:
+                now = time.monotonic()
+                elapsed = now - started
+                if elapsed >= self.duration:
+                    break
+                self.display.drain()
+                latest = self.display.latest
+                if latest is not None:
+                    # age of the newest sample on screen: device clock placed onto ours by the timebase
+                    self.latency.add("display", now - (self.start_time + latest))
+                    self.display.render()
+                    self.latency.add("render", time.monotonic() - now)
+                if now >= next_analysis and latest is not None:
+                    next_analysis = now + ANALYSIS_INTERVAL
+                    self._analysis_submitted = time.monotonic()
+                    self.analyzer.submit(*self.display.display.recent(ANALYSIS_WINDOW))
+                if now >= next_sample:
+                    next_sample += self.interval
+                    # the baseline snapshot stays in memory; take it before the first steady measurement
+                    if self.trace and snapshot_base is None and elapsed >= self.warmup:
+                        snapshot_base = tracemalloc.take_snapshot()
+                    self._measure(elapsed)
+                time.sleep(max(0.0, DISPLAY_INTERVAL_MS / 1000.0 - (time.monotonic() - now)))
+            self._top = self._top_allocators(snapshot_base)
+        finally:
+            self._stop.set()
+            if commander.is_alive():
+                commander.join()
+            self.comm.stop_stream()
+            self.raw_channel.close()
+            self.decoder.join(2.0)
+            for pump in pumps:
+                pump.stop()
+            self.activity_ring.close()
+            self.marker_ring.close()
+            if record_consumer is not None:
+                self.bus.unsubscribe("recorder")
+                record_consumer.join()
+                self.recorder.close()
+            self.analyzer.close()
+            self.comm.disconnect()
+            self.device.close()
+            tracemalloc.stop()
+            shutil.rmtree(self._workdir, ignore_errors=True)
+        return self.check()
+
+    @staticmethod
+    def _top_allocators(base) -> List[str]:
+        if base is None:
+            return []
+        stats = tracemalloc.take_snapshot().compare_to(base, "lineno")
+        return [str(stat) for stat in stats[:TOP_ALLOCATORS]]
+
+    # Budgets
+    def check(self) -> bool:
+        budget = self.budget
+        steady = [s for s in self.samples if s["t"] >= self.warmup]
+        if len(steady) < 2:
+            self.failures.append(f"too few measurements after warmup ({len(steady)}); run longer")
+            return False
+        t = np.array([s["t"] for s in steady])
+        rss = np.array([s["rss"] for s in steady], dtype=float) / 2**20
+        retained = np.array([s["retained"] for s in steady], dtype=float) / 2**20
+        # tracemalloc's own bookkeeping grows with every live allocation it tracks
+        tracer = np.array([s["tracer"] for s in steady], dtype=float) / 2**20
+        self.rss_growth = growth_per_hour(t, rss)
+        self.retained_growth = peak_growth_per_hour(t, retained)
+        self.unexplained_growth = growth_per_hour(t, rss - retained - tracer)
+        self.unexplained_interval = growth_interval_per_hour(t, rss - retained - tracer)
+        span = float(t[-1] - t[0])
+        enforce_growth = span >= budget.growth_span
+        if not enforce_growth:
+            self.warnings.append(f"growth budgets not enforced: {span:.0f} s of steady measurements, "
+                                 f"need {budget.growth_span:g} s")
+        if (enforce_growth and budget.rss_growth is not None
+                and self.unexplained_growth > budget.rss_growth):
+            self.failures.append(f"RSS grows {self.unexplained_growth:.1f} ± {self.unexplained_interval:.1f} MB/h "
+                                 f"beyond retained egram history (budget {budget.rss_growth:g} MB/h)")
+        if (enforce_growth and budget.retained_growth is not None
+                and self.retained_growth > budget.retained_growth):
+            self.failures.append(f"retained egram history grows {self.retained_growth:.1f} MB/h "
+                                 f"(budget {budget.retained_growth:g} MB/h)")
+        if steady[-1]["artists"] != steady[0]["artists"]:
+            self.failures.append(f"figure artists went from {steady[0]['artists']} to {steady[-1]['artists']}")
+
+        if budget.latency_drift is not None:
+            for stage, history in self.latency.history.items():
+                windows = [w for w in history if w["t"] >= self.warmup]
+                if len(windows) < 2:
+                    continue
+                # median of the first few steady windows, so one slow window can't set the baseline
+                baseline = float(np.median([w["p95"] for w in windows[:3]]))
+                last = windows[-1]["p95"]
+                limit = max(baseline * budget.latency_drift, baseline + budget.latency_floor)
+                if last > limit:
+                    self.failures.append(f"{stage} p95 drifted from {baseline * 1000:.1f} ms to {last * 1000:.1f} ms "
+                                         f"(limit {limit * 1000:.1f} ms)")
+
+        last = self.samples[-1]
+        total = last["frames"] + last["lost_frames"]
+        loss = last["lost_frames"] / total if total else 0.0
+        if budget.frame_loss is not None and loss > budget.frame_loss:
+            self.failures.append(f"{loss * 100:.3f}% of frames lost (budget {budget.frame_loss * 100:g}%)")
+        display = self.bus.stats().get("display")
+        if budget.display_drop is not None and display is not None and display["put"]:
+            dropped = display["dropped"] / display["put"]
+            if dropped > budget.display_drop:
+                self.failures.append(f"display queue dropped {dropped * 100:.2f}% of blocks "
+                                     f"(budget {budget.display_drop * 100:g}%)")
+        # the never-drop queues must never have had to
+        for name in ("raw", "recorder"):
+            queue = last["queues"].get(name)
+            if queue is not None and queue["dropped_samples"]:
+                self.failures.append(f"{name} queue lost {queue['dropped_samples']} samples")
+        if self.command_errors or self.echo_mismatches:
+            self.failures.append(f"{self.command_errors} parameter commands failed, "
+                                 f"{self.echo_mismatches} echoes did not match the upload")
+        return not self.failures
+
+    def report(self) -> dict:
+        return {"duration": self.duration, "rate": self.rate, "warmup": self.warmup,
+                "passed": not self.failures, "failures": self.failures,
+                "rss_growth_mb_per_hour": getattr(self, "rss_growth", None),
+                "retained_growth_mb_per_hour": getattr(self, "retained_growth", None),
+                "unexplained_growth_mb_per_hour": getattr(self, "unexplained_growth", None),
+                "unexplained_growth_interval_mb_per_hour": getattr(self, "unexplained_interval", None),
+                "warnings": self.warnings,
+                "top_allocators": getattr(self, "_top", []),
+                "samples": self.samples}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Soak the egram pipeline against a simulated pacemaker")
+    parser.add_argument("--duration", type=float, default=DEFAULT_DURATION, help="seconds")
+    parser.add_argument("--rate", type=float, default=DEFAULT_RATE, help="samples/s per channel")
+    parser.add_argument("--interval", type=float, default=SAMPLE_INTERVAL, help="seconds between measurements")
+    parser.add_argument("--warmup", type=float, default=WARMUP)
+    parser.add_argument("--record", action="store_true", help="also record every sample to a scratch capture")
+    parser.add_argument("--no-tracemalloc", dest="trace", action="store_false",
+                        help="skip allocation tracing, for latencies closer to an untraced run")
+    parser.add_argument("--rss-growth", type=float, default=RSS_GROWTH_BUDGET, help="MB/hour")
+    parser.add_argument("--retained-growth", type=float, default=RETAINED_GROWTH_BUDGET, help="MB/hour")
+    parser.add_argument("--growth-span", type=float, default=MIN_GROWTH_SPAN,
+                        help="seconds of steady measurements before the growth budgets apply")
+    parser.add_argument("--latency-drift", type=float, default=LATENCY_DRIFT_RATIO)
+    parser.add_argument("--frame-loss", type=float, default=FRAME_LOSS_BUDGET)
+    parser.add_argument("--display-drop", type=float, default=DISPLAY_DROP_BUDGET)
+    parser.add_argument("--report", help="write the full measurement log as JSON here")
+    args = parser.parse_args()
+
+    budget = SoakBudget(args.rss_growth, args.latency_drift, LATENCY_DRIFT_FLOOR, args.frame_loss,
+                        args.display_drop, args.retained_growth, args.growth_span)
+    harness = SoakHarness(args.duration, args.rate, args.interval, args.warmup, args.record, budget, args.trace)
+    passed = harness.run()
+    report = harness.report()
+    print(f"RSS growth {report['rss_growth_mb_per_hour'] or 0:.1f} MB/h, of which retained egram history "
+          f"{report['retained_growth_mb_per_hour'] or 0:.1f} MB/h; unexplained "
+          f"{report['unexplained_growth_mb_per_hour'] or 0:.1f} ± "
+          f"{report['unexplained_growth_interval_mb_per_hour'] or 0:.1f} MB/h")
+    if report["top_allocators"]:
+        print("Top allocation growth since warmup:")
+        for line in report["top_allocators"]:
+            print(f"  {line}")
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=4)
+    for warning in harness.warnings:
+        print(f"WARNING: {warning}")
+    for failure in harness.failures:
+        print(f"FAIL: {failure}")
+    print("PASS" if passed else "FAIL")
+    raise SystemExit(0 if passed else 1)
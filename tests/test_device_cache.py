@@ -0,0 +1,53 @@
+import struct
+
+from device_cache import FN_IDENTIFY, IDENTITY_FORMAT, SYNC, DeviceCache, DeviceIdentity, parse_identity
+
+
+def identify_reply(uid=bytes(range(1, 9)), version=(2, 1, 7), protocol=3):
+    body = struct.pack(IDENTITY_FORMAT, SYNC, FN_IDENTIFY, uid, *version, protocol)
+    return body + bytes([sum(body) & 0xFF])
+
+
+def test_parse_identity_checks_length_checksum_and_header():
+    identity = parse_identity(identify_reply())
+    assert identity.device_id == "0102030405060708"
+    assert identity.firmware == "2.1.7" and identity.protocol == 3
+
+    reply = identify_reply()
+    assert parse_identity(reply[:-1] + bytes([reply[-1] ^ 1])) is None
+    assert parse_identity(reply[:-1]) is None
+    assert parse_identity(None) is None
+    # a well-formed reply to some other command is not an identity
+    other = bytearray(reply[:-1])
+    other[1] = FN_IDENTIFY + 1
+    assert parse_identity(bytes(other) + bytes([sum(other) & 0xFF])) is None
+
+
+def test_device_cache_survives_a_restart(tmp_path):
+    path = str(tmp_path / "cache" / "devices.json")
+    identity = DeviceIdentity("0102030405060708", "2.1.7", 3)
+    echo = bytes(range(40))
+    DeviceCache(path).confirm(identity, echo)
+    DeviceCache(path).confirm(DeviceIdentity("usb:A1"), b"\x01\x02")
+
+    cache = DeviceCache(path)
+    state = cache.get(identity.device_id)
+    assert state.parameters == echo and state.firmware == "2.1.7"
+    assert 0 <= state.age < 60
+    assert cache.get("usb:A1").parameters == b"\x01\x02"
+    assert cache.get("unknown") is None
+    # no temporary files left behind
+    assert [p.name for p in (tmp_path / "cache").iterdir()] == ["devices.json"]
+
+    cache.forget("usb:A1")
+    assert DeviceCache(path).get("usb:A1") is None
+    assert DeviceCache(path).get(identity.device_id).parameters == echo
+
+
+def test_device_cache_starts_empty_from_a_corrupt_file(tmp_path):
+    path = tmp_path / "devices.json"
+    path.write_text("{not json")
+    cache = DeviceCache(str(path))
+    assert cache.get("anything") is None
+    cache.confirm(DeviceIdentity("usb:B2"), b"\x05")
+    assert DeviceCache(str(path)).get("usb:B2").parameters == b"\x05"
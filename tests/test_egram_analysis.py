@@ -0,0 +1,34 @@
+import os
+import queue
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from egram_analysis import EgramAnalyzer
+from pacing_sim import synthetic_egram
+
+
+@pytest.fixture
+def analyzer():
+    results = queue.Queue()
+    analyzer = EgramAnalyzer(results.put)
+    yield analyzer, results
+    analyzer.close()
+
+
+def test_analysis_recovers_from_a_dead_worker(analyzer):
+    analyzer, results = analyzer
+    t, atrial, ventricular = synthetic_egram(10, rate=60, seed=0)
+    analyzer.start()
+    # kill the worker process: the pool is broken from here on
+    with pytest.raises(BrokenProcessPool):
+        analyzer._pool.submit(os._exit, 1).result(timeout=10)
+
+    # this block is lost with the broken pool, but must not wedge the analyzer
+    analyzer.submit(t, atrial, ventricular)
+    assert not analyzer._busy
+
+    assert analyzer.submit(t, atrial, ventricular)
+    result = results.get(timeout=30)
+    assert result["samples"] == t.size
+    assert 55 < result["ventricular"]["rate"] < 65
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from egram_archive import LZMA, RAW, ZLIB, archive_capture, decode_chunk, encode_chunk, lzma
+from egram_store import EgramRecorder, open_capture, sample_dtype
+
+CODECS = [RAW, ZLIB] + ([LZMA] if lzma is not None else [])
+
+
+def make_chunk(n, seed=0):
+    rng = np.random.default_rng(seed)
+    chunk = np.empty(n, dtype=sample_dtype())
+    chunk["t"] = np.arange(n) / 1000.0
+    chunk["atrial"] = np.sin(chunk["t"] * 7.0) + rng.normal(0, 0.01, n)
+    chunk["ventricular"] = rng.normal(0, 1, n)
+    return chunk
+
+
+@pytest.mark.parametrize("codec", CODECS)
+@pytest.mark.parametrize("n", [1, 2, 1000, 4096])
+def test_chunk_round_trip_is_bit_exact(codec, n):
+    chunk = make_chunk(n)
+    decoded = decode_chunk(encode_chunk(chunk, codec), n, codec, chunk.dtype)
+    assert decoded.tobytes() == chunk.tobytes()
+
+
+@pytest.mark.parametrize("codec", CODECS)
+def test_round_trip_keeps_special_values(codec):
+    chunk = make_chunk(8)
+    chunk["atrial"] = [0.0, -0.0, np.inf, -np.inf, np.nan, 5e-324, np.finfo(float).max, -1.0]
+    decoded = decode_chunk(encode_chunk(chunk, codec), chunk.size, codec, chunk.dtype)
+    assert decoded.tobytes() == chunk.tobytes()
+
+
+def test_archive_capture_rerun_replaces(tmp_path):
+    path = str(tmp_path / "capture.egr")
+    chunk = make_chunk(30000)
+    recorder = EgramRecorder(path)
+    recorder.extend(chunk["t"], chunk["atrial"], chunk["ventricular"])
+    recorder.close()
+    for _ in range(2):
+        history = open_capture(archive_capture(path))
+        try:
+            assert history.samples == chunk.size
+            assert np.all(np.diff(history.index["t0"]) > 0)
+            assert history.samples_between(chunk["t"][0], chunk["t"][-1]).tobytes() == chunk.tobytes()
+        finally:
+            history.close()
@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+from egram_display import EgramDisplay
+from egram_frame import ACTIVITY_CHANNELS, MARKER_SLOTS, build_frame_request, decode_frames
+from egram_markers import AP, AS, VS, frame_events
+from soak_harness import SimulatedPacemaker
+
+FS = 1000.0
+
+
+def feed(display, seconds, start=0.0, block=32):
+    t = start + np.arange(int(seconds * FS)) / FS
+    atrial = np.sin(2 * np.pi * t)
+    ventricular = np.cos(2 * np.pi * t)
+    for i in range(0, t.size, block):
+        display.add_data_block(t[i:i + block], atrial[i:i + block], ventricular[i:i + block])
+    return t, atrial, ventricular
+
+
+def test_update_draws_the_window_and_keeps_its_artists():
+    display = EgramDisplay(window=5.0, history=30.0)
+    assert display.update() is None
+    artists = display.artists
+
+    t, _, _ = feed(display, 12.0)
+    display.add_activity_block(t[::100], np.full(t[::100].size, 20.0), np.full(t[::100].size, 90.0))
+    display.add_marker_block(np.array([9.0, 10.0, 11.5]), np.array([AS, VS, AP], dtype=np.uint8))
+    latest = display.update(gain=2.0, refractory=(0.3, 0.25))
+
+    assert latest == t[-1]
+    assert display.ax_atrial.get_xlim() == pytest.approx((latest - 5.0, latest))
+    xs, ys = display.atrial_line.get_data()
+    assert xs.min() >= latest - 5.0 and np.max(np.abs(ys)) == pytest.approx(2.0, rel=0.01)
+    assert len(display.activity_line.get_xdata()) > 0
+    atrial_ticks, atrial_spans = display.marker_artists["atrial"]
+    ventricular_ticks, _ = display.marker_artists["ventricular"]
+    assert len(atrial_ticks.get_segments()) == 2 and len(ventricular_ticks.get_segments()) == 1
+    # one refractory span per atrial sense/pace, ARP long
+    spans = [path.vertices for path in atrial_spans.get_paths()]
+    assert len(spans) == 2 and np.ptp(spans[0][:, 0]) == pytest.approx(0.3)
+
+    display.update(markers=False)
+    assert len(atrial_ticks.get_segments()) == 0
+    assert display.artists == artists
+
+
+def test_high_pass_is_continuous_across_blocks():
+    display = EgramDisplay()
+    _, atrial, _ = feed(display, 2.0, block=7)
+    filtered = display.pyramids["atrial_filtered"].samples.view
+    expected = np.concatenate((atrial[:1], np.diff(atrial) / 2.0))
+    assert np.allclose(filtered, expected)
+
+
+def test_history_is_bounded_and_recent_reads_raw_samples():
+    display = EgramDisplay(history=10.0)
+    feed(display, 5.0)
+    small = display.retained_bytes
+    feed(display, 60.0, start=5.0)
+    display.add_marker_block(np.arange(0.0, 65.0, 0.5), np.full(130, VS, dtype=np.uint8))
+    assert display.retained_bytes < 4 * small + display.marker_index.nbytes
+    assert display.marker_index.times.view[0] >= 65.0 - 0.5 - 2 * 10.0
+
+    t, atrial, ventricular = display.recent(2.0)
+    assert t[0] >= display.latest - 2.0 and t.size == pytest.approx(2 * FS, abs=1)
+    assert np.allclose(atrial, np.sin(2 * np.pi * t))
+
+    display.clear()
+    assert display.latest is None and display.update() is None
+    assert len(display.atrial_line.get_xdata()) == 0
+
+
+def test_simulated_pacemaker_sends_activity_and_markers():
+    device = SimulatedPacemaker(rate=FS)
+    try:
+        # no real-time pacing in a unit test
+        device._start = float("-inf")
+        request = build_frame_request(32, ACTIVITY_CHANNELS, MARKER_SLOTS)
+        frames = b"".join(device._reply(request) for _ in range(80))
+    finally:
+        device.close()
+    block = decode_frames(frames, 32, ACTIVITY_CHANNELS, MARKER_SLOTS)
+    assert block.valid.all() and block.has_activity
+    assert 5 <= block.activity.min() and block.sensor_rate.max() <= 105
+    times = np.arange(block.atrial.size) / FS
+    _, codes = frame_events(block, times, 32)
+    assert AS in codes and VS in codes
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from egram_frame import FrameTimebase
+
+SAMPLES = 32
+PERIOD_US = 1000
+
+
+def place_all(sequences, arrivals):
+    timebase = FrameTimebase()
+    return timebase, [timebase.place(seq & 0xFFFF, SAMPLES, PERIOD_US, arrival)
+                      for seq, arrival in zip(sequences, arrivals)]
+
+
+def assert_increasing(blocks):
+    times = np.concatenate(blocks)
+    assert np.all(np.diff(times) > 0), f"time steps back at sample {int(np.argmin(np.diff(times)))}"
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_place_is_monotonic_under_jitter(seed):
+    # frames arrive late by up to several milliseconds, including while the estimate settles
+    rng = np.random.default_rng(seed)
+    frames = np.arange(400)
+    arrivals = (frames + 1) * SAMPLES * PERIOD_US * 1e-6 + np.abs(rng.normal(0, 0.004, frames.size))
+    _, blocks = place_all(frames, arrivals)
+    assert_increasing(blocks)
+
+
+def test_place_is_monotonic_across_counter_restart():
+    rng = np.random.default_rng(7)
+    frames = np.arange(300)
+    sequences = np.where(frames < 150, frames, frames - 150)
+    arrivals = (frames + 1) * SAMPLES * PERIOD_US * 1e-6 + np.abs(rng.normal(0, 0.004, frames.size))
+    _, blocks = place_all(sequences, arrivals)
+    assert_increasing(blocks)
+
+
+def test_place_counts_lost_frames_and_wraps():
+    frames = np.concatenate((np.arange(0, 70000), np.arange(70005, 70100)))
+    arrivals = (frames + 1) * SAMPLES * PERIOD_US * 1e-6
+    timebase, blocks = place_all(frames, arrivals)
+    assert timebase.lost_frames == 5
+    assert_increasing(blocks)
+    # the gap is kept in the sample times rather than closed up
+    gap = blocks[70000][0] - blocks[69999][-1]
+    assert gap == pytest.approx(6 * SAMPLES * PERIOD_US * 1e-6 - (SAMPLES - 1) * PERIOD_US * 1e-6, rel=0.05)
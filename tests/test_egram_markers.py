@@ -0,0 +1,48 @@
+import numpy as np
+
+from egram_frame import MARKER_SLOTS, decode_frames, encode_frame
+from egram_markers import AP, AS, VP, VS, MarkerIndex, frame_events
+
+SAMPLES = 32
+
+
+def test_frame_events_round_trip_through_encode_and_decode():
+    zeros = np.zeros(SAMPLES)
+    frames = [encode_frame(0, zeros, zeros, markers=[(3, AS), (20, VS)]),
+              encode_frame(1, zeros, zeros, markers=[(5, AP)]),
+              # an index past the end of the frame is not a real event
+              encode_frame(2, zeros, zeros, markers=[(0, VP), (SAMPLES + 8, VS)])]
+    corrupt = bytearray(frames[1])
+    corrupt[-1] ^= 0xFF
+    buf = frames[0] + bytes(corrupt) + frames[2]
+
+    block = decode_frames(buf, SAMPLES, markers=MARKER_SLOTS)
+    assert list(block.valid) == [True, False, True]
+    # sample times of the two valid frames, as FrameTimebase would place them
+    times = 10.0 + np.arange(2 * SAMPLES) / 1000.0
+    event_times, codes = frame_events(block, times, SAMPLES)
+    assert list(codes) == [AS, VS, VP]
+    assert np.array_equal(event_times, times[[3, 20, SAMPLES]])
+
+    no_markers = decode_frames(encode_frame(0, zeros, zeros), SAMPLES)
+    assert frame_events(no_markers, times[:SAMPLES], SAMPLES)[0].size == 0
+
+
+def test_marker_index_ranges_counts_and_expiry():
+    index = MarkerIndex()
+    index.extend([1.0, 1.2], np.array([AS, VS], dtype=np.uint8))
+    index.extend([2.0, 2.2, 3.0], np.array([AP, VP, AS], dtype=np.uint8))
+    times, codes = index.between(1.2, 2.2)
+    assert list(times) == [1.2, 2.0, 2.2] and list(codes) == [VS, AP, VP]
+    assert index.counts() == {"AS": 2, "AP": 1, "VS": 1, "VP": 1, "AR": 0, "VR": 0}
+    assert index.counts(2.5)["AS"] == 1
+
+    retained = MarkerIndex(retain=10.0)
+    times = np.arange(0.0, 100.0, 0.5)
+    for start in range(0, times.size, 20):
+        retained.extend(times[start:start + 20], np.full(20, VS, dtype=np.uint8))
+    kept = retained.times.view
+    # everything inside the window is still there, and older events have been dropped
+    assert np.array_equal(kept[kept >= 99.5 - 10.0], times[times >= 89.5])
+    assert kept[0] >= 99.5 - 2 * 10.0
+    assert len(retained.between(0.0, 50.0)[0]) == 0
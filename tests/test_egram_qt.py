@@ -0,0 +1,44 @@
+import time
+
+import numpy as np
+import pytest
+
+import egram_qt
+from egram_qt import QtEgramViewer, _high_pass
+from pipeline import SampleBus
+
+FS = 1000.0
+
+
+def test_high_pass_matches_one_pass_over_the_whole_signal():
+    x = np.sin(np.linspace(0, 10, 100))
+    whole = _high_pass(x, None)
+    pieces = [_high_pass(x[:37], None), _high_pass(x[37:], x[36])]
+    assert np.allclose(np.concatenate(pieces), whole)
+    assert whole[0] == x[0]
+
+
+@pytest.mark.skipif(not egram_qt.available(), reason="pyqtgraph is not installed")
+def test_viewer_draws_from_the_bus_and_stops(monkeypatch):
+    # the viewer process inherits this: no display needed
+    monkeypatch.setenv("QT_QPA_PLATFORM", "offscreen")
+    bus = SampleBus()
+    viewer = QtEgramViewer(bus, window=2.0, capacity=8192)
+    try:
+        assert viewer.start()
+        viewer.set_display(2.0, True)
+        deadline = time.monotonic() + 30.0
+        start = 0
+        # keep feeding until the viewer has drawn for a full second and reported its frame rate
+        while viewer.fps == 0.0 and time.monotonic() < deadline:
+            t = (start + np.arange(32)) / FS
+            bus.publish((t, np.sin(2 * np.pi * t), np.cos(2 * np.pi * t)), 32)
+            start += 32
+            time.sleep(0.01)
+        assert viewer.running and viewer.fps > 0
+        assert viewer.ring.head > 0
+    finally:
+        viewer.stop()
+    assert not viewer.running and viewer.fps == 0.0
+    assert "qt viewer" not in bus.stats()
+    viewer.close()
@@ -0,0 +1,130 @@
+import os
+import socket
+import stat
+import time
+
+import numpy as np
+import pytest
+
+from egram_server import EgramServer, decode_block, read_blocks
+from pipeline import SampleBus
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    runtime = tmp_path / "run"
+    runtime.mkdir(mode=0o700)
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(runtime))
+    server = EgramServer(SampleBus(), "egram.sock", ws_port=0)
+    assert server.start()
+    yield server
+    server.stop()
+
+
+def handshake(server, path, origin=None):
+    sock = socket.create_connection((server.host, server.ws_port), timeout=2.0)
+    lines = [f"GET {path} HTTP/1.1", f"Host: {server.host}:{server.ws_port}",
+             "Upgrade: websocket", "Connection: Upgrade",
+             "Sec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==", "Sec-WebSocket-Version: 13"]
+    if origin is not None:
+        lines.append(f"Origin: {origin}")
+    sock.sendall(("\r\n".join(lines) + "\r\n\r\n").encode())
+    response = b""
+    while b"\r\n\r\n" not in response:
+        chunk = sock.recv(1024)
+        if not chunk:
+            break
+        response += chunk
+    return sock, response.split(b"\r\n", 1)[0]
+
+
+def wait_for_clients(server, count):
+    deadline = time.monotonic() + 2.0
+    while len(server.stats()["clients"]) < count and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(server.stats()["clients"]) == count
+
+
+@pytest.mark.parametrize("origin", [None, "http://localhost:8000", "http://127.0.0.1", "https://[::1]:9000"])
+def test_ws_accepts_token_from_local_origin(server, origin):
+    path = server.ws_url.split(str(server.ws_port), 1)[1]
+    sock, status = handshake(server, path, origin)
+    try:
+        assert status == b"HTTP/1.1 101 Switching Protocols"
+        wait_for_clients(server, 1)
+        server.bus.publish((np.arange(3.0), np.ones(3), np.zeros(3)), 3)
+        header = sock.recv(2)
+        assert header[0] == 0x82
+        size = header[1]
+        if size == 126:
+            size = int.from_bytes(sock.recv(2), "big")
+        payload = b""
+        while len(payload) < size:
+            payload += sock.recv(size - len(payload))
+        times, atrial, _ = decode_block(payload)
+        assert list(times) == [0.0, 1.0, 2.0] and list(atrial) == [1.0] * 3
+    finally:
+        sock.close()
+
+
+@pytest.mark.parametrize("path, origin", [
+    ("/", None),
+    ("/?token=wrong", None),
+    ("/?token={token}", "http://evil.example"),
+    ("/?token={token}", "null"),
+    ("/?token={token}", "http://localhost.evil.example"),
+])
+def test_ws_rejects_missing_token_or_foreign_origin(server, path, origin):
+    sock, status = handshake(server, path.format(token=server.token), origin)
+    try:
+        assert status == b"HTTP/1.1 403 Forbidden"
+        assert sock.recv(1024) == b""
+        assert server.stats()["clients"] == {}
+    finally:
+        sock.close()
+
+
+def test_unix_socket_is_private_and_serves_blocks(server):
+    assert os.path.dirname(server.unix_path) == os.environ["XDG_RUNTIME_DIR"]
+    assert stat.S_IMODE(os.stat(server.unix_path).st_mode) == 0o600
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.settimeout(2.0)
+    client.connect(server.unix_path)
+    try:
+        wait_for_clients(server, 1)
+        server.bus.publish((np.arange(2.0), np.zeros(2), np.ones(2)), 2)
+        times, _, ventricular = next(read_blocks(client))
+        assert list(times) == [0.0, 1.0] and list(ventricular) == [1.0, 1.0]
+    finally:
+        client.close()
+
+
+def test_start_leaves_foreign_files_alone(tmp_path):
+    path = tmp_path / "egram.sock"
+    path.write_text("not a socket")
+    server = EgramServer(SampleBus(), str(path))
+    assert not server.start()
+    assert path.read_text() == "not a socket"
+
+
+def test_stale_socket_is_replaced_and_removed_on_stop(tmp_path):
+    path = str(tmp_path / "egram.sock")
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(path)
+    stale.close()
+    server = EgramServer(SampleBus(), path)
+    assert server.start()
+    server.stop()
+    assert not os.path.exists(path)
+
+
+def test_live_socket_is_not_taken_over(tmp_path):
+    path = str(tmp_path / "egram.sock")
+    first = EgramServer(SampleBus(), path)
+    assert first.start()
+    try:
+        second = EgramServer(SampleBus(), path)
+        assert not second.start()
+        assert os.path.exists(path)
+    finally:
+        first.stop()
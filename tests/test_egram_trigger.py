@@ -0,0 +1,68 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from egram_store import sample_dtype
+from egram_trigger import AmplitudeTrigger, MissingBeatTrigger, PreTriggerBuffer, TriggerCondition, TriggeredRecorder
+
+FS = 100.0
+
+
+def stream(seconds, spikes=(), start=0.0):
+    t = start + np.arange(int(seconds * FS)) / FS
+    x = np.zeros(t.size)
+    for spike in spikes:
+        x[int(round((spike - start) * FS))] = 3.0
+    return t, x
+
+
+def blocks(t, x, size=25):
+    for i in range(0, t.size, size):
+        yield t[i:i + size], x[i:i + size]
+
+
+def test_trigger_condition_is_abstract():
+    with pytest.raises(TypeError):
+        TriggerCondition("atrial")
+
+
+def test_missing_beat_counts_from_the_first_sample_until_a_beat_is_seen():
+    trigger = MissingBeatTrigger("ventricular", timeout=1.5)
+    t, x = stream(6.0, spikes=[13.0], start=10.0)
+    fired = np.concatenate([trigger.check(tb, xb) for tb, xb in blocks(t, x)])
+    # once for the gap since the stream started, once after the beat at 13 s
+    assert fired == pytest.approx([11.5, 14.5])
+
+
+def test_pre_trigger_buffer_wraps_and_keeps_the_newest():
+    buffer = PreTriggerBuffer(8, channels=("atrial",))
+    t = np.arange(30, dtype=float)
+    buffer.extend(t[:5], -t[:5])
+    buffer.extend(t[5:10], -t[5:10])
+    assert list(buffer.since(0.0)["t"]) == list(range(2, 10))
+    assert list(buffer.since(6.0)["atrial"]) == [-6, -7, -8, -9]
+    # a block bigger than the buffer keeps only its tail
+    buffer.extend(t[10:30], -t[10:30])
+    assert list(buffer.since(0.0)["t"]) == list(range(22, 30))
+
+
+def test_snippets_open_extend_and_close(tmp_path):
+    # pre-trigger buffer of 100 samples, so it has wrapped by the first trigger
+    recorder = TriggeredRecorder([AmplitudeTrigger("ventricular", 2.0)], pre=1.0, post=1.0,
+                                 directory=str(tmp_path), max_rate=FS)
+    t, x = stream(20.0, spikes=[5.0, 5.5, 12.1])
+    for tb, xb in blocks(t, x):
+        recorder.process(tb, xb / 2, xb)
+    recorder.close()
+
+    assert recorder.triggers == 3 and len(recorder.snippets) == 2
+    # the second trigger lands inside the first snippet and pushes its end out
+    for path, (first, last), triggers in zip(recorder.snippets, [(5.0, 5.5), (12.1, 12.1)], [2, 1]):
+        data = np.fromfile(path, dtype=sample_dtype())
+        expected = t[(t >= t[int(round(first * FS))] - 1.0) & (t <= t[int(round(last * FS))] + 1.0)]
+        assert np.array_equal(data["t"], expected)
+        assert np.array_equal(data["ventricular"], x[np.isin(t, expected)])
+        with open(os.path.splitext(path)[0] + ".json") as f:
+            assert len(json.load(f)["triggers"]) == triggers
@@ -0,0 +1,37 @@
+import itertools
+
+import pytest
+
+from pacing_sim import simulate, sweep, synthetic_egram
+
+GRID = {"Lower Rate Limit": [50, 70, 90], "VRP": [150, 250, 350], "Ventricular Sensitivity": [1.0, 2.5, 4.0]}
+
+
+@pytest.mark.parametrize("mode, grid", [
+    ("VVI", GRID),
+    ("AAI", {"Lower Rate Limit": [45, 80], "ARP": [200, 300], "Atrial Sensitivity": [0.5, 1.5]}),
+    ("VOO", {"Lower Rate Limit": [60, 100]}),
+    ("VVIR", {"Lower Rate Limit": [60, 75], "Ventricular Sensitivity": [2.0, 3.5]}),
+])
+def test_sweep_matches_simulate(mode, grid):
+    t, atrial, ventricular = synthetic_egram(60.0, rate=65.0, seed=3)
+    rows = sweep(mode, {}, grid, t, atrial, ventricular)
+    names = list(grid)
+    combos = list(itertools.product(*grid.values()))
+    assert len(rows) == len(combos)
+    for row, combo in zip(rows, combos):
+        assert tuple(row[name] for name in names) == pytest.approx(combo)
+        expected = simulate(mode, dict(zip(names, combo)), t, atrial, ventricular).summary()
+        for field, value in expected.items():
+            assert row[field] == pytest.approx(value), (combo, field)
+
+
+def test_sweep_empty_grid():
+    t, atrial, ventricular = synthetic_egram(5.0, seed=1)
+    assert len(sweep("VVI", {}, {"Lower Rate Limit": []}, t, atrial, ventricular)) == 0
+
+
+def test_sweep_rejects_unknown_mode():
+    t, atrial, ventricular = synthetic_egram(5.0, seed=1)
+    with pytest.raises(ValueError):
+        sweep("DDD", {}, {"Lower Rate Limit": [60]}, t, atrial, ventricular)
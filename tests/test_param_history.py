@@ -0,0 +1,83 @@
+from types import SimpleNamespace
+
+import pytest
+
+import main_page
+from param_history import UPLOAD, ParameterHistory
+
+
+@pytest.fixture
+def history(tmp_path):
+    history = ParameterHistory(str(tmp_path / "history.db"))
+    yield history
+    history.close()
+
+
+def test_record_profile_only_appends_changed_modes(history):
+    profile = {"AOO": {"Lower Rate Limit": 60, "Atrial Amplitude": 3.5},
+               "VOO": {"Lower Rate Limit": 60, "Ventricular Amplitude": 3.5}}
+    assert history.record_profile("alice", profile, ts=1.0) == 2
+    assert history.record_profile("alice", profile, ts=2.0) == 0
+    # the form saves strings, the defaults are numbers: the same values either way
+    as_strings = {mode: {name: str(value) for name, value in params.items()} for mode, params in profile.items()}
+    assert history.record_profile("alice", as_strings, ts=3.0) == 0
+
+    profile["VOO"] = dict(profile["VOO"], **{"Lower Rate Limit": 70})
+    assert history.record_profile("alice", profile, ts=4.0) == 1
+    assert [v.ts for v in history.versions("alice", "VOO")] == [4.0, 1.0]
+    assert [v.ts for v in history.versions("alice", "AOO")] == [1.0]
+    # another user's identical profile is their own first version
+    assert history.record_profile("bob", profile, ts=5.0) == 2
+
+
+def test_as_of_returns_the_profile_at_each_moment(history):
+    history.record_profile("alice", {"AOO": {"Lower Rate Limit": 60}}, ts=10.0)
+    history.record_profile("alice", {"AOO": {"Lower Rate Limit": 70}, "VVI": {"VRP": 320}}, ts=20.0)
+    history.record_profile("alice", {"VVI": {"VRP": 250}}, ts=30.0)
+
+    assert history.as_of("alice", 5.0) == {}
+    assert history.as_of("alice", 10.0) == {"AOO": {"Lower Rate Limit": 60}}
+    assert history.as_of("alice", 25.0) == {"AOO": {"Lower Rate Limit": 70}, "VVI": {"VRP": 320}}
+    assert history.as_of("alice", 99.0) == {"AOO": {"Lower Rate Limit": 70}, "VVI": {"VRP": 250}}
+    assert history.as_of("bob", 99.0) == {}
+
+
+def test_uploads_filter_by_mode_board_and_time(history):
+    history.record_upload("alice", "board-1", "AOO", {"Lower Rate Limit": "60"}, ts=1.0)
+    history.record_upload("alice", "board-2", "VVI", {"VRP": "320"}, ts=2.0)
+    history.record_upload("bob", None, "AOO", {"Lower Rate Limit": "80"}, ts=3.0)
+    history.record_upload("bob", "board-1", "VVI", {"VRP": "250"}, ts=4.0)
+
+    assert [v.ts for v in history.uploads()] == [4.0, 3.0, 2.0, 1.0]
+    assert all(v.kind == UPLOAD for v in history.uploads())
+    assert [v.ts for v in history.uploads(mode="AOO")] == [3.0, 1.0]
+    assert [v.ts for v in history.uploads(device_id="board-1")] == [4.0, 1.0]
+    assert [v.ts for v in history.uploads(mode="VVI", device_id="board-1")] == [4.0]
+    assert [v.ts for v in history.uploads(since=2.0, until=3.0)] == [3.0, 2.0]
+    assert [v.ts for v in history.uploads(limit=1)] == [4.0]
+    assert history.uploads(mode="AOO")[0].params == {"Lower Rate Limit": 80}
+    # uploads are not profile saves
+    assert history.as_of("alice", 99.0) == {}
+
+
+class Entry:
+    def __init__(self, value):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+
+def test_save_profile_writes_the_whole_mode_once(monkeypatch):
+    saves = []
+    monkeypatch.setattr(main_page.user_db, "get_user_profile", lambda username: {"VOO": {"VRP": 320}})
+    monkeypatch.setattr(main_page.user_db, "save_user_profile",
+                        lambda username, profile: saves.append((username, profile)))
+    page = SimpleNamespace(
+        controller=SimpleNamespace(current_user="alice", current_mode="AOOR"),
+        widgets={"Lower Rate Limit": Entry("60"), "Activity Threshold": Entry("Med"), "Reaction Time": Entry("30")})
+
+    main_page.ParameterPage.save_profile(page)
+
+    assert saves == [("alice", {"VOO": {"VRP": 320},
+                                "AOOR": {"Lower Rate Limit": "60", "Activity Threshold": 3, "Reaction Time": "30"}})]
@@ -0,0 +1,101 @@
+import random
+
+import pytest
+
+import parameters
+from parameters import PacemakerParameters, echo_request
+
+# The packet as the dict-backed PacemakerParameters built it, byte by byte
+OLD_LAYOUT = ['SYNC', 'FnCode', 'Mode', 'Lower Rate Limit', 'Upper Rate Limit', 'MSR',
+              'Atrial Amplitude', 'Ventricular Amplitude', 'Atrial Pulse Width', 'Ventricular Pulse Width',
+              'Atrial Sensitivity', 'Ventricular Sensitivity', 'VRP', 'ARP',
+              'Activity Threshold', 'Reaction Time', 'Response Factor', 'Recovery Time']
+OLD_DEFAULTS = {'SYNC': 0x16, 'FnCode': 0x55, 'Mode': 1, 'Lower Rate Limit': 60, 'Upper Rate Limit': 120,
+                'MSR': 120, 'Atrial Amplitude': 25, 'Ventricular Amplitude': 25, 'Atrial Pulse Width': 10,
+                'Ventricular Pulse Width': 10, 'Atrial Sensitivity': 50, 'Ventricular Sensitivity': 50,
+                'VRP': 25, 'ARP': 25, 'Activity Threshold': 10, 'Reaction Time': 30, 'Response Factor': 8,
+                'Recovery Time': 5}
+# The echo reply in the order the old decoder read it, from the reply's first byte
+OLD_REPLY_ORDER = OLD_LAYOUT[2:]
+
+
+def random_values(seed):
+    rng = random.Random(seed)
+    return {name: rng.randint(*PacemakerParameters.VALIDATION_RULES[name]) for name in OLD_LAYOUT}
+
+
+def test_defaults_match_the_old_packet():
+    params = PacemakerParameters()
+    assert params.get_parameter_bytes() == bytes(OLD_DEFAULTS[name] for name in OLD_LAYOUT)
+    assert params.parameters == OLD_DEFAULTS
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_set_and_get_every_field(seed):
+    params = PacemakerParameters()
+    values = random_values(seed)
+    for name, value in values.items():
+        assert params.set_parameter(name, value)
+    for name, value in values.items():
+        assert params.get_parameter(name) == value
+    assert params.get_parameter_bytes() == bytes(values[name] for name in OLD_LAYOUT)
+
+
+def test_set_parameter_rejects_out_of_range_and_unknown_fields():
+    params = PacemakerParameters()
+    before = params.get_parameter_bytes()
+    assert not params.set_parameter('Lower Rate Limit', 200)
+    assert not params.set_parameter('VRP', 14)
+    assert not params.set_parameter('Pacing Voltage', 1)
+    assert params.get_parameter('Pacing Voltage') is None
+    assert params.get_parameter_bytes() == before
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_echo_reply_decodes_into_the_right_fields(seed):
+    values = random_values(seed)
+    reply = bytes(values[name] for name in OLD_REPLY_ORDER) + b"\xaa\xbb"
+    params = PacemakerParameters()
+    assert params.set_parameters_from_bytes(reply)
+    for name in OLD_REPLY_ORDER:
+        assert params.get_parameter(name) == values[name], name
+    # the header is ours, not the reply's, and the two trailing bytes are ignored
+    assert params.get_parameter_bytes()[:2] == bytes([0x16, 0x55])
+    assert params.get_parameter_bytes()[2:] == reply[:16]
+
+
+def test_short_reply_is_rejected():
+    params = PacemakerParameters()
+    assert not params.set_parameters_from_bytes(bytes(17))
+    assert params.get_parameter_bytes() == bytes(OLD_DEFAULTS[name] for name in OLD_LAYOUT)
+
+
+def test_snapshot_and_view():
+    params = PacemakerParameters()
+    snapshot = params.get_parameter_bytes()
+    view = params.view()
+    params.set_parameter('Lower Rate Limit', 90)
+    assert snapshot[3] == 60
+    assert view[3] == 90
+    with pytest.raises(TypeError):
+        view[3] = 1
+
+
+def test_mode_and_function_code():
+    params = PacemakerParameters()
+    for name, code in PacemakerParameters.MODE_MAPPING.items():
+        assert params.set_mode(name.lower())
+        assert params.get_parameter('Mode') == code
+        assert params.get_mode_name() == name
+    assert not params.set_mode('DDD')
+    params.set_echo_mode()
+    assert params.get_parameter('FnCode') == 0x22
+    params.set_parameter_mode()
+    assert params.get_parameter('FnCode') == 0x55
+
+
+def test_echo_request_leaves_the_shared_packet_alone():
+    packet = echo_request()
+    assert packet[1] == 0x22
+    assert packet[2:] == parameters.pacemaker_params.get_parameter_bytes()[2:]
+    assert parameters.pacemaker_params.get_parameter('FnCode') == 0x55
@@ -0,0 +1,36 @@
+import time
+
+from pipeline import DROP_NEVER, DROP_OLDEST, BoundedChannel, SampleBus
+
+
+def test_stalled_never_drop_subscriber_costs_publish_one_timeout():
+    bus = SampleBus()
+    display = bus.subscribe("display", 4, DROP_OLDEST)
+    recorder = bus.subscribe("recorder", 2, DROP_NEVER, put_timeout=0.2)
+    bus.publish("a", 10)
+    bus.publish("b", 10)
+
+    # nobody is draining the recorder: the first publish waits out the timeout...
+    start = time.monotonic()
+    bus.publish("c", 10)
+    assert 0.15 < time.monotonic() - start < 1.0
+    # ...and the rest drop straight away instead of each waiting again
+    start = time.monotonic()
+    for item in "defg":
+        bus.publish(item, 10)
+    assert time.monotonic() - start < 0.1
+
+    assert recorder.stats()["dropped_samples"] == 50
+    assert display.drain() == list("defg")
+
+    # once the recorder takes an item it gets the full wait again
+    assert recorder.get() == "a"
+    bus.publish("h", 10)
+    assert recorder.drain() == ["b", "h"]
+
+
+def test_explicit_timeout_overrides_the_channel_default():
+    channel = BoundedChannel("raw", 1, DROP_NEVER)
+    assert channel.put("a", timeout=0.05)
+    assert not channel.put("b", timeout=0.05)
+    assert channel.stats()["dropped"] == 1
@@ -0,0 +1,53 @@
+import numpy as np
+
+from parameters import ACTIVITY_MAP
+from profile_columns import ProfileTable
+
+AOO = {"Lower Rate Limit": 60, "Upper Rate Limit": 120, "Atrial Amplitude": 3.5, "Atrial Pulse Width": 1}
+
+USERS = [
+    {"username": "numbers", "parameters": {"AOO": AOO}},
+    # the form saves strings; the same profile must read back the same
+    {"username": "strings", "parameters": {"AOO": {name: str(value) for name, value in AOO.items()}}},
+    # URL below LRL, and one value that isn't a number at all
+    {"username": "inverted", "parameters": {"AOO": dict(AOO, **{"Upper Rate Limit": "50",
+                                                                  "Atrial Pulse Width": "wide"})}},
+    # out of range, and no AOO profile at all
+    {"username": "too_fast", "parameters": {"AOO": dict(AOO, **{"Lower Rate Limit": 200})}},
+    {"username": "new", "parameters": {}},
+    {"username": "active", "parameters": {"AOOR": {"Activity Threshold": "Med-High", "Reaction Time": "30"}}},
+]
+
+
+def test_mixed_string_and_number_values_normalize_to_the_same_column():
+    table = ProfileTable.from_users(USERS)
+    assert len(table) == len(USERS)
+    lrl = table.column("AOO", "Lower Rate Limit")
+    assert lrl.dtype == np.float64
+    assert lrl[0] == lrl[1] == 60.0 and lrl[3] == 200.0 and np.isnan(lrl[4])
+    assert np.isnan(table.column("AOO", "Atrial Pulse Width")[2])
+    assert table.column("AOOR", "Activity Threshold")[5] == ACTIVITY_MAP["Med-High"]
+    assert table.column("AOOR", "Reaction Time")[5] == 30.0
+    # a parameter the mode doesn't use is all missing
+    assert np.isnan(table.column("AOO", "ARP")).all()
+
+    assert table.value_counts("AOO", "Lower Rate Limit") == {60.0: 3, 200.0: 1}
+    assert table.describe("AOO", "Atrial Amplitude")["count"] == 4
+    assert table.users(table.column("AOO", "Upper Rate Limit") < 100) == ["inverted"]
+
+
+def test_violations_flags_missing_out_of_range_and_inverted_rates():
+    table = ProfileTable.from_users(USERS)
+    assert table.users(table.violations("AOO")) == ["inverted", "too_fast", "new", "active"]
+    assert table.users(~table.violations("AOO")) == ["numbers", "strings"]
+
+
+def test_save_and_load_round_trip(tmp_path):
+    table = ProfileTable.from_users(USERS)
+    path = str(tmp_path / "profiles.npz")
+    table.save(path)
+    loaded = ProfileTable.load(path)
+    assert list(loaded.usernames) == [u["username"] for u in USERS]
+    for mode, columns in table.columns.items():
+        for name, values in columns.items():
+            assert np.array_equal(loaded.column(mode, name), values, equal_nan=True)
@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+from rate_response import GRID_PARAMETERS, activity_level, evaluate_grid, rate_response, sensor_rate_from_profile
+
+FS = 50.0
+
+
+def activity_trace(seconds=900.0, seed=0):
+    """Rest, walk, run, rest: a 2 Hz accelerometer swing whose amplitude follows the exercise"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * FS)) / FS
+    amplitude = np.select([t < 120, t < 300, t < 480], [0.0, 12.0, 40.0], 0.0)
+    activity = 100.0 + amplitude * np.sin(2 * np.pi * 2.0 * t) + rng.normal(0.0, 0.5, t.size)
+    return t, activity
+
+
+def test_vectorized_sets_match_one_set_at_a_time():
+    t, activity = activity_trace()
+    _, level = activity_level(t, activity)
+    sets = [(60, 120, 3, 30, 8, 5), (50, 150, 1, 10, 16, 2), (70, 100, 5, 50, 1, 16)]
+    together = rate_response(level, *map(np.array, zip(*sets)))
+    for row, params in zip(together, sets):
+        assert np.array_equal(row, rate_response(level, *params))
+
+
+def test_grid_search_recovers_the_settings_behind_a_trace():
+    t, activity = activity_trace()
+    known = {"Lower Rate Limit": 60, "Activity Threshold": 2, "Reaction Time": 20, "Response Factor": 6,
+             "Recovery Time": 4, "Maximum Sensor Rate": 140}
+    target = sensor_rate_from_profile(known, t, activity)
+    grid = {"Activity Threshold": [1, 2, 3], "Reaction Time": [10, 20, 30], "Response Factor": [4, 6, 8],
+            "Recovery Time": [2, 4, 8], "Maximum Sensor Rate": [120, 140, 160]}
+
+    # small chunks so the grid goes through the worker pool
+    best = evaluate_grid(t, activity, target, lrl=60, grid=grid, top=3, workers=2, chunk=64)
+    assert [best[name][0] for name in GRID_PARAMETERS] == [known[name] for name in GRID_PARAMETERS]
+    assert best["rms_error"][0] == pytest.approx(0.0, abs=1e-9)
+    assert best["rms_error"][1] > 0.5
+    # the in-process path scores the same
+    assert np.array_equal(evaluate_grid(t, activity, target, lrl=60, grid=grid, top=3, workers=0), best)
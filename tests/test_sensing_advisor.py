@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from egram_store import EgramRecorder
+from pacing_sim import synthetic_egram
+from sensing_advisor import SensingSurvey, survey_captures
+
+
+def record(path, noise, seed=1):
+    # P waves peak at 1.5 mV, QRS at 3 mV
+    t, atrial, ventricular = synthetic_egram(120, rate=70, seed=seed)
+    beats = int(np.count_nonzero(np.diff((ventricular > 0.1).astype(int)) == 1))
+    rng = np.random.default_rng(seed)
+    recorder = EgramRecorder(str(path))
+    recorder.extend(t, atrial + rng.normal(0, noise, t.size), ventricular + rng.normal(0, noise, t.size))
+    recorder.close()
+    return beats
+
+
+def test_recommends_half_the_smallest_typical_event(tmp_path):
+    beats = record(tmp_path / "clean.egr", noise=0.05)
+    survey = SensingSurvey()
+    survey.add_capture(str(tmp_path / "clean.egr"))
+    assert survey.samples == 120_000 and survey.captures == 1
+
+    advice = survey.recommend()
+    for name, peak in (("atrial", 1.5), ("ventricular", 3.0)):
+        result = advice[name]
+        assert result["events"] == pytest.approx(beats, abs=4)
+        assert result["event_p5"] == pytest.approx(peak, abs=0.1)
+        assert result["noise_p999"] < 0.3
+        assert result["recommended"] == pytest.approx(np.floor(result["event_p5"] / 2 * 10) / 10)
+        assert result["warning"] == ""
+
+
+def test_warns_when_events_sit_near_the_noise_floor(tmp_path):
+    record(tmp_path / "noisy.egr", noise=0.4)
+    advice = survey_captures([str(tmp_path / "noisy.egr"), str(tmp_path / "missing.egr")]).recommend()
+    assert "noise floor" in advice["atrial"]["warning"]
+
+    empty = SensingSurvey().recommend()
+    assert empty["ventricular"]["recommended"] is None
+    assert empty["ventricular"]["warning"] == "no intrinsic events detected"
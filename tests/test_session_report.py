@@ -0,0 +1,55 @@
+import os
+
+from egram_store import EgramRecorder
+from pacing_sim import synthetic_egram
+from parameters import PacemakerParameters
+from session_report import REPLY_NAMES, render_report, session_job, verify_echo
+
+PACKET = PacemakerParameters().get_parameter_bytes()
+# the echo reply starts at the packet's Mode byte
+ECHO = PACKET[PacemakerParameters.REPLY_FIELDS]
+
+
+def echo_with(name, value):
+    echo = bytearray(ECHO)
+    echo[PacemakerParameters.FIELDS[name] - PacemakerParameters.REPLY_FIELDS.start] = value
+    return bytes(echo)
+
+
+def test_verify_echo_lines_up_each_field_with_its_echo_offset():
+    for name in REPLY_NAMES:
+        rows = {r["name"]: r for r in verify_echo(PACKET, echo_with(name, 99))}
+        assert [n for n, r in rows.items() if not r["match"]] == [name]
+
+    rows = {r["name"]: r for r in verify_echo(PACKET, echo_with("ARP", 30))}
+    assert rows["ARP"]["uploaded"] == "250 ms" and rows["ARP"]["echoed"] == "300 ms"
+    assert rows["Atrial Amplitude"]["echoed"] == "2.5 V"
+
+    # a short echo leaves the missing fields unverified rather than mismatched
+    rows = verify_echo(PACKET, ECHO[:4])
+    assert [r["match"] for r in rows[:4]] == [True] * 4
+    assert all(r["match"] is None and r["echoed"] == "—" for r in rows[4:])
+    assert all(r["match"] is None for r in verify_echo(PACKET, None))
+
+
+def test_render_report_writes_every_requested_format(tmp_path):
+    capture = str(tmp_path / "session.egr")
+    t, atrial, ventricular = synthetic_egram(20, rate=70, seed=0)
+    recorder = EgramRecorder(capture)
+    recorder.extend(t, atrial, ventricular)
+    recorder.close()
+
+    job = session_job(capture, PACKET, echo_with("VRP", 30), username="alice", mode="VVI",
+                      output=str(tmp_path / "reports"), formats=("html", "pdf"))
+    written = render_report(job)
+    assert sorted(written) == ["html", "pdf", "png"]
+    assert all(os.path.getsize(path) > 0 for path in written.values())
+    with open(written["html"], encoding="utf-8") as f:
+        page = f.read()
+    assert "1 field(s) differ" in page and "session.png" in page and "20.0 s" in page
+
+    # no capture and no echo: a parameters-only page
+    job = session_job(None, PACKET, name="params", output=str(tmp_path / "reports"), formats=("html",))
+    written = render_report(job)
+    with open(written["html"], encoding="utf-8") as f:
+        assert "No echo from the board" in f.read()
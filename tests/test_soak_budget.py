@@ -0,0 +1,49 @@
+import numpy as np
+
+from pipeline import SampleBus
+from soak_harness import MIN_GROWTH_SPAN, SoakHarness, growth_interval_per_hour, growth_per_hour
+
+
+def harness_with(rss_mb, interval=10.0):
+    harness = SoakHarness(duration=len(rss_mb) * interval, warmup=0.0, verbose=False)
+    harness.bus = SampleBus()
+    harness.samples = [{"t": i * interval, "rss": mb * 2**20, "retained": 2**20, "tracer": 0, "artists": 50,
+                        "frames": 1000, "lost_frames": 0, "queues": {}} for i, mb in enumerate(rss_mb)]
+    return harness
+
+
+def test_short_flat_run_with_one_step_is_not_failed():
+    # 150 s, flat apart from a single 1.5 MB allocator step: a line fit reads ~40 MB/h
+    rss = [120.0] * 8 + [121.5] * 7
+    harness = harness_with(rss)
+    assert growth_per_hour(np.arange(15) * 10.0, np.array(rss)) > 20
+    assert harness.check()
+    assert harness.warnings and "not enforced" in harness.warnings[0]
+
+
+def test_long_run_with_steady_growth_fails():
+    t = np.arange(0, MIN_GROWTH_SPAN + 300, 10.0)
+    rss = 120.0 + 50.0 * t / 3600.0
+    harness = harness_with(list(rss))
+    assert not harness.check()
+    assert any(f.startswith("RSS grows 50.0") for f in harness.failures)
+    assert harness.warnings == []
+
+
+def test_long_flat_run_passes():
+    rng = np.random.default_rng(0)
+    t = np.arange(0, MIN_GROWTH_SPAN + 300, 10.0)
+    harness = harness_with(list(120.0 + rng.normal(0, 0.2, t.size)))
+    assert harness.check(), harness.failures
+
+
+def test_growth_interval_shrinks_with_more_data():
+    rng = np.random.default_rng(1)
+    short = np.arange(0, 150, 10.0)
+    long = np.arange(0, 3600, 10.0)
+
+    def noise(t):
+        return 120 + rng.normal(0, 0.5, t.size)
+
+    assert growth_interval_per_hour(short, noise(short)) > 10 * growth_interval_per_hour(long, noise(long))
+    assert growth_interval_per_hour(short[:2], noise(short[:2])) == float("inf")
@@ -0,0 +1,87 @@
+from types import SimpleNamespace
+
+import pytest
+
+import main_page
+import param_lattice
+import parameters
+from param_history import ParameterHistory
+from parameters import MODE_PARAMETER_LAYOUT, PacemakerParameters
+
+# One legal form value per field, and the raw byte it should become
+FORM = {
+    "Lower Rate Limit": ("60", 60),
+    "Upper Rate Limit": ("120", 120),
+    "Maximum Sensor Rate": ("150", 150),
+    "Atrial Amplitude": ("3.5", 35),
+    "Ventricular Amplitude": ("4.2", 42),
+    "Atrial Pulse Width": ("1", 10),
+    "Ventricular Pulse Width": ("1", 10),
+    "Atrial Sensitivity": ("2.5", 25),
+    "Ventricular Sensitivity": ("3.3", 33),
+    "ARP": ("250", 25),
+    "VRP": ("320", 32),
+    "Activity Threshold": ("Med-High", 4),
+    "Reaction Time": ("30", 30),
+    "Response Factor": ("8", 8),
+    "Recovery Time": ("5", 5),
+}
+
+
+class Entry:
+    def __init__(self, value):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+
+@pytest.fixture
+def upload(tmp_path, monkeypatch):
+    sent = []
+    history = ParameterHistory(str(tmp_path / "history.db"))
+    monkeypatch.setattr(parameters, "pacemaker_params", PacemakerParameters())
+    monkeypatch.setattr(parameters.pacemaker_comm, "send_raw_parameters", lambda packet: sent.append(packet) or True)
+    monkeypatch.setattr(main_page, "default_history", lambda: history)
+
+    def run(mode, form):
+        parameters.pacemaker_params.set_mode(mode)
+        page = SimpleNamespace(
+            widgets={name: Entry(value) for name, value in form.items()},
+            controller=SimpleNamespace(current_mode=mode, current_user="alice", pacemaker_connected=True),
+            upload_msg=SimpleNamespace(config=lambda **kw: setattr(page, "message", kw)))
+        main_page.ParameterPage.upload_to_pacemaker(page)
+        return page
+
+    yield run, sent
+    history.close()
+
+
+@pytest.mark.parametrize("mode", list(MODE_PARAMETER_LAYOUT))
+def test_upload_sends_every_form_field(upload, mode):
+    run, sent = upload
+    form = {name: FORM[name][0] for name in MODE_PARAMETER_LAYOUT[mode]}
+    assert param_lattice.lattice(mode).validate(form)[0]
+
+    page = run(mode, form)
+
+    assert page.message["foreground"] == "green", page.message
+    assert len(sent) == 1
+    packet = PacemakerParameters(sent[0])
+    assert packet.get_mode_name() == mode
+    for name in MODE_PARAMETER_LAYOUT[mode]:
+        field = parameters.FORM_PACKET_FIELDS[name][0]
+        assert packet.get_parameter(field) == FORM[name][1], name
+    assert page.controller.uploaded_packet == sent[0]
+
+
+def test_upload_refuses_a_value_the_packet_cannot_hold(upload):
+    run, sent = upload
+    # legal on the form, but beyond the packet's 1.9 ms pulse width
+    form = {name: FORM[name][0] for name in MODE_PARAMETER_LAYOUT["AOO"]}
+    form["Atrial Pulse Width"] = "25"
+
+    page = run("AOO", form)
+
+    assert page.message["foreground"] == "red"
+    assert sent == []
@@ -1,6 +1,7 @@
 import json
 
 from parameters import PARAMETER_RULES, MODE_PARAMETER_LAYOUT
+from param_history import default_history
 
 def load_users():
     with open("data/users.json", "r") as f:
@@ -30,6 +31,7 @@ def register_user(username, password):
         "parameters": generate_default_profile(),
         })
     save_users(data)    
+    default_history().record_profile(username, data[-1]["parameters"])
     return True
 
 # check that username and password are the same
@@ -67,6 +69,8 @@ def save_user_profile(username, params):
         if user["username"] == username:
             user["parameters"] = params
             save_users(data)
+            # users.json only keeps the latest profile, the history keeps every version
+            default_history().record_profile(username, params)
             return True
     return False
 